@@ -0,0 +1,254 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from typing import AsyncGenerator, ClassVar
+
+import redis
+
+from ai_assistant.cache import TTLCache
+from ai_assistant.executor import AgentExecutor
+from ai_assistant.message_store import RedisMessageStore
+from ai_assistant.telemetry import METRICS, Counter, Gauge, Histogram
+
+LOGGER = logging.getLogger(__name__)
+
+ADMISSIONS = METRICS.register(Counter("ai_assistant_admissions_total", "Agent run admission decisions by outcome."))
+QUEUE_WAIT_SECONDS = METRICS.register(
+    Histogram("ai_assistant_admission_wait_seconds", "Time agent runs waited in the admission queue.")
+)
+
+# Refills the bucket by the elapsed time on the Redis clock, so workers with skewed clocks share one bucket.
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = math.min(burst, (tonumber(bucket[1]) or burst) + (now - (tonumber(bucket[2]) or now)) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Too many requests ({reason}), retry in {math.ceil(retry_after)}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Takes a token and returns 0, or returns the seconds until the next token without taking one.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class Ticket:
+    def __init__(self, key: str, tag: float = 0, seq: int = 0):
+        self.key = key
+        self.tag = tag
+        self.seq = seq
+        self.granted = False
+        self.done = False
+        self.submitted = time.monotonic()
+        self.changed = asyncio.Event()
+
+    def __lt__(self, other: "Ticket") -> bool:
+        return (self.tag, self.seq) < (other.tag, other.seq)
+
+
+class AdmissionController:
+    """
+    Admission of agent runs per client key: with a rate set, a token bucket limits the runs per key, at most
+    `max_concurrency` runs execute at once, and up to `max_queue` more wait in a weighted fair queue. Requests above the
+    rate or a full queue are rejected up front.
+
+    Waiting runs are ordered by virtual finish time, every run of a key adds 1 / weight to the finish time of its
+    previous run, so a key with many queued runs cannot push back the runs of other keys. With Redis, the token
+    buckets are shared by all workers; the concurrency limit and the queue are per worker, like the agent threads.
+    """
+
+    RATE: ClassVar[float] = float(os.environ.get("ADMISSION_RATE", 0))
+    BURST: ClassVar[float] = float(os.environ.get("ADMISSION_BURST", 20))
+    MAX_CONCURRENCY: ClassVar[int] = int(os.environ.get("ADMISSION_MAX_CONCURRENCY", AgentExecutor.MAX_WORKERS))
+    MAX_QUEUE: ClassVar[int] = int(os.environ.get("ADMISSION_MAX_QUEUE", 64))
+    QUEUE_TIMEOUT: ClassVar[float] = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 60))
+    WEIGHTS: ClassVar[str] = os.environ.get("ADMISSION_WEIGHTS", "")
+    REDIS_PREFIX: ClassVar[str] = "admission:"
+
+    def __init__(
+        self,
+        rate: float | None = None,
+        burst: float | None = None,
+        max_concurrency: int | None = None,
+        max_queue: int | None = None,
+        queue_timeout: float | None = None,
+        weights: dict[str, float] | None = None,
+        use_redis: bool | None = None,
+    ):
+        self.rate = self.RATE if rate is None else rate
+        self.burst = burst or self.BURST
+        self.max_concurrency = max_concurrency or self.MAX_CONCURRENCY
+        self.max_queue = self.MAX_QUEUE if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout or self.QUEUE_TIMEOUT
+        self.weights = weights if weights is not None else parse_weights(self.WEIGHTS)
+        # An idle bucket is full again after burst / rate seconds, so expired buckets are indistinguishable from new.
+        self.buckets = TTLCache(max_entries=100_000, ttl=self.burst / self.rate if self.rate > 0 else None)
+        if use_redis is None:
+            use_redis = "REDIS_HOST" in os.environ
+        self.redis = (
+            redis.Redis(host=RedisMessageStore.HOST, port=RedisMessageStore.PORT, password=RedisMessageStore.PASS)
+            if use_redis
+            else None
+        )
+        self.token_bucket = self.redis.register_script(TOKEN_BUCKET_SCRIPT) if self.redis is not None else None
+        self.active = 0
+        self.queue: list[Ticket] = []
+        self.finish: dict[str, float] = {}
+        self.virtual_time = 0.0
+        self.seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def submit(self, key: str) -> Ticket:
+        """
+        Admits a run of `key` immediately or queues it, raises AdmissionRejected if it is rate limited or the queue
+        is full.
+        """
+        if (retry_after := self._take(key)) > 0:
+            ADMISSIONS.inc(outcome="rate_limited")
+            raise AdmissionRejected("rate limited", retry_after)
+        with self._lock:
+            if not self.queue and self.active < self.max_concurrency:
+                ticket = Ticket(key)
+                ticket.granted = True
+                self.active += 1
+                ADMISSIONS.inc(outcome="admitted")
+                return ticket
+            if len(self.queue) >= self.max_queue:
+                ADMISSIONS.inc(outcome="queue_full")
+                raise AdmissionRejected("queue full", self.queue_timeout / 2)
+            tag = max(self.virtual_time, self.finish.get(key, 0.0)) + 1 / self.weights.get(key, 1.0)
+            self.finish[key] = tag
+            ticket = Ticket(key, tag, next(self.seq))
+            heapq.heappush(self.queue, ticket)
+            ADMISSIONS.inc(outcome="queued")
+            return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        with self._lock:
+            return 0 if ticket.granted else sum(other < ticket for other in self.queue) + 1
+
+    async def wait(self, ticket: Ticket) -> AsyncGenerator[int, None]:
+        """
+        Yields the queue position of the ticket whenever it changes until the run is admitted. Raises TimeoutError
+        and gives up the place in the queue if the queue timeout passes first.
+        """
+        deadline = ticket.submitted + self.queue_timeout
+        position = None
+        while not ticket.granted:
+            if (current := self.position(ticket)) != position:
+                position = current
+                yield position
+            ticket.changed.clear()
+            try:
+                await asyncio.wait_for(ticket.changed.wait(), deadline - time.monotonic())
+            except TimeoutError:
+                if ticket.granted:
+                    break
+                ADMISSIONS.inc(outcome="timeout")
+                self.release(ticket)
+                raise
+        if position is not None:
+            QUEUE_WAIT_SECONDS.observe(time.monotonic() - ticket.submitted)
+
+    def release(self, ticket: Ticket) -> None:
+        """
+        Ends a run or gives up its place in the queue, and admits the next queued runs. Releasing twice is a no-op.
+        """
+        with self._lock:
+            if ticket.done:
+                return
+            ticket.done = True
+            if ticket.granted:
+                self.active -= 1
+            else:
+                self.queue.remove(ticket)
+                heapq.heapify(self.queue)
+            admitted = []
+            while self.queue and self.active < self.max_concurrency:
+                admitted.append(next_ticket := heapq.heappop(self.queue))
+                next_ticket.granted = True
+                self.virtual_time = next_ticket.tag
+                self.active += 1
+            if not self.queue:
+                self.finish.clear()
+            waiting = list(self.queue)
+        for waiter in [*admitted, *waiting]:
+            waiter.changed.set()
+
+    def _take(self, key: str) -> float:
+        if self.rate <= 0:
+            return 0
+        if self.token_bucket is not None:
+            try:
+                return float(self.token_bucket(keys=[self.REDIS_PREFIX + key], args=[self.rate, self.burst]))
+            except redis.RedisError as e:
+                LOGGER.warning(f"Failed to take a token from Redis, using the local bucket: {e}")
+        with self._lock:
+            if (bucket := self.buckets.get(key, count=False)) is None:
+                bucket = TokenBucket(self.rate, self.burst)
+            retry_after = bucket.take()
+            self.buckets.set(key, bucket)
+            return retry_after
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            return {
+                "active": self.active,
+                "queued": len(self.queue),
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "tracked_keys": len(self.buckets),
+            }
+
+
+def parse_weights(value: str) -> dict[str, float]:
+    """
+    Parses `key=weight` pairs separated by commas.
+    """
+    weights = {}
+    for pair in filter(None, value.split(",")):
+        key, _, weight = pair.partition("=")
+        weights[key.strip()] = float(weight)
+    return weights
+
+
+ADMISSION = AdmissionController()
+METRICS.register(
+    Gauge("ai_assistant_admission_queue_length", "Agent runs waiting for admission.", lambda: len(ADMISSION.queue))
+)
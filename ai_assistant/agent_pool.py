@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, ClassVar, Iterator
+
+from smolagents import AgentMemory, CodeAgent, Model, Tool
+
+from ai_assistant.cache import TTLCache
+from ai_assistant.configs import MODEL_CONFIGS
+from ai_assistant.recordings import recorded_model
+from ai_assistant.telemetry import span, traced_model
+from ai_assistant.tools import ALL_TOOLS
+
+LOGGER = logging.getLogger(__name__)
+
+
+class PooledCodeAgent(CodeAgent):
+    """
+    CodeAgent that can be reset and reused for another run.
+
+    The system prompt is rendered from its Jinja template on every run, pooled agents share the rendered prompts per
+    distinct instructions instead.
+    """
+
+    def __init__(self, *args, prompt_cache: TTLCache | None = None, **kwargs):
+        # Set before the base constructor, which renders the system prompt.
+        self.prompt_cache = prompt_cache if prompt_cache is not None else TTLCache(max_entries=1)
+        super().__init__(*args, **kwargs)
+        self.base_model = self.model
+
+    def initialize_system_prompt(self) -> str:
+        if (system_prompt := self.prompt_cache.get(self.instructions)) is None:
+            system_prompt = super().initialize_system_prompt()
+            self.prompt_cache.set(self.instructions, system_prompt)
+        return system_prompt
+
+    def reset(self) -> None:
+        # A fresh memory rather than memory.reset(), the message store may still hold the old one.
+        self.instructions = None
+        self.model = self.base_model
+        self.memory = AgentMemory(self.system_prompt)
+        self.monitor.reset()
+        self.state = {}
+        self.python_executor.state = {"__name__": "__main__"}
+        self.python_executor.custom_tools = {}
+        self.task = None
+        self.step_number = 0
+        self.interrupt_switch = False
+
+
+class AgentPool:
+    """
+    Keeps one model client and a stack of idle agents per model key, so requests skip constructing either.
+
+    Model clients are shared by all runs of a key. Agents are used by one run at a time and reset when they are
+    returned; an agent whose run raised or was cancelled is discarded, as its interrupted run could still touch it.
+    """
+
+    SIZE: ClassVar[int] = int(os.environ.get("AGENT_POOL_SIZE", 16))
+    WARM: ClassVar[int] = int(os.environ.get("AGENT_POOL_WARM", 4))
+
+    def __init__(self, model_configs: dict[str, Callable[[], Model]], tools: list[Tool], size: int | None = None):
+        self.model_configs = model_configs
+        self.tools = tools
+        self.size = size or self.SIZE
+        self.prompt_cache = TTLCache(max_entries=256)
+        self.models: dict[str, Model] = {}
+        self.idle: dict[str, list[PooledCodeAgent]] = {}
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self._lock = threading.Lock()
+
+    def model(self, key: str) -> Model:
+        with self._lock:
+            if (model := self.models.get(key)) is None:
+                model = self.models[key] = traced_model(recorded_model(self.model_configs[key]()))
+        return model
+
+    def acquire(self, key: str) -> PooledCodeAgent:
+        with self._lock:
+            if idle := self.idle.get(key):
+                self.reused += 1
+                return idle.pop()
+        agent = PooledCodeAgent(model=self.model(key), tools=self.tools, prompt_cache=self.prompt_cache)
+        with self._lock:
+            self.created += 1
+        return agent
+
+    def release(self, key: str, agent: PooledCodeAgent) -> None:
+        agent.reset()
+        with self._lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.size:
+                idle.append(agent)
+                return
+        self.discard(agent)
+
+    def discard(self, agent: PooledCodeAgent) -> None:
+        with self._lock:
+            self.discarded += 1
+        agent.cleanup()
+
+    @contextmanager
+    def agent(self, key: str) -> Iterator[PooledCodeAgent]:
+        with span("agent_setup", model=key):
+            agent = self.acquire(key)
+        try:
+            yield agent
+        except BaseException:
+            self.discard(agent)
+            raise
+        self.release(key, agent)
+
+    def warm(self, key: str, count: int | None = None) -> None:
+        count = self.WARM if count is None else count
+        agents = [self.acquire(key) for _ in range(min(count, self.size))]
+        for agent in agents:
+            self.release(key, agent)
+        LOGGER.info(f"Warmed agent pool for {key} with {len(agents)} agents")
+
+    def clear(self) -> None:
+        with self._lock:
+            agents = [agent for idle in self.idle.values() for agent in idle]
+            self.idle.clear()
+            self.models.clear()
+        for agent in agents:
+            agent.cleanup()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "created": self.created,
+                "reused": self.reused,
+                "discarded": self.discarded,
+                "idle": {key: len(idle) for key, idle in self.idle.items()},
+                "system_prompts": self.prompt_cache.stats(),
+            }
+
+
+AGENT_POOL = AgentPool(MODEL_CONFIGS, ALL_TOOLS)
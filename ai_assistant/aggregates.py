@@ -0,0 +1,236 @@
+import bisect
+import fcntl
+import json
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Callable, ClassVar, Iterable, Iterator
+
+from ai_assistant.results import iter_json_array
+from ai_assistant.upstream import API_URL, UPSTREAM
+
+LOGGER = logging.getLogger(__name__)
+
+AGGREGATES_PATH = os.environ.get("AGGREGATES_PATH", str(Path(__file__).parent / "data" / "aggregates.json"))
+MAGIC = b"AIAGG\x00\x00\x01"
+_HEADER_START = 16
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def write_table(path: Path, key: str, columns: dict[str, str], rows: Iterable[dict[str, Any]]) -> int:
+    """
+    Writes rows as a columnar file: a JSON header with the column layout and the row range of every key, then each
+    column as a packed native array. Rows are ordered by key and day, so the rows of a key are contiguous and sorted
+    by day. The file is replaced atomically, readers keep their mapping of the previous one.
+    """
+    data = {name: array(typecode) for name, typecode in columns.items()}
+    for row in rows:
+        for name, values in data.items():
+            # ClickHouse quotes 64-bit integers in JSON.
+            values.append(int(row[name]))
+    keys, days = data[key], data["day"]
+    order = sorted(range(len(keys)), key=lambda i: (keys[i], days[i]))
+    data = {name: array(values.typecode, (values[i] for i in order)) for name, values in data.items()}
+
+    index: dict[int, list[int]] = {}
+    for i, value in enumerate(data[key]):
+        if value in index:
+            index[value][1] = i + 1
+        else:
+            index[value] = [i, i + 1]
+    layout, offset = [], 0
+    for name, values in data.items():
+        layout.append({"name": name, "type": values.typecode, "offset": offset, "length": len(values)})
+        offset = _align(offset + len(values) * values.itemsize)
+    header = json.dumps(
+        {"key": key, "rows": len(order), "refreshed_at": time.time(), "columns": layout, "index": index}
+    ).encode()
+
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + len(header).to_bytes(8, "little") + header)
+        f.write(b"\0" * (_align(_HEADER_START + len(header)) - _HEADER_START - len(header)))
+        for values in data.values():
+            f.write(values.tobytes())
+            f.write(b"\0" * (_align(len(values) * values.itemsize) - len(values) * values.itemsize))
+    os.replace(tmp_path, path)
+    return len(order)
+
+
+class AggregateTable:
+    """
+    Read-only, memory-mapped view of a file written by `write_table`. Columns are typed memoryviews into the mapping,
+    so loading does not copy the data and all workers of a host share the same pages.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mmap[:8] != MAGIC:
+            raise ValueError(f"{path} is not an aggregate file")
+        header_length = int.from_bytes(self.mmap[8:_HEADER_START], "little")
+        header = json.loads(self.mmap[_HEADER_START : _HEADER_START + header_length])
+        base = _align(_HEADER_START + header_length)
+        view = memoryview(self.mmap)
+        self.key = header["key"]
+        self.rows = header["rows"]
+        self.refreshed_at = header["refreshed_at"]
+        self.index = {int(key): tuple(bounds) for key, bounds in header["index"].items()}
+        self.columns = {}
+        for column in header["columns"]:
+            start = base + column["offset"]
+            end = start + column["length"] * array(column["type"]).itemsize
+            self.columns[column["name"]] = view[start:end].cast(column["type"])
+
+    def totals(
+        self,
+        keys: list[int] | None = None,
+        min_badge: int = 0,
+        max_badge: int = 255,
+        since_day: int = 0,
+        by: str | None = None,
+    ) -> dict[tuple[int, int | None], list[int]]:
+        """
+        Sums matches and wins per key, and per day or badge if `by` is given, over the rows of the given keys within
+        the badge range and from `since_day` on.
+        """
+        key_column, days, badges = self.columns[self.key], self.columns["day"], self.columns["badge"]
+        matches, wins = self.columns["matches"], self.columns["wins"]
+        ranges = [self.index[key] for key in keys if key in self.index] if keys is not None else self.index.values()
+        totals: dict[tuple[int, int | None], list[int]] = {}
+        for start, end in ranges:
+            # Rows of a key are sorted by day, the window starts at the first row on or after since_day.
+            start = bisect.bisect_left(days, since_day, start, end)
+            for key, day, badge, match_count, win_count in zip(
+                key_column[start:end], days[start:end], badges[start:end], matches[start:end], wins[start:end]
+            ):
+                if badge < min_badge or badge > max_badge:
+                    continue
+                group = (key, day if by == "day" else badge if by == "badge" else None)
+                if (total := totals.get(group)) is None:
+                    totals[group] = [match_count, win_count]
+                else:
+                    total[0] += match_count
+                    total[1] += win_count
+        return totals
+
+
+def fetch_rows(sql: str) -> Iterator[dict[str, Any]]:
+    with UPSTREAM.stream(f"{API_URL}/v1/sql", params={"query": sql}) as response:
+        yield from iter_json_array(response.iter_bytes())
+
+
+class AggregateStore:
+    """
+    Local copies of aggregates that agents would otherwise compute with scans of the largest tables, like hero and item
+    win rates per day and badge.
+
+    Each aggregate is pulled from the SQL API into a memory-mapped columnar file. Once a file is older than the refresh
+    interval, a background thread pulls it again; a lock file makes sure only one process of a host does, the others
+    pick up the new file when it is replaced.
+    """
+
+    DIRECTORY: ClassVar[str] = os.environ.get(
+        "AGGREGATES_DIR", os.path.join(tempfile.gettempdir(), "ai_assistant_aggregates")
+    )
+    REFRESH_INTERVAL: ClassVar[int] = int(os.environ.get("AGGREGATES_REFRESH_INTERVAL", 6 * 60 * 60))
+    ENABLED: ClassVar[bool] = os.environ.get("AGGREGATES", "true").lower() in ("true", "1", "yes")
+
+    def __init__(
+        self,
+        path: str = AGGREGATES_PATH,
+        directory: str | None = None,
+        loader: Callable[[str], Iterable[dict[str, Any]]] = fetch_rows,
+        refresh_interval: int | None = None,
+        enabled: bool | None = None,
+    ):
+        config = json.loads(Path(path).read_text())
+        self.days: int = config["days"]
+        self.definitions: dict[str, dict[str, Any]] = config["aggregates"]
+        self.directory = Path(directory or self.DIRECTORY)
+        self.loader = loader
+        self.refresh_interval = self.REFRESH_INTERVAL if refresh_interval is None else refresh_interval
+        self.enabled = self.ENABLED if enabled is None else enabled
+        self.tables: dict[str, tuple[int, AggregateTable]] = {}
+        self._lock = threading.Lock()
+        self._refresh_thread: threading.Thread | None = None
+
+    def table(self, name: str) -> AggregateTable | None:
+        table = self._load(name)
+        if self.enabled and (table is None or time.time() - table.refreshed_at > self.refresh_interval):
+            self._refresh_in_background()
+        return table
+
+    def warm(self) -> None:
+        """
+        Loads the aggregate files and starts pulling the stale or missing ones in the background.
+        """
+        for name in self.definitions:
+            self.table(name)
+
+    def refresh(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / "refresh.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                LOGGER.info("Aggregates are being refreshed by another process")
+                return
+            for name, definition in self.definitions.items():
+                # Another process may have refreshed it while this one waited for its turn.
+                if (table := self._load(name)) is not None and time.time() - table.refreshed_at < self.refresh_interval:
+                    continue
+                started = time.perf_counter()
+                rows = self.loader(definition["sql"].format(days=self.days))
+                count = write_table(self._path(name), definition["key"], definition["columns"], rows)
+                LOGGER.info(f"Refreshed {name} aggregates with {count} rows in {time.perf_counter() - started:.1f}s")
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {
+            name: {"rows": table.rows, "age_seconds": round(time.time() - table.refreshed_at)}
+            for name, (_, table) in self.tables.items()
+        }
+
+    def _path(self, name: str) -> Path:
+        return self.directory / f"{name}.agg"
+
+    def _load(self, name: str) -> AggregateTable | None:
+        try:
+            modified = self._path(name).stat().st_mtime_ns
+        except OSError:
+            return None
+        loaded = self.tables.get(name)
+        if loaded is not None and loaded[0] == modified:
+            return loaded[1]
+        try:
+            table = AggregateTable(self._path(name))
+        except (OSError, ValueError) as e:
+            LOGGER.warning(f"Failed to load {name} aggregates: {e}")
+            return loaded[1] if loaded else None
+        # The previous mapping is closed once no reader holds its columns anymore.
+        self.tables[name] = (modified, table)
+        return table
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self._background_refresh, daemon=True)
+            self._refresh_thread.start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            LOGGER.warning(f"Aggregate refresh failed, keeping previous aggregates: {e}")
+
+
+AGGREGATES = AggregateStore()
@@ -0,0 +1,162 @@
+import difflib
+import hashlib
+import json
+import logging
+import os
+from contextlib import closing
+from typing import ClassVar, Generator, NamedTuple
+
+import redis
+
+from ai_assistant.cache import TTLCache
+from ai_assistant.entities import normalize_name
+from ai_assistant.message_store import RedisMessageStore
+from ai_assistant.query_cache import QueryCache
+
+LOGGER = logging.getLogger(__name__)
+
+STOPWORDS = {
+    "a", "an", "and", "are", "can", "could", "do", "does", "give", "i", "is", "me", "of", "please", "show", "tell",
+    "the", "to", "what", "whats", "which", "you",
+}  # fmt: skip
+
+
+def prompt_tokens(prompt: str) -> tuple[str, ...]:
+    # Kept in order, "is haze better than seven" must not share an answer with "is seven better than haze".
+    return tuple(token for token in normalize_name(prompt).split() if token not in STOPWORDS)
+
+
+def without_memory_id(events: list[str]) -> tuple[list[str], str | None]:
+    """
+    Splits the memoryId event off a cached stream, the conversation belongs to the client of the recorded run.
+    """
+    memory_id = None
+    kept = []
+    for event in events:
+        if event.startswith("event: memoryId"):
+            memory_id = event.removeprefix("event: memoryId\ndata: ").strip()
+        else:
+            kept.append(event)
+    return kept, memory_id
+
+
+class CachedAnswer(NamedTuple):
+    model: str
+    tokens: tuple[str, ...]
+    events: list[str]
+
+
+class AnswerCache:
+    """
+    Cache of complete SSE event streams for prompts that do not continue a conversation.
+
+    Prompts are keyed on their words in order without filler words, so "What is the win rate of Seven?" and "win rate
+    of seven" share an entry. With a similarity below 1, a miss falls back to the local entry whose words are the most
+    alike in the same order. Cached streams are sent without the memoryId of the recorded run, the API forks the
+    recorded conversation for the new client instead.
+    Entries expire with the query cache TTL of volatile tables, as answers are only as fresh as the data behind them.
+    """
+
+    MAX_ENTRIES: ClassVar[int] = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 1024))
+    TTL: ClassVar[int] = int(os.environ.get("ANSWER_CACHE_TTL", QueryCache.DEFAULT_TTL))
+    SIMILARITY: ClassVar[float] = float(os.environ.get("ANSWER_CACHE_SIMILARITY", 1.0))
+    REDIS_PREFIX: ClassVar[str] = "answer-cache:v2:"
+
+    def __init__(
+        self,
+        max_entries: int | None = None,
+        ttl: int | None = None,
+        similarity: float | None = None,
+        use_redis: bool | None = None,
+    ):
+        self.ttl = self.TTL if ttl is None else ttl
+        self.similarity = self.SIMILARITY if similarity is None else similarity
+        self.local = TTLCache(max_entries=max_entries or self.MAX_ENTRIES, ttl=self.ttl)
+        if use_redis is None:
+            use_redis = "REDIS_HOST" in os.environ
+        self.redis = (
+            redis.Redis(host=RedisMessageStore.HOST, port=RedisMessageStore.PORT, password=RedisMessageStore.PASS)
+            if use_redis
+            else None
+        )
+        self.similar_hits = 0
+        self.redis_hits = 0
+        self.stored = 0
+
+    @staticmethod
+    def key(tokens: tuple[str, ...], model: str) -> str:
+        return hashlib.sha256(f"{model}\n{' '.join(tokens)}".encode()).hexdigest()
+
+    def get(self, prompt: str, model: str) -> list[str] | None:
+        tokens = prompt_tokens(prompt)
+        key = self.key(tokens, model)
+        if (answer := self.local.get(key)) is not None:
+            return answer.events
+        if (events := self._redis_get(key)) is not None:
+            self.redis_hits += 1
+            self.local.set(key, CachedAnswer(model, tokens, events))
+            return events
+        if self.similarity < 1 and (answer := self._most_similar(tokens, model)) is not None:
+            self.similar_hits += 1
+            return answer.events
+        return None
+
+    def record(self, prompt: str, model: str, events: Generator[str, None, None]) -> Generator[str, None, None]:
+        """
+        Passes the events through and stores them once the stream completed without an error. Timing events only
+        describe the recorded run and are left out.
+        """
+        recorded = []
+        with closing(events):
+            for event in events:
+                if not event.startswith("event: timing"):
+                    recorded.append(event)
+                yield event
+        if any(event.startswith("event: error") for event in recorded):
+            return
+        if not any(event.startswith("event: memoryId") for event in recorded):
+            return
+        tokens = prompt_tokens(prompt)
+        key = self.key(tokens, model)
+        self.local.set(key, CachedAnswer(model, tokens, recorded))
+        self._redis_set(key, recorded)
+        self.stored += 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            **self.local.stats(),
+            "similar_hits": self.similar_hits,
+            "redis_hits": self.redis_hits,
+            "stored": self.stored,
+        }
+
+    def _most_similar(self, tokens: tuple[str, ...], model: str) -> CachedAnswer | None:
+        best, best_similarity = None, self.similarity
+        for _, answer in self.local.items():
+            if answer.model != model or not (tokens or answer.tokens):
+                continue
+            similarity = difflib.SequenceMatcher(None, tokens, answer.tokens, autojunk=False).ratio()
+            if similarity >= best_similarity:
+                best, best_similarity = answer, similarity
+        return best
+
+    def _redis_get(self, key: str) -> list[str] | None:
+        if self.redis is None:
+            return None
+        try:
+            if (value := self.redis.get(self.REDIS_PREFIX + key)) is not None:
+                return json.loads(value)
+        except (redis.RedisError, ValueError) as e:
+            LOGGER.warning(f"Failed to read answer cache entry from Redis: {e}")
+        return None
+
+    def _redis_set(self, key: str, events: list[str]) -> None:
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(self.REDIS_PREFIX + key, json.dumps(events), ex=self.ttl)
+        except redis.RedisError as e:
+            LOGGER.warning(f"Failed to write answer cache entry to Redis: {e}")
+
+
+ANSWER_CACHE = AnswerCache()
@@ -1,44 +1,99 @@
 import asyncio
-import json
 import logging
+import math
 import os
-from typing import Dict, Any, Generator
+import threading
+import time
+from contextlib import aclosing, asynccontextmanager
+from contextvars import copy_context
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncGenerator, Generator, Literal
 from uuid import UUID
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from scalar_fastapi import get_scalar_api_reference
 from smolagents import (
-    CodeAgent,
     ActionStep,
-    PlanningStep,
-    ChatMessageStreamDelta,
-    FinalAnswerStep,
-    ActionOutput,
-    ApiModel,
+    AgentMemory,
+    TaskStep,
 )
 from starlette.responses import RedirectResponse
 from starlette.status import HTTP_308_PERMANENT_REDIRECT
 from starlette.middleware.cors import CORSMiddleware
 
 from ai_assistant.configs import (
+    CACHE_ANSWERS,
     MODEL_CONFIGS,
-    AGENT_INSTRUCTIONS,
-    get_model,
+    MODEL_ROUTING,
+    default_model_key,
+    get_agent_instructions,
     get_message_store,
     REPLAY,
+    SCHEMA_CATALOG,
+    SCHEMA_RETRIEVER,
     DO_RELEVANCY_CHECK,
+    SPECULATIVE_RELEVANCY_CHECK,
 )
-from ai_assistant.tools import ALL_TOOLS
-from ai_assistant.relevancy import RelevancyChecker
+from ai_assistant.admission import ADMISSION, AdmissionRejected, Ticket
+from ai_assistant.agent_pool import AGENT_POOL
+from ai_assistant.aggregates import AGGREGATES
+from ai_assistant.answer_cache import ANSWER_CACHE, without_memory_id
+from ai_assistant.entities import ENTITY_INDEX
+from ai_assistant.executor import AgentExecutor, speculate
+from ai_assistant.memory_compaction import MEMORY_COMPACTOR
+from ai_assistant.model_router import MODEL_ROUTER, RoutedModel
+from ai_assistant.query_cache import QUERY_CACHE
+from ai_assistant.recordings import RECORDINGS, Recording, recorded_events, substituted
+from ai_assistant.sql_planner import SQL_PLANNER
+from ai_assistant.streaming import OBSERVATIONS, EventEncoder, dumps
+from ai_assistant.telemetry import METRICS, Gauge, Histogram, span, tracing
+from ai_assistant.tool_cache import TOOL_CACHE
+from ai_assistant.relevancy import IRRELEVANT_PROMPT_MESSAGE, RelevancyChecker
 
 logging.basicConfig(level=logging.INFO)
 LOGGER = logging.getLogger(__name__)
 MESSAGE_STORE = get_message_store()
 RELEVANCY_CHECKER = RelevancyChecker()
+AGENT_EXECUTOR = AgentExecutor()
+SETUP_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="setup")
+READY = threading.Event()
+DRAINING = threading.Event()
+API_KEYS = frozenset(filter(None, os.environ.get("API_KEYS", "").split(",")))
+FIRST_EVENT_SECONDS = METRICS.register(
+    Histogram("ai_assistant_time_to_first_event_seconds", "Time from the request to the first streamed event.")
+)
+REQUEST_SECONDS = METRICS.register(
+    Histogram("ai_assistant_request_duration_seconds", "Time from the request to the end of the event stream.")
+)
+METRICS.register(Gauge("ai_assistant_active_agent_runs", "Agent runs in progress.", lambda: AGENT_EXECUTOR.active))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the model client and a few agents of the default model before the first request needs them.
+    try:
+        await asyncio.to_thread(AGENT_POOL.warm, default_model_key())
+    except ValueError as e:
+        LOGGER.warning(f"Not warming the agent pool: {e}")
+    # Loaded from the snapshots when the server prepared them before starting the workers.
+    await asyncio.to_thread(SCHEMA_CATALOG.warm)
+    await asyncio.to_thread(ENTITY_INDEX.warm)
+    AGGREGATES.warm()
+    READY.set()
+    yield
+    drain()
+
+
+def drain() -> None:
+    if not DRAINING.is_set():
+        LOGGER.info(f"Draining, {AGENT_EXECUTOR.active} agent runs in flight")
+    DRAINING.set()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     title="AI Assistant API",
     description="AI Assistant with Steam and ClickHouse integration for Discord Bot",
     version="1.0.0",
@@ -62,94 +117,290 @@ async def scalar_html():
     return get_scalar_api_reference(openapi_url=app.openapi_url, title=app.title, scalar_theme="default")
 
 
+@app.get("/stats", include_in_schema=False)
+def stats():
+    return {
+        "query_cache": QUERY_CACHE.stats(),
+        "tool_cache": TOOL_CACHE.stats(),
+        "aggregates": AGGREGATES.stats(),
+        "agent_pool": AGENT_POOL.stats(),
+        "admission": ADMISSION.stats(),
+        "answer_cache": ANSWER_CACHE.stats(),
+        "schema_retrieval": SCHEMA_RETRIEVER.stats(),
+        "sql_planner": SQL_PLANNER.stats(),
+        "model_router": MODEL_ROUTER.stats(),
+        "message_store": MESSAGE_STORE.stats(),
+        "memory_compaction": MEMORY_COMPACTOR.stats(),
+        "relevancy": RELEVANCY_CHECKER.stats(),
+        "observations": OBSERVATIONS.stats(),
+        "recordings": RECORDINGS.stats(),
+        "active_agent_runs": AGENT_EXECUTOR.active,
+    }
+
+
+@app.get("/health", include_in_schema=False)
+def health():
+    return {"status": "ok", "pid": os.getpid()}
+
+
+@app.get("/ready", include_in_schema=False)
+def ready():
+    if DRAINING.is_set() or not READY.is_set():
+        return JSONResponse(
+            {"status": "draining" if DRAINING.is_set() else "starting", "pid": os.getpid()}, status_code=503
+        )
+    return {"status": "ready", "pid": os.getpid(), "active_agent_runs": AGENT_EXECUTOR.active}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/observations/{observation_id}")
+def observation(observation_id: str):
+    if (observations := OBSERVATIONS.get(observation_id)) is None:
+        raise HTTPException(status_code=404, detail="Observation not found or expired")
+    return PlainTextResponse(observations)
+
+
+@app.get("/recordings", include_in_schema=False)
+def recordings(api_key: UUID | None = Query(None, description="API-Key")):
+    authorize(api_key)
+    return RECORDINGS.summaries()
+
+
 @app.get("/replay")
 async def replay(
-    prompt: str = Query(
-        ...,
+    request: Request,
+    prompt: str | None = Query(
+        None,
         min_length=1,
         max_length=10000,
-        description="The prompt to send to the AI agent",
+        description="Replay the latest recording of this prompt",
     ),
-    memory_id: UUID | None = Query(None),
-    model: str | None = Query(None, description="Model to use for inference"),
+    memory_id: UUID | None = Query(None, description="Conversation to continue when re-executing a recording"),
+    model: str | None = Query(None, description="Only replay recordings of this model"),
+    recording_id: str | None = Query(None, description="Recording to replay, see `/recordings`"),
+    mode: Literal["events", "execute"] = Query(
+        "events",
+        description="`events` streams the recorded events again, `execute` runs the agent again with the recorded "
+        "model and tool responses and ends with `event: replay`, the time spent apart from the simulated upstream calls",
+    ),
+    speed: float = Query(1.0, ge=0, description="Playback speed, 1 is the recorded pace, 0 skips all waiting"),
     sleep_time: str | None = Query(None, description="Sleep time in seconds between messages"),
+    api_key: UUID | None = Query(None, description="API-Key"),
+    timing: bool = Query(False, description="Send a latency breakdown as `event: timing` at the end of the stream"),
 ):
-    async def generator():
-        for line in REPLAY:
-            yield line
-            if sleep_time:
-                await asyncio.sleep(float(sleep_time))
+    recording = None
+    if recording_id is not None:
+        recording = RECORDINGS.load(recording_id)
+    elif prompt is not None:
+        recording = RECORDINGS.find(prompt.strip(), model)
+    if recording is None:
+        if recording_id is not None or mode == "execute":
+            raise HTTPException(status_code=404, detail="Recording not found")
+        return event_stream(replay_events(REPLAY, float(sleep_time) if sleep_time else None))
+
+    # Recordings hold the prompts and answers of users.
+    authorize(api_key)
+    if mode == "events":
+        events = (
+            replay_events([event for _, event in recording.events], float(sleep_time))
+            if sleep_time
+            else recorded_events(recording, speed)
+        )
+        return event_stream(events, headers={"X-Event-Encoding": recording.encoding})
+
+    if DRAINING.is_set():
+        raise HTTPException(status_code=503, detail="Shutting down", headers={"Retry-After": "1"})
+    ticket = admit(request, api_key)
+    try:
+        encoder = EventEncoder(recording.protocol, recording.encoding)
+        stream = StreamingResponseHandler.generate_stream(
+            recording.prompt, recording.model, memory_id, None, timing, encoder
+        )
+        stream = substituted(recording, stream, speed)
+        return event_stream(
+            observe_stream(admitted(ticket, AGENT_EXECUTOR.stream(stream)), "replay"),
+            headers={"X-Event-Encoding": recording.encoding},
+        )
+    except Exception:
+        ADMISSION.release(ticket)
+        raise
+
 
+async def replay_events(events: list[str], sleep_time: float | None = None) -> AsyncGenerator[str, None]:
+    for event in events:
+        yield event
+        if sleep_time:
+            await asyncio.sleep(sleep_time)
+
+
+async def replay_cached_answer(events: list[str]) -> AsyncGenerator[str, None]:
+    """
+    Replays a cached answer with a copy of the recorded conversation, so follow-ups of different clients do not continue
+    the same memory. Without the recorded memory, the answer is sent without a memoryId.
+    """
+    events, recorded_id = without_memory_id(events)
+    async for event in replay_events(events):
+        yield event
+    try:
+        memory = await asyncio.to_thread(load_memory, UUID(recorded_id)) if recorded_id else None
+        if memory is not None:
+            memory_id = await asyncio.to_thread(MESSAGE_STORE.save_memory, memory)
+            yield f"event: memoryId\ndata: {memory_id}\n\n"
+    except Exception as e:
+        LOGGER.warning(f"Failed to copy the memory of a cached answer: {e}")
+
+
+def event_stream(events: AsyncGenerator[str, None], headers: dict[str, str] | None = None) -> StreamingResponse:
     return StreamingResponse(
-        generator(),
+        events,
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "X-Accel-Buffering": "no",
+            **(headers or {}),
         },
     )
 
 
 class StreamingResponseHandler:
-    @staticmethod
-    def serialize_step(step) -> Dict[str, Any] | None:
-        if isinstance(step, ActionStep):
-            return {"type": "action", "data": [m.dict() for m in step.to_messages()]}
-        elif isinstance(step, ActionOutput):
-            return {
-                "type": "action_output",
-                "data": step.dict() if hasattr(step, "dict") else str(step),
-            }
-        elif isinstance(step, PlanningStep):
-            return {
-                "type": "planning",
-                "data": [m.dict() for m in step.to_messages()],
-            }
-        elif isinstance(step, ChatMessageStreamDelta):
-            return {"type": "delta", "data": {"content": step.content}}
-        elif isinstance(step, FinalAnswerStep):
-            return {"type": "final_answer", "data": step.output}
-        return None
-
     @classmethod
     def generate_stream(
         cls,
         prompt: str,
-        model: ApiModel,
+        model: str | None,
         memory_id: UUID | None = None,
+        relevant: Future[bool] | None = None,
+        timing: bool = False,
+        encoder: EventEncoder | None = None,
+    ) -> Generator[str, None]:
+        with tracing() as trace:
+            yield from cls._generate_stream(prompt, model, memory_id, relevant, encoder or EventEncoder())
+            if timing:
+                yield f"event: timing\ndata: {dumps(trace.to_dict())}\n\n"
+
+    @classmethod
+    def _generate_stream(
+        cls,
+        prompt: str,
+        model: str | None,
+        memory_id: UUID | None,
+        relevant: Future[bool] | None,
+        encoder: EventEncoder,
     ) -> Generator[str, None]:
         try:
-            agent = CodeAgent(
-                model=model,
-                tools=ALL_TOOLS,
-                instructions=AGENT_INSTRUCTIONS,
-            )
-            if memory_id:
-                if memory := MESSAGE_STORE.get_memory(memory_id):
-                    LOGGER.info(f"Loaded memory for ID {memory_id}: {memory}")
-                    agent.memory = memory
-                else:
-                    LOGGER.warning(f"No memory found for ID {memory_id}, starting fresh.")
-            with agent:
-                for step in agent.run(prompt, stream=True, reset=False):
-                    serialized = cls.serialize_step(step)
-                    if serialized:
-                        data = json.dumps(serialized)
-                        LOGGER.debug(f"Streaming data: {data}")
-                        yield f"event: agentStep\ndata: {data}\n\n"
+            # Load the memory while an agent is checked out, the relevancy check may still be running.
+            memory = SETUP_EXECUTOR.submit(copy_context().run, load_memory, memory_id) if memory_id else None
+            model_key = model or default_model_key()
+            with AGENT_POOL.agent(model_key) as agent:
+                parent_id = None
+                if memory is not None:
+                    if loaded_memory := memory.result():
+                        LOGGER.info(f"Loaded memory for ID {memory_id}: {loaded_memory}")
+                        agent.memory = loaded_memory
+                        parent_id = memory_id
                     else:
-                        LOGGER.debug(f"Skipping step: {type(step)}")
-            memory_id = MESSAGE_STORE.save_memory(agent.memory)
+                        LOGGER.warning(f"No memory found for ID {memory_id}, starting fresh.")
+                if relevant is not None:
+                    with span("relevancy_wait"):
+                        is_relevant = relevant.result()
+                    if not is_relevant:
+                        LOGGER.info("Prompt is not relevant, cancelling agent run")
+                        yield f"event: error\ndata: {IRRELEVANT_PROMPT_MESSAGE}\n\n"
+                        return
+                # Earlier tasks of the conversation take part in picking the schemas, follow-ups often omit the subject.
+                tasks = [step.task for step in agent.memory.steps if isinstance(step, TaskStep)]
+                with span("schema_retrieval"):
+                    agent.instructions = get_agent_instructions("\n".join([*tasks, prompt]))
+                if model is None and MODEL_ROUTING:
+                    with span("model_routing") as attributes:
+                        agent.model = MODEL_ROUTER.model("\n".join([*tasks, prompt]))
+                        attributes.update(difficulty=agent.model.route.difficulty, model=agent.model.current)
+                        model_key = agent.model.current
+                if parent_id is not None:
+                    with span("memory_compaction") as attributes:
+                        compacted = MEMORY_COMPACTOR.compact(agent.memory, model_key)
+                        if compacted is not agent.memory:
+                            # The compacted steps no longer extend the stored chain, save the memory as a new root.
+                            agent.memory, parent_id = compacted, None
+                            attributes["compacted"] = True
+                with span("agent_run") as attributes:
+                    for step in agent.run(prompt, stream=True, reset=False):
+                        if isinstance(step, ActionStep) and step.error and isinstance(agent.model, RoutedModel):
+                            agent.model.step_failed()
+                        if event := encoder.step(step):
+                            LOGGER.debug(f"Streaming event: {event}")
+                            yield event
+                        else:
+                            LOGGER.debug(f"Skipping step: {type(step)}")
+                    token_usage = agent.monitor.get_total_token_counts()
+                    attributes.update(input_tokens=token_usage.input_tokens, output_tokens=token_usage.output_tokens)
+                    if isinstance(agent.model, RoutedModel):
+                        attributes["model"] = agent.model.current
+                with span("save_memory"):
+                    memory_id = MESSAGE_STORE.save_memory(agent.memory, parent_id=parent_id)
             yield f"event: memoryId\ndata: {memory_id}\n\n"
         except Exception as e:
             LOGGER.error(f"Error during agent execution: {e}")
             yield f"event: error\ndata: {e}\n\n"
-        yield "FINISHED"
+
+
+def load_memory(memory_id: UUID) -> AgentMemory | None:
+    with span("memory_load"):
+        return MESSAGE_STORE.get_memory(memory_id)
+
+
+async def observe_stream(events: AsyncGenerator[str, None], source: str) -> AsyncGenerator[str, None]:
+    started = time.perf_counter()
+    first = True
+    async with aclosing(events):
+        async for event in events:
+            if first:
+                FIRST_EVENT_SECONDS.observe(time.perf_counter() - started, source=source)
+                first = False
+            yield event
+    REQUEST_SECONDS.observe(time.perf_counter() - started, source=source)
+
+
+def authorize(api_key: UUID | None) -> None:
+    if API_KEYS and str(api_key) not in API_KEYS:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+def admit(request: Request, api_key: UUID | None) -> Ticket:
+    client = str(api_key) if api_key else f"ip:{request.client.host if request.client else 'unknown'}"
+    try:
+        return ADMISSION.submit(client)
+    except AdmissionRejected as e:
+        LOGGER.warning(f"Rejecting request of {client}: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+
+async def admitted(ticket: Ticket, events: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    """
+    Sends the queue position while the run waits for admission, then the events of the run.
+    """
+    try:
+        try:
+            async for position in ADMISSION.wait(ticket):
+                yield f"event: queue\ndata: {dumps({'position': position})}\n\n"
+        except TimeoutError:
+            yield "event: error\ndata: The assistant is busy, please try again later\n\n"
+            return
+        async with aclosing(events):
+            async for event in events:
+                yield event
+    finally:
+        ADMISSION.release(ticket)
 
 
 @app.get("/invoke")
 async def invoke(
+    request: Request,
     prompt: str = Query(
         ...,
         min_length=1,
@@ -159,10 +410,21 @@ async def invoke(
     memory_id: UUID | None = Query(None),
     model: str | None = Query(None, description="Model to use for inference"),
     api_key: UUID | None = Query(None, description="API-Key"),
+    timing: bool = Query(False, description="Send a latency breakdown as `event: timing` at the end of the stream"),
+    protocol: Literal["full", "lean"] = Query(
+        "full",
+        description="`lean` sends every step once without repeated messages and with observations cut to a preview "
+        "that can be fetched from `/observations/{observation_id}`",
+    ),
+    encoding: Literal["json", "deflate"] = Query(
+        "json",
+        description="`deflate` sends step events base64 encoded and compressed with one raw deflate stream per response",
+    ),
 ):
-    if valid_api_keys := os.environ.get("API_KEYS"):
-        if valid_api_keys and str(api_key) not in valid_api_keys.split(","):
-            raise HTTPException(status_code=401, detail="Unauthorized")
+    authorize(api_key)
+
+    if DRAINING.is_set():
+        raise HTTPException(status_code=503, detail="Shutting down", headers={"Retry-After": "1"})
 
     if not prompt or not prompt.strip():
         raise HTTPException(status_code=400, detail="Prompt cannot be empty")
@@ -172,34 +434,47 @@ async def invoke(
             status_code=400,
             detail=f"Invalid model. Available models: {list(MODEL_CONFIGS.keys())}",
         )
-    model = MODEL_CONFIGS[model]() if model else get_model()
 
-    if DO_RELEVANCY_CHECK and not RELEVANCY_CHECKER.is_relevant(prompt.strip()):
-        raise HTTPException(
-            status_code=400,
-            detail="This assistant only handles Deadlock game-related questions. Please ask about Deadlock gameplay, heroes, items, statistics, or other game-related topics.",
+    # Recorded streams are only replayed in the format they were recorded in.
+    cache_key = model or "default"
+    if (protocol, encoding) != ("full", "json"):
+        cache_key = f"{cache_key}:{protocol}:{encoding}"
+    headers = {"X-Event-Encoding": encoding}
+
+    # Cached answers were relevant when they were recorded, so hits skip the relevancy check as well.
+    if CACHE_ANSWERS and memory_id is None and (events := ANSWER_CACHE.get(prompt, cache_key)) is not None:
+        LOGGER.info("Replaying cached answer")
+        return event_stream(
+            observe_stream(replay_cached_answer(events), "cache"), headers={**headers, "X-Answer-Cache": "hit"}
         )
 
+    # Admitted before the relevancy check, so rejected requests cost no LLM call.
+    ticket = admit(request, api_key)
+
     try:
-        stream = StreamingResponseHandler.generate_stream(prompt.strip(), model, memory_id)
-
-        async def async_stream():
-            while True:
-                item = await asyncio.to_thread(next, stream)
-                if item == "FINISHED":
-                    break
-                yield item
-
-        return StreamingResponse(
-            async_stream(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            },
-        )
+        relevant = None
+        if DO_RELEVANCY_CHECK:
+            if SPECULATIVE_RELEVANCY_CHECK:
+                # Failed checks accept the prompt in both modes, like the checker itself does.
+                relevant = speculate(RELEVANCY_CHECKER.is_relevant_async(prompt.strip()), fallback=True)
+            else:
+                with span("relevancy_check"):
+                    is_relevant = await RELEVANCY_CHECKER.is_relevant_async(prompt.strip())
+                if not is_relevant:
+                    raise HTTPException(status_code=400, detail=IRRELEVANT_PROMPT_MESSAGE)
+
+        encoder = EventEncoder(protocol, encoding)
+        stream = StreamingResponseHandler.generate_stream(prompt.strip(), model, memory_id, relevant, timing, encoder)
+        if RECORDINGS.sample():
+            stream = RECORDINGS.record(Recording(prompt.strip(), model, memory_id, protocol, encoding), stream)
+        if CACHE_ANSWERS and memory_id is None:
+            stream = ANSWER_CACHE.record(prompt, cache_key, stream)
+        return event_stream(observe_stream(admitted(ticket, AGENT_EXECUTOR.stream(stream)), "agent"), headers=headers)
+    except (HTTPException, asyncio.CancelledError):
+        ADMISSION.release(ticket)
+        raise
     except Exception as e:
+        ADMISSION.release(ticket)
         LOGGER.error(f"Failed to create agent or start streaming: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
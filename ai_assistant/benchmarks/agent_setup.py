@@ -0,0 +1,108 @@
+import argparse
+import itertools
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+from smolagents import CodeAgent
+from smolagents.memory import SystemPromptStep
+
+from ai_assistant.agent_pool import AgentPool
+from ai_assistant.benchmarks.mock_upstream import MockDeadlockApi
+from ai_assistant.benchmarks.scripted_model import ScriptedModel, load_trajectories
+from ai_assistant.configs import MODEL_CONFIGS, SCHEMA_CATALOG, get_agent_instructions
+from ai_assistant.entities import ENTITY_INDEX
+from ai_assistant.telemetry import traced_model
+from ai_assistant.tools import ALL_TOOLS
+from ai_assistant.upstream import UPSTREAM
+
+
+def fresh_setup(key: str, instructions: str) -> None:
+    """
+    Per-request setup without the pool: a new model client and agent, whose system prompt is rendered by the run.
+    """
+    agent = CodeAgent(model=traced_model(MODEL_CONFIGS[key]()), tools=ALL_TOOLS)
+    agent.instructions = instructions
+    agent.memory.system_prompt = SystemPromptStep(system_prompt=agent.system_prompt)
+    agent.cleanup()
+
+
+def pooled_setup(pool: AgentPool, key: str, instructions: str) -> None:
+    with pool.agent(key) as agent:
+        agent.instructions = instructions
+        agent.memory.system_prompt = SystemPromptStep(system_prompt=agent.system_prompt)
+
+
+def measure(setup: Callable[[str], None], instructions: list[str], iterations: int) -> dict[str, float]:
+    for text in instructions:
+        setup(text)  # warm up lazy imports, the pool and the prompt cache
+
+    durations = []
+    for text in itertools.islice(itertools.cycle(instructions), iterations):
+        started = time.perf_counter()
+        setup(text)
+        durations.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        peaks = []
+        for text in itertools.islice(itertools.cycle(instructions), min(iterations, 20)):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            setup(text)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "mean_ms": statistics.fmean(durations) * 1000,
+        "p50_ms": statistics.median(durations) * 1000,
+        "max_ms": max(durations) * 1000,
+        "peak_alloc_kb": statistics.fmean(peaks) / 1024,
+    }
+
+
+def run_benchmark(key: str = "gemini-flash", iterations: int = 200) -> dict[str, dict[str, float]]:
+    """
+    Compares the setup cost of one request with a freshly constructed agent against one checked out of the pool.
+
+    Instructions cycle through those of the recorded prompts, as every request gets the schemas relevant to it.
+    """
+    MODEL_CONFIGS.setdefault("scripted", ScriptedModel)
+    # Snapshots of the mock data must not replace those of the real service.
+    SCHEMA_CATALOG.snapshot_path = Path(tempfile.mkdtemp()) / "schema.json"
+    ENTITY_INDEX.snapshot_path = None
+    http_client = MockDeadlockApi().install()
+    try:
+        instructions = [get_agent_instructions(prompt) for prompt in load_trajectories()]
+    finally:
+        UPSTREAM.client.close()
+        UPSTREAM.client = http_client
+
+    pool = AgentPool(MODEL_CONFIGS, ALL_TOOLS)
+    try:
+        return {
+            "fresh": measure(lambda text: fresh_setup(key, text), instructions, iterations),
+            "pooled": measure(lambda text: pooled_setup(pool, key, text), instructions, iterations),
+        }
+    finally:
+        pool.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request agent setup time with and without the agent pool")
+    parser.add_argument("--model", default="gemini-flash", help="Model key whose client is constructed")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    report = run_benchmark(args.model, args.iterations)
+    for name, values in report.items():
+        print(f"{name:<8} " + "  ".join(f"{metric} {value:.3f}" for metric, value in values.items()))
+    print(f"speedup  {report['fresh']['mean_ms'] / report['pooled']['mean_ms']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import json
+import threading
+import time
+
+import httpx
+
+from ai_assistant.upstream import UPSTREAM, UpstreamClient
+
+HEROES = ["Abrams", "Bebop", "Dynamo", "Grey Talon", "Haze", "Infernus", "Ivy", "Kelvin", "Lady Geist", "Lash"]
+ITEMS = ["Extended Magazine", "Headshot Booster", "Monster Rounds", "Rapid Rounds", "Restorative Shot", "Mystic Burst"]
+RANKS = ["Obscurus", "Initiate", "Seeker", "Alchemist", "Arcanist", "Ritualist", "Emissary", "Archon", "Oracle"]
+RANKS += ["Phantom", "Ascendant", "Eternus"]
+SCHEMAS = {
+    "heroes": {"id": "UInt32", "name": "String"},
+    "items": {"id": "UInt32", "name": "String", "cost": "UInt32", "tier": "UInt8"},
+    "match_info": {"match_id": "UInt64", "start_time": "DateTime", "duration_s": "UInt32", "winning_team": "UInt8"},
+    "match_player": {"match_id": "UInt64", "account_id": "UInt32", "hero_id": "UInt32", "kills": "UInt32"},
+}
+
+
+class MockDeadlockApi:
+    """
+    In-process stand-in for the Deadlock API and assets API with a fixed latency per request, so the service can be
+    benchmarked without network access. Responses are deterministic and only as realistic as the benchmark needs.
+    """
+
+    def __init__(self, latency: float = 0.0, sql_rows: int = 50):
+        self.latency = latency
+        self.sql_rows = sql_rows
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        path = request.url.path
+        if path == "/v1/sql":
+            return self._json(self._sql(request.url.params.get("query", "")))
+        if path == "/v1/sql/tables":
+            return self._json(list(SCHEMAS))
+        if path.startswith("/v1/sql/tables/") and path.endswith("/schema"):
+            table = path.split("/")[4]
+            if table not in SCHEMAS:
+                return httpx.Response(404, text=f"Unknown table {table}")
+            return self._json([{"name": name, "type": type_} for name, type_ in SCHEMAS[table].items()])
+        if path == "/v1/players/steam-search":
+            return self._json([{"account_id": 127331261, "personaname": request.url.params.get("search_query")}])
+        if path == "/v2/ranks":
+            return self._json([{"tier": tier, "name": name} for tier, name in enumerate(RANKS)])
+        return httpx.Response(404, text=f"No mock for {path}")
+
+    def _sql(self, query: str) -> list[dict]:
+        lowered = query.lower()
+        if "from heroes" in lowered:
+            return [{"id": i + 1, "name": name} for i, name in enumerate(HEROES)]
+        if "from items" in lowered:
+            return [{"id": 1000 + i, "name": name} for i, name in enumerate(ITEMS)]
+        if "count(" in lowered:
+            return [{"count": 95}]
+        return [{"hero_id": i % len(HEROES) + 1, "matches": 1000 + i, "win_rate": 0.5} for i in range(self.sql_rows)]
+
+    @staticmethod
+    def _json(value) -> httpx.Response:
+        return httpx.Response(200, content=json.dumps(value).encode(), headers={"content-type": "application/json"})
+
+    def install(self, client: UpstreamClient = UPSTREAM) -> httpx.Client:
+        """
+        Routes all requests of the upstream client to the mock, returns the previous HTTP client to restore it later.
+        """
+        previous, client.client = client.client, httpx.Client(transport=httpx.MockTransport(self.handler))
+        return previous
@@ -0,0 +1,87 @@
+import os
+import time
+
+from ai_assistant.relevancy import LexicalRelevancyModel, RelevancyChecker
+
+LABELED_PROMPTS = [
+    ("Tell me about the Deadlock game mechanics.", True),
+    ("What are the best heroes in Deadlock?", True),
+    ("What is the best item build for a Deadlock hero?", True),
+    ("What is the win rate of Seven this patch?", True),
+    ("Best items for Haze?", True),
+    ("How many matches did johnpyp play above Ascendant?", True),
+    ("Which hero has the highest pick rate in Eternus lobbies?", True),
+    ("How do souls work when killing troopers?", True),
+    ("When should I take the mid boss?", True),
+    ("Is Extended Magazine worth buying early on Wraith?", True),
+    ("How do ziplines work?", True),
+    ("What does the urn do?", True),
+    ("Who is the strongest laner right now?", True),
+    ("Compare Lady Geist and Grey Talon win rates", True),
+    ("What rank is badge 104?", True),
+    ("Show me my last 10 matches", True),
+    ("How many players are in Obscurus?", True),
+    ("Which items counter Bebop?", True),
+    ("What's the average match duration?", True),
+    ("Give me the top 5 players by kills this week", True),
+    ("How do I play Dota 2?", False),
+    ("Can you help me with Python coding?", False),
+    ("How do I fix a deadlock between two threads in Java?", False),
+    ("What's the weather like in New York?", False),
+    ("Best agents in Valorant?", False),
+    ("Give me a recipe for lasagna", False),
+    ("Who won the League of Legends world championship?", False),
+    ("Write a javascript function that reverses a string", False),
+    ("How do database transactions avoid deadlock?", False),
+    ("Best Overwatch heroes for beginners?", False),
+    ("What is the capital of France?", False),
+    ("Tell me a joke", False),
+    ("How do I build a Minecraft house?", False),
+    ("Explain quantum computing", False),
+    ("Who is the best CS2 player?", False),
+]
+
+
+def report(name: str, verdicts: list[tuple[bool, bool | None]], seconds: float) -> None:
+    if not verdicts:
+        return
+    decided = [(label, verdict) for label, verdict in verdicts if verdict is not None]
+    true_positives = sum(1 for label, verdict in decided if label and verdict)
+    predicted_positives = sum(1 for _, verdict in decided if verdict)
+    positives = sum(1 for label, _ in decided if label)
+    precision = true_positives / predicted_positives if predicted_positives else float("nan")
+    recall = true_positives / positives if positives else float("nan")
+    accuracy = sum(1 for label, verdict in decided if label == verdict) / len(decided) if decided else float("nan")
+    print(
+        f"{name:<8} decided {len(decided):>3}/{len(verdicts)}  precision {precision:.2f}  recall {recall:.2f}  "
+        f"accuracy {accuracy:.2f}  latency {seconds / len(verdicts) * 1000:.3f} ms/prompt"
+    )
+
+
+def main():
+    lexical_model = LexicalRelevancyModel()
+    start = time.perf_counter()
+    local = [(label, lexical_model.verdict(prompt)) for prompt, label in LABELED_PROMPTS]
+    report("local", local, time.perf_counter() - start)
+
+    if not os.environ.get("GEMINI_API_KEY"):
+        print("GEMINI_API_KEY not set, skipping the LLM and cache tiers")
+        return
+
+    checker = RelevancyChecker()
+    undecided = [(prompt, label) for (prompt, label), (_, verdict) in zip(LABELED_PROMPTS, local) if verdict is None]
+    start = time.perf_counter()
+    llm = [(label, checker.is_relevant(prompt)) for prompt, label in undecided]
+    report("llm", llm, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    cached = [(label, checker.fast_verdict(prompt)) for prompt, label in undecided]
+    report("cache", cached, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    combined = [(label, checker.is_relevant(prompt)) for prompt, label in LABELED_PROMPTS]
+    report("combined", combined, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
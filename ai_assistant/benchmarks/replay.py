@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import httpx
+
+from ai_assistant.benchmarks.scripted_model import load_trajectories
+from ai_assistant.benchmarks.service import local_service, percentile
+
+
+class ReplayResult(NamedTuple):
+    time_to_first_event: float
+    duration: float
+    error: bool
+    summary: dict[str, Any] | None
+
+
+async def replay_once(client: httpx.AsyncClient, url: str, params: dict[str, Any]) -> ReplayResult:
+    started = time.perf_counter()
+    first_event, error, summary, event = None, False, None, None
+    async with client.stream("GET", url, params=params) as response:
+        error = response.status_code != 200
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                first_event = first_event or time.perf_counter() - started
+                event = line.removeprefix("event:").strip()
+                error = error or event == "error"
+            elif line.startswith("data:") and event == "replay":
+                summary = json.loads(line.removeprefix("data:"))
+    duration = time.perf_counter() - started
+    return ReplayResult(first_event if first_event is not None else duration, duration, error, summary)
+
+
+async def drive(
+    url: str,
+    recordings: list[dict[str, Any]],
+    params: dict[str, Any],
+    clients: int | None = None,
+    requests: int | None = None,
+) -> list[ReplayResult]:
+    """
+    Replays every recording once, starting each at its recorded offset from the first one divided by the speed. With
+    `clients`, that many clients replay `requests` recordings back to back instead.
+    """
+    results = []
+    limits = httpx.Limits(max_connections=clients or len(recordings))
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        if clients:
+            queue = itertools.islice(itertools.cycle(recordings), requests or len(recordings))
+
+            async def worker():
+                for recording in queue:
+                    results.append(await replay_once(client, url, {**params, "recording_id": recording["id"]}))
+
+            await asyncio.gather(*(worker() for _ in range(clients)))
+            return results
+
+        first = recordings[0]["started_at"]
+        speed = params["speed"]
+
+        async def arrive(recording: dict[str, Any]):
+            if speed > 0:
+                await asyncio.sleep((recording["started_at"] - first) / speed)
+            results.append(await replay_once(client, url, {**params, "recording_id": recording["id"]}))
+
+        await asyncio.gather(*(arrive(recording) for recording in recordings))
+    return results
+
+
+def record_trajectories(base_url: str) -> None:
+    """
+    Records a session of every scripted trajectory on the local service.
+    """
+    with httpx.Client(timeout=120) as client:
+        for prompt in load_trajectories():
+            with client.stream("GET", f"{base_url}/invoke", params={"prompt": prompt, "model": "scripted"}) as response:
+                for _ in response.iter_lines():
+                    pass
+
+
+def report(results: list[ReplayResult], wall: float) -> dict[str, float]:
+    ttfe = [r.time_to_first_event for r in results]
+    durations = [r.duration for r in results]
+    summaries = [r.summary for r in results if r.summary is not None]
+    overheads = [s["overhead"] for s in summaries]
+    return {
+        "requests": len(results),
+        "errors": sum(r.error for r in results),
+        "ttfe_p50": percentile(ttfe, 50),
+        "ttfe_p95": percentile(ttfe, 95),
+        "duration_p50": percentile(durations, 50),
+        "duration_p95": percentile(durations, 95),
+        "overhead_p50": percentile(overheads, 50),
+        "overhead_p95": percentile(overheads, 95),
+        "upstream_mean": statistics.fmean(s["upstream"] for s in summaries) if summaries else float("nan"),
+        "diverged": sum(1 for s in summaries if s["model_mismatches"] or s["tool_mismatches"] or s["missing"]),
+        "requests_per_second": len(results) / wall,
+    }
+
+
+def run_benchmark(
+    url: str | None = None,
+    mode: str = "execute",
+    speed: float = 1.0,
+    clients: int | None = None,
+    requests: int | None = None,
+    api_key: str | None = None,
+    model_latency: float = 0.2,
+    upstream_latency: float = 0.05,
+) -> dict[str, float]:
+    """
+    Replays the recordings of the server at `url`. Without a URL, sessions of the scripted trajectories are recorded on
+    the local service with the given latencies first and replayed there.
+    """
+    params = {"mode": mode, "speed": speed, **({"api_key": api_key} if api_key else {})}
+    if url is not None:
+        auth = {"api_key": api_key} if api_key else {}
+        recordings = httpx.get(f"{url}/recordings", params=auth, timeout=60).raise_for_status().json()
+        if not recordings:
+            raise ValueError(f"{url} has no recordings")
+        started = time.perf_counter()
+        results = asyncio.run(drive(f"{url}/replay", recordings, params, clients, requests))
+        return report(results, time.perf_counter() - started)
+
+    from ai_assistant.recordings import RECORDINGS
+
+    settings = RECORDINGS.directory, RECORDINGS.enabled, RECORDINGS.sample_rate
+    RECORDINGS.directory, RECORDINGS.enabled, RECORDINGS.sample_rate = Path(tempfile.mkdtemp()), True, 1.0
+    try:
+        with local_service(upstream_latency, model_latency) as (base_url, mock):
+            record_trajectories(base_url)
+            RECORDINGS.enabled = False
+            recordings = RECORDINGS.summaries()
+            upstream_requests = mock.requests
+            started = time.perf_counter()
+            results = asyncio.run(drive(f"{base_url}/replay", recordings, params, clients, requests))
+            wall = time.perf_counter() - started
+            return {**report(results, wall), "upstream_requests": mock.requests - upstream_requests}
+    finally:
+        RECORDINGS.directory, RECORDINGS.enabled, RECORDINGS.sample_rate = settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test that replays recorded /invoke sessions")
+    parser.add_argument("--url", help="Server to replay its recordings on, records scripted sessions locally if unset")
+    parser.add_argument("--mode", choices=("events", "execute"), default="execute")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed, 0 replays without upstream latency")
+    parser.add_argument("--clients", type=int, help="Replay back to back with this many clients, not at recorded times")
+    parser.add_argument("--requests", type=int, help="Recordings to replay with --clients, all of them by default")
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY"))
+    parser.add_argument(
+        "--model-latency", type=float, default=0.2, help="Seconds per scripted model call when recording"
+    )
+    parser.add_argument(
+        "--upstream-latency", type=float, default=0.05, help="Seconds per mock API request when recording"
+    )
+    parser.add_argument("--max-errors", type=int, default=0, help="Exit with an error above this many failed streams")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, force=True)
+    result = run_benchmark(
+        args.url,
+        args.mode,
+        args.speed,
+        args.clients,
+        args.requests,
+        args.api_key,
+        args.model_latency,
+        args.upstream_latency,
+    )
+    for name, value in result.items():
+        print(f"{name:<32} {value:.4f}" if isinstance(value, float) else f"{name:<32} {value}")
+
+    if result["errors"] > args.max_errors:
+        sys.exit(f"{result['errors']} streams failed")
+
+
+if __name__ == "__main__":
+    main()
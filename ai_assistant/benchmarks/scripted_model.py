@@ -0,0 +1,52 @@
+import json
+import time
+from pathlib import Path
+
+from smolagents import ChatMessage, Model
+from smolagents.models import MessageRole
+from smolagents.monitoring import TokenUsage
+
+TRAJECTORIES_PATH = Path(__file__).parent / "trajectories.json"
+
+
+def load_trajectories(path: Path = TRAJECTORIES_PATH) -> dict[str, list[str]]:
+    return {trajectory["prompt"]: trajectory["steps"] for trajectory in json.loads(path.read_text())}
+
+
+def _text(message) -> str:
+    content = message.content if isinstance(message, ChatMessage) else message["content"]
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content)
+    return content or ""
+
+
+def _role(message) -> str:
+    role = message.role if isinstance(message, ChatMessage) else message["role"]
+    return getattr(role, "value", role)
+
+
+class ScriptedModel(Model):
+    """
+    Deterministic model that replays recorded agent trajectories: the n-th call for a task returns the n-th recorded
+    output of the trajectory with that prompt, after a fixed latency.
+    """
+
+    def __init__(self, trajectories: dict[str, list[str]] | None = None, latency: float = 0.0, **kwargs):
+        super().__init__(model_id="scripted", **kwargs)
+        self.trajectories = trajectories if trajectories is not None else load_trajectories()
+        self.latency = latency
+
+    def generate(self, messages, stop_sequences=None, response_format=None, tools_to_call_from=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        task_index = max(i for i, m in enumerate(messages) if _text(m).startswith("New task:"))
+        task = _text(messages[task_index]).removeprefix("New task:\n").strip()
+        steps = self.trajectories.get(task) or ['<code>\nfinal_answer("No recorded trajectory")\n</code>']
+        step = sum(1 for m in messages[task_index:] if _role(m) == MessageRole.ASSISTANT.value)
+        content = steps[min(step, len(steps) - 1)]
+        input_tokens = sum(len(_text(m)) for m in messages) // 4
+        return ChatMessage(
+            role=MessageRole.ASSISTANT,
+            content=content,
+            token_usage=TokenUsage(input_tokens=input_tokens, output_tokens=len(content) // 4),
+        )
@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import contextlib
+import itertools
+import logging
+import os
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Iterator, NamedTuple
+
+import httpx
+import uvicorn
+
+from ai_assistant.benchmarks.mock_upstream import MockDeadlockApi
+from ai_assistant.benchmarks.scripted_model import ScriptedModel, load_trajectories
+from ai_assistant.upstream import UPSTREAM
+
+
+class StreamResult(NamedTuple):
+    time_to_first_event: float
+    duration: float
+    events: int
+    error: bool
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def max_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+async def stream_once(client: httpx.AsyncClient, url: str, prompt: str) -> StreamResult:
+    started = time.perf_counter()
+    first_event, events, error = None, 0, False
+    async with client.stream("GET", url, params={"prompt": prompt, "model": "scripted"}) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                first_event = first_event or time.perf_counter() - started
+                events += 1
+                error = error or line.startswith("event: error")
+    duration = time.perf_counter() - started
+    return StreamResult(first_event if first_event is not None else duration, duration, events, error)
+
+
+async def drive(url: str, prompts: list[str], clients: int, requests: int) -> list[StreamResult]:
+    queue = itertools.islice(itertools.cycle(prompts), requests)
+    results = []
+
+    async def worker(client: httpx.AsyncClient):
+        for prompt in queue:
+            results.append(await stream_once(client, url, prompt))
+
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(clients)))
+    return results
+
+
+@contextlib.contextmanager
+def local_service(
+    upstream_latency: float = 0.01, model_latency: float = 0.02, answer_cache: bool = False
+) -> Iterator[tuple[str, MockDeadlockApi]]:
+    """
+    Runs the real API app on a local port against the mock Deadlock API and the scripted model, yields its URL.
+    """
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    # Snapshots of the mock data must not replace those of the real service.
+    snapshot_dir = tempfile.mkdtemp()
+    os.environ.setdefault("SCHEMA_SNAPSHOT_PATH", os.path.join(snapshot_dir, "schema.json"))
+    os.environ.setdefault("ENTITY_SNAPSHOT_PATH", os.path.join(snapshot_dir, "entities.json"))
+    os.environ.setdefault("AGGREGATES_DIR", os.path.join(snapshot_dir, "aggregates"))
+    from ai_assistant import api
+
+    mock = MockDeadlockApi(latency=upstream_latency)
+    http_client = mock.install()
+    trajectories = load_trajectories()
+    settings = api.CACHE_ANSWERS, api.DO_RELEVANCY_CHECK, api.ADMISSION.rate
+    api.MODEL_CONFIGS["scripted"] = lambda: ScriptedModel(trajectories, latency=model_latency)
+    # All clients share one address, the rate limit would reject most of them.
+    api.CACHE_ANSWERS, api.DO_RELEVANCY_CHECK, api.ADMISSION.rate = answer_cache, False, 0
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        # The agent prints every step, which would drown the report.
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield f"http://127.0.0.1:{port}", mock
+    finally:
+        server.should_exit = True
+        thread.join()
+        UPSTREAM.client.close()
+        UPSTREAM.client = http_client
+        api.AGENT_POOL.clear()
+        api.CACHE_ANSWERS, api.DO_RELEVANCY_CHECK, api.ADMISSION.rate = settings
+
+
+def run_benchmark(
+    clients: int = 8,
+    requests: int = 32,
+    upstream_latency: float = 0.01,
+    model_latency: float = 0.02,
+    answer_cache: bool = False,
+) -> dict[str, float]:
+    """
+    Streams `requests` prompts through `clients` concurrent SSE clients against the local service.
+    """
+    prompts = list(load_trajectories())
+    with local_service(upstream_latency, model_latency, answer_cache) as (base_url, mock):
+        url = f"{base_url}/invoke"
+        asyncio.run(drive(url, prompts, min(clients, 2), len(prompts)))  # warm up caches and lazy imports
+        rss_before, cpu_before = max_rss_bytes(), time.process_time()
+        started = time.perf_counter()
+        results = asyncio.run(drive(url, prompts, clients, requests))
+        wall = time.perf_counter() - started
+        cpu = time.process_time() - cpu_before
+        rss_growth = max_rss_bytes() - rss_before
+
+    ttfe = [r.time_to_first_event for r in results]
+    durations = [r.duration for r in results]
+    return {
+        "requests": len(results),
+        "errors": sum(r.error for r in results),
+        "ttfe_p50": percentile(ttfe, 50),
+        "ttfe_p95": percentile(ttfe, 95),
+        "ttfe_p99": percentile(ttfe, 99),
+        "duration_p50": percentile(durations, 50),
+        "duration_p95": percentile(durations, 95),
+        "duration_p99": percentile(durations, 99),
+        "requests_per_second": len(results) / wall,
+        "events_per_second": sum(r.events for r in results) / wall,
+        "cpu_ms_per_request": cpu / len(results) * 1000,
+        "cpu_utilization": cpu / wall,
+        "peak_rss_growth_per_stream_kb": max(rss_growth, 0) / min(clients, requests) / 1024,
+        "upstream_requests": mock.requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load benchmark of the /invoke endpoint")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--upstream-latency", type=float, default=0.01, help="Seconds per mock API request")
+    parser.add_argument("--model-latency", type=float, default=0.02, help="Seconds per scripted model call")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the answer cache enabled")
+    parser.add_argument("--max-ttfe-p95", type=float, help="Exit with an error if the p95 TTFE is above this")
+    parser.add_argument("--max-errors", type=int, default=0, help="Exit with an error above this many failed streams")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, force=True)
+    report = run_benchmark(args.clients, args.requests, args.upstream_latency, args.model_latency, args.answer_cache)
+    for name, value in report.items():
+        print(f"{name:<32} {value:.4f}" if isinstance(value, float) else f"{name:<32} {value}")
+
+    if report["errors"] > args.max_errors:
+        sys.exit(f"{report['errors']} streams failed")
+    if args.max_ttfe_p95 is not None and report["ttfe_p95"] > args.max_ttfe_p95:
+        sys.exit(f"p95 time to first event {report['ttfe_p95']:.3f}s is above {args.max_ttfe_p95}s")
+
+
+if __name__ == "__main__":
+    main()
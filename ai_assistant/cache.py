@@ -0,0 +1,177 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry TTL and optional byte budget.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float | None = None,
+        max_bytes: int | None = None,
+        sizer: Callable[[Any], int] | None = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizer = sizer
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, float | None, int]] = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, MISSING, count=False) is not MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        size = self.sizer(value) if self.sizer else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                self.evictions += 1
+                return
+            self._entries[key] = (value, time.monotonic() + ttl if ttl is not None else None, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def items(self) -> list[tuple[Hashable, Any]]:
+        """
+        Snapshot of the unexpired entries, without counting hits or changing the LRU order.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, value) for key, (value, expires, _) in self._entries.items() if expires is None or expires > now
+            ]
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+
+class SqliteTTLStore:
+    """
+    Key-value table with per-entry expiry in a local SQLite file, shared by all worker processes of a host.
+
+    Expired rows are deleted on write.
+    """
+
+    def __init__(self, path: str, table: str):
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, data BLOB, expires REAL)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires ON {table} (expires)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are per thread, WAL lets the workers read while one of them writes.
+        if (conn := getattr(self._local, "conn", None)) is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key: str) -> Any | None:
+        row = (
+            self._connection()
+            .execute(f"SELECT data FROM {self.table} WHERE id = ? AND expires > ?", (key, time.time()))
+            .fetchone()
+        )
+        return row[0] if row is not None else None
+
+    def set(self, key: str, value: bytes | str, ttl: float) -> None:
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE expires <= ?", (now,))
+            conn.execute(f"INSERT INTO {self.table} VALUES (?, ?, ?)", (key, value, now + ttl))
+
+    def __len__(self) -> int:
+        (entries,) = self._connection().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        return entries
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls for the same key, so only the first caller executes and the others share its result.
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._calls: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
@@ -1,24 +1,16 @@
-from smolagents import CodeAgent
+from ai_assistant.agent_pool import AGENT_POOL
+from ai_assistant.configs import default_model_key, get_agent_instructions
+from ai_assistant.relevancy import IRRELEVANT_PROMPT_MESSAGE, RelevancyChecker
 
-from ai_assistant.configs import AGENT_INSTRUCTIONS, get_model
-from ai_assistant.tools import ALL_TOOLS
-from ai_assistant.relevancy import RelevancyChecker
 
-
-def run_agent(prompt: str, model=get_model()):
+def run_agent(prompt: str, model: str | None = None):
     relevancy_checker = RelevancyChecker()
     if not relevancy_checker.is_relevant(prompt):
-        print(
-            "This assistant only handles Deadlock game-related questions. Please ask about Deadlock gameplay, heroes, items, statistics, or other game-related topics."
-        )
+        print(IRRELEVANT_PROMPT_MESSAGE)
         return None
 
-    agent = CodeAgent(
-        model=model,
-        tools=ALL_TOOLS,
-        instructions=AGENT_INSTRUCTIONS,
-    )
-    with agent:
+    with AGENT_POOL.agent(model or default_model_key()) as agent:
+        agent.instructions = get_agent_instructions(prompt)
         return agent.run(prompt)
 
 
@@ -3,15 +3,21 @@ import os
 
 from smolagents import LiteLLMModel, InferenceClientModel, ApiModel
 
-from ai_assistant.message_store import MessageStore, RedisMessageStore, MemoryMessageStore
-from ai_assistant.utils import format_table_schema, list_clickhouse_tables
+from ai_assistant.message_store import MessageStore, RedisMessageStore, MemoryMessageStore, SqliteMessageStore
+from ai_assistant.schema_catalog import SchemaCatalog
+from ai_assistant.schema_retrieval import SchemaRetriever
 
 LOGGER = logging.getLogger(__name__)
 
 DO_RELEVANCY_CHECK = os.environ.get("DO_RELEVANCY_CHECK", "false").lower() in ("true", "1", "yes")
+SPECULATIVE_RELEVANCY_CHECK = os.environ.get("SPECULATIVE_RELEVANCY_CHECK", "false").lower() in ("true", "1", "yes")
+CACHE_ANSWERS = os.environ.get("CACHE_ANSWERS", "false").lower() in ("true", "1", "yes")
+MODEL_ROUTING = os.environ.get("MODEL_ROUTING", "false").lower() in ("true", "1", "yes")
+SCHEMA_RETRIEVAL = os.environ.get("SCHEMA_RETRIEVAL", "true").lower() in ("true", "1", "yes")
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", 1))
 
-TABLES_CONTEXT = "\n\n".join(format_table_schema(table) for table in list_clickhouse_tables())
-AGENT_INSTRUCTIONS = f"Available Clickhouse Tables:\n{TABLES_CONTEXT}"
+SCHEMA_CATALOG = SchemaCatalog()
+SCHEMA_RETRIEVER = SchemaRetriever(SCHEMA_CATALOG)
 
 MODEL_CONFIGS = {
     "gemini-flash-lite": lambda: LiteLLMModel(model_id="gemini/gemini-2.5-flash-lite-preview-06-17"),
@@ -36,25 +42,38 @@ REPLAY = [
 ]
 
 
-def get_model() -> ApiModel:
-    if model := os.environ.get("MODEL"):
-        if model in MODEL_CONFIGS:
-            return MODEL_CONFIGS[model]()
+def get_agent_instructions(prompt: str | None = None) -> str:
+    if prompt is not None and SCHEMA_RETRIEVAL:
+        return f"Available Clickhouse Tables:\n{SCHEMA_RETRIEVER.context(prompt)}"
+    return f"Available Clickhouse Tables:\n{SCHEMA_CATALOG.context()}"
+
+
+def default_model_key() -> str:
+    if (model := os.environ.get("MODEL")) in MODEL_CONFIGS:
+        return model
 
     if "GEMINI_API_KEY" in os.environ:
         LOGGER.info("Using Google Gemini Flash Model")
-        return MODEL_CONFIGS["gemini-flash"]()
+        return "gemini-flash"
     elif "HF_TOKEN" in os.environ:
         LOGGER.info("Using Hugging Face Inference API")
-        return MODEL_CONFIGS["hf"]()
+        return "hf"
     else:
         raise ValueError(f"Invalid model: {model}")
 
 
+def get_model() -> ApiModel:
+    return MODEL_CONFIGS[default_model_key()]()
+
+
 def get_message_store() -> MessageStore:
     if "REDIS_HOST" in os.environ:
         LOGGER.info("Using Redis Message Store")
         return RedisMessageStore()
+    elif WEB_WORKERS > 1:
+        # Follow-up prompts can land on any worker, the in-memory store would lose their conversations.
+        LOGGER.info("Using SQLite Message Store shared by the workers")
+        return SqliteMessageStore()
     else:
         LOGGER.info("Using In-Memory Message Store")
         return MemoryMessageStore()
@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, ClassVar, NamedTuple
+
+import Levenshtein
+
+from ai_assistant.upstream import API_URL, ASSETS_URL, UPSTREAM
+
+LOGGER = logging.getLogger(__name__)
+
+ENTITY_KINDS = ("hero", "item", "rank")
+
+# Community nicknames that are too far from the official name for fuzzy matching to pick up.
+ALIASES: dict[str, dict[str, list[str]]] = {
+    "hero": {
+        "Mo & Krill": ["mo", "krill", "mo and krill"],
+        "Lady Geist": ["geist"],
+        "Grey Talon": ["talon"],
+        "Vindicta": ["vindi"],
+        "Dynamo": ["dyna"],
+    },
+    "item": {},
+    "rank": {},
+}
+
+
+def normalize_name(name: str) -> str:
+    name = name.lower().replace("&", " and ")
+    return " ".join(re.sub(r"[^\w\s]", " ", name).split())
+
+
+class Match(NamedTuple):
+    id: int
+    name: str
+    score: float
+    distance: int
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over normalized names, so fuzzy lookups only visit the part of the tree that can be within
+    the requested edit distance instead of scanning every entity.
+    """
+
+    def __init__(self):
+        self.root: tuple[str, list[tuple[int, str]], dict[int, tuple]] | None = None
+        self.size = 0
+
+    def add(self, key: str, value: tuple[int, str]) -> None:
+        self.size += 1
+        if self.root is None:
+            self.root = (key, [value], {})
+            return
+        node = self.root
+        while True:
+            node_key, values, children = node
+            distance = Levenshtein.distance(key, node_key)
+            if distance == 0:
+                values.append(value)
+                return
+            if distance not in children:
+                children[distance] = (key, [value], {})
+                return
+            node = children[distance]
+
+    def search(self, key: str, max_distance: int) -> list[tuple[int, str, list[tuple[int, str]]]]:
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_key, values, children = stack.pop()
+            distance = Levenshtein.distance(key, node_key)
+            if distance <= max_distance:
+                results.append((distance, node_key, values))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return results
+
+
+def fetch_entities() -> dict[str, list[tuple[int, str]]]:
+    def sql_entities(table: str) -> list[tuple[int, str]]:
+        rows = UPSTREAM.get_json(f"{API_URL}/v1/sql", params={"query": f"SELECT id, name FROM {table}"})
+        return [(row["id"], row["name"]) for row in rows if row.get("name")]
+
+    def ranks() -> list[tuple[int, str]]:
+        return [(rank["tier"], rank["name"]) for rank in UPSTREAM.get_json(f"{ASSETS_URL}/v2/ranks")]
+
+    with ThreadPoolExecutor(max_workers=len(ENTITY_KINDS)) as pool:
+        heroes = pool.submit(sql_entities, "heroes")
+        items = pool.submit(sql_entities, "items")
+        rank_list = pool.submit(ranks)
+        return {"hero": heroes.result(), "item": items.result(), "rank": rank_list.result()}
+
+
+class EntityIndex:
+    """
+    In-process fuzzy lookup index for heroes, items and ranks.
+
+    Entities are fetched once on first use and refreshed in the background once they are older than the TTL. With a
+    snapshot path, fetched entities are written to disk and later processes start from the snapshot instead.
+    """
+
+    TTL: ClassVar[int] = int(os.environ.get("ENTITY_INDEX_TTL", 6 * 60 * 60))
+    SNAPSHOT_PATH: ClassVar[str] = os.environ.get(
+        "ENTITY_SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "ai_assistant_entities.json")
+    )
+
+    def __init__(
+        self,
+        ttl: int | None = None,
+        loader: Callable[[], dict[str, list[tuple[int, str]]]] = fetch_entities,
+        snapshot_path: str | None = None,
+    ):
+        self.ttl = self.TTL if ttl is None else ttl
+        self.loader = loader
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self._index: dict[str, tuple[BKTree, dict[str, list[tuple[int, str]]]]] | None = None
+        self._names_by_id: dict[str, dict[int, str]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_thread: threading.Thread | None = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._index is not None
+
+    def names(self, kind: str) -> list[str]:
+        """
+        Normalized names and aliases of an already loaded index, never triggers a load.
+        """
+        if self._index is None:
+            return []
+        return list(self._index[kind][1])
+
+    def name_of(self, kind: str, entity_id: int) -> str | None:
+        self._ensure_loaded()
+        return self._names_by_id[kind].get(entity_id)
+
+    def refresh(self) -> None:
+        entities = self.loader()
+        self._build(entities, time.time())
+        self._save_snapshot(entities)
+
+    def _build(self, entities: dict[str, list[tuple[int, str]]], loaded_at: float) -> None:
+        index, names_by_id = {}, {}
+        for kind in ENTITY_KINDS:
+            tree, by_name = BKTree(), {}
+            aliases = ALIASES.get(kind, {})
+            for entity_id, name in entities.get(kind, []):
+                for key in {normalize_name(name), *(normalize_name(a) for a in aliases.get(name, []))}:
+                    tree.add(key, (entity_id, name))
+                    by_name.setdefault(key, []).append((entity_id, name))
+            index[kind] = (tree, by_name)
+            names_by_id[kind] = dict(entities.get(kind, []))
+        self._index, self._names_by_id, self._loaded_at = index, names_by_id, loaded_at
+        LOGGER.info(f"Loaded entity index: { {kind: tree.size for kind, (tree, _) in index.items()} }")
+
+    def lookup(self, kind: str, name: str, limit: int = 5, max_distance: int | None = None) -> list[Match]:
+        if kind not in ENTITY_KINDS:
+            raise ValueError(f"Unknown entity kind '{kind}', expected one of {ENTITY_KINDS}")
+        tree, by_name = self._ensure_loaded()[kind]
+        key = normalize_name(name)
+        if exact := by_name.get(key):
+            return [Match(entity_id, entity_name, 1.0, 0) for entity_id, entity_name in exact][:limit]
+
+        if max_distance is None:
+            max_distance = max(len(key), 1)
+        matches, seen = [], set()
+        for distance, node_key, values in sorted(tree.search(key, max_distance), key=lambda r: r[0]):
+            score = 1 - distance / max(len(key), len(node_key), 1)
+            for entity_id, entity_name in values:
+                if entity_id not in seen:
+                    seen.add(entity_id)
+                    matches.append(Match(entity_id, entity_name, round(score, 3), distance))
+        return matches[:limit]
+
+    def lookup_many(self, kind: str, names: list[str], limit: int = 5) -> dict[str, list[Match]]:
+        return {name: self.lookup(kind, name, limit=limit) for name in names}
+
+    def best(self, kind: str, name: str, max_distance: int | None = None) -> Match | None:
+        matches = self.lookup(kind, name, limit=1, max_distance=max_distance)
+        return matches[0] if matches else None
+
+    def warm(self) -> None:
+        """
+        Loads the index and refreshes it right away if it is stale, so processes started afterwards find a fresh
+        snapshot.
+        """
+        if self._index is None:
+            self._load_snapshot()
+        if self._index is None or time.time() - self._loaded_at > self.ttl:
+            try:
+                self.refresh()
+            except Exception as e:
+                LOGGER.error(f"Failed to fetch entities: {e}")
+
+    def _ensure_loaded(self) -> dict[str, tuple[BKTree, dict[str, list[tuple[int, str]]]]]:
+        if self._index is None:
+            with self._lock:
+                if self._index is None and not self._load_snapshot():
+                    self.refresh()
+        elif time.time() - self._loaded_at > self.ttl:
+            self._refresh_in_background()
+        return self._index
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self._background_refresh, daemon=True)
+            self._refresh_thread.start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            LOGGER.warning(f"Background entity index refresh failed, keeping previous index: {e}")
+
+    def _load_snapshot(self) -> bool:
+        if self.snapshot_path is None:
+            return False
+        try:
+            snapshot = json.loads(self.snapshot_path.read_text())
+        except (OSError, ValueError):
+            return False
+        entities = {kind: [tuple(entity) for entity in snapshot["entities"].get(kind, [])] for kind in ENTITY_KINDS}
+        self._build(entities, snapshot["loaded_at"])
+        LOGGER.info(f"Loaded entity snapshot from {self.snapshot_path}")
+        return True
+
+    def _save_snapshot(self, entities: dict[str, list[tuple[int, str]]]) -> None:
+        if self.snapshot_path is None:
+            return
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.snapshot_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps({"loaded_at": self._loaded_at, "entities": entities}))
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            LOGGER.warning(f"Failed to write entity snapshot to {self.snapshot_path}: {e}")
+
+
+ENTITY_INDEX = EntityIndex(snapshot_path=EntityIndex.SNAPSHOT_PATH)
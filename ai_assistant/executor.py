@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import AsyncGenerator, Callable, ClassVar, Coroutine, Iterable, Iterator
+
+LOGGER = logging.getLogger(__name__)
+
+TOOL_WORKERS = int(os.environ.get("TOOL_WORKERS", 16))
+
+_DONE = object()
+_BACKGROUND_TASKS: set[asyncio.Task] = set()
+_TOOL_POOL = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+
+
+def run_concurrently[T, R](fn: Callable[[T], R], items: Iterable[T]) -> list[Future[R]]:
+    """
+    Calls `fn` for every item on a shared pool and waits for all calls, so the wall time is that of the slowest one.
+
+    Every call runs in a copy of the caller's context, which keeps tracing spans in the trace of the request. Failed
+    calls are returned as futures holding their exception.
+    """
+    items = list(items)
+    if len(items) == 1:
+        future: Future[R] = Future()
+        try:
+            future.set_result(fn(items[0]))
+        except Exception as e:
+            future.set_exception(e)
+        return [future]
+    futures = [_TOOL_POOL.submit(copy_context().run, fn, item) for item in items]
+    wait(futures)
+    return futures
+
+
+def speculate(coroutine: Coroutine[None, None, bool], fallback: bool = False) -> Future[bool]:
+    """
+    Starts a check on the event loop and returns a future that agent threads can block on.
+
+    A check that fails resolves to `fallback`, one that is cancelled to False.
+    """
+    future: Future[bool] = Future()
+    task = asyncio.ensure_future(coroutine)
+    _BACKGROUND_TASKS.add(task)
+
+    def done(task: asyncio.Task) -> None:
+        _BACKGROUND_TASKS.discard(task)
+        if task.cancelled():
+            future.set_result(False)
+        elif task.exception() is not None:
+            future.set_result(fallback)
+        else:
+            future.set_result(bool(task.result()))
+
+    task.add_done_callback(done)
+    return future
+
+
+class AgentExecutor:
+    """
+    Runs blocking agent generators on a dedicated thread pool and bridges their events into the event loop.
+
+    Each run occupies one worker thread for its whole duration. Events are handed to the loop through an asyncio queue
+    without a thread hop per item; the worker blocks once `queue_size` events are waiting for a slow client, and the
+    generator is closed as soon as the client goes away.
+    """
+
+    MAX_WORKERS: ClassVar[int] = int(os.environ.get("AGENT_WORKERS", 32))
+    QUEUE_SIZE: ClassVar[int] = int(os.environ.get("AGENT_STREAM_QUEUE_SIZE", 64))
+
+    def __init__(self, max_workers: int | None = None, queue_size: int | None = None):
+        self.max_workers = max_workers or self.MAX_WORKERS
+        self.queue_size = queue_size or self.QUEUE_SIZE
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agent")
+        self.active = 0
+        self._lock = threading.Lock()
+
+    async def stream(self, iterator: Iterator[str]) -> AsyncGenerator[str, None]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        slots = threading.Semaphore(self.queue_size)
+        cancelled = threading.Event()
+        run = loop.run_in_executor(self.pool, self._produce, iterator, loop, queue, slots, cancelled)
+        try:
+            while (item := await queue.get()) is not _DONE:
+                slots.release()
+                yield item
+            await run
+        finally:
+            if not run.done():
+                LOGGER.info("Client disconnected, cancelling agent run")
+                cancelled.set()
+                slots.release()
+
+    def _produce(
+        self,
+        iterator: Iterator[str],
+        loop: asyncio.AbstractEventLoop,
+        queue: asyncio.Queue,
+        slots: threading.Semaphore,
+        cancelled: threading.Event,
+    ) -> None:
+        with self._lock:
+            self.active += 1
+        try:
+            for item in iterator:
+                slots.acquire()
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        finally:
+            with self._lock:
+                self.active -= 1
+            if close := getattr(iterator, "close", None):
+                close()
+            if not cancelled.is_set() and not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
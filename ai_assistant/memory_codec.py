@@ -0,0 +1,144 @@
+import json
+import os
+import zlib
+from typing import Any
+
+from smolagents import ActionStep, AgentMemory, ChatMessage, FinalAnswerStep, PlanningStep, TaskStep, ToolCall
+from smolagents import utils as smolagents_utils
+from smolagents.models import MessageRole
+from smolagents.monitoring import AgentLogger, LogLevel, Timing, TokenUsage
+from smolagents.utils import AgentError, make_json_serializable
+
+CODEC_VERSION = 1
+MAX_OBSERVATION_CHARS = int(os.environ.get("MEMORY_MAX_OBSERVATION_CHARS", 20_000))
+COMPRESSION_THRESHOLD = 512
+
+_RAW = b"j"
+_ZLIB = b"z"
+_SILENT_LOGGER = AgentLogger(level=LogLevel.OFF)
+
+
+def encode(value: Any) -> bytes:
+    """
+    Encodes a JSON document, compressing it with zlib once it is large enough for that to pay off.
+    """
+    data = json.dumps(value, separators=(",", ":")).encode()
+    if len(data) >= COMPRESSION_THRESHOLD:
+        return _ZLIB + zlib.compress(data)
+    return _RAW + data
+
+
+def decode(data: bytes) -> Any:
+    if data[:1] == _ZLIB:
+        return json.loads(zlib.decompress(data[1:]))
+    if data[:1] == _RAW:
+        return json.loads(data[1:])
+    raise ValueError(f"Unknown encoding marker {data[:1]!r}")
+
+
+def truncate_observation(observations: str | None, max_chars: int = MAX_OBSERVATION_CHARS) -> str | None:
+    if observations is None or len(observations) <= max_chars:
+        return observations
+    return f"{observations[:max_chars]}\n... [truncated {len(observations) - max_chars} characters]"
+
+
+def _token_usage(token_usage: TokenUsage | None) -> list[int] | None:
+    return [token_usage.input_tokens, token_usage.output_tokens] if token_usage else None
+
+
+def _timing(timing: Timing) -> list[float | None]:
+    return [timing.start_time, timing.end_time]
+
+
+def step_to_dict(step) -> dict[str, Any]:
+    """
+    Serializes the parts of a memory step that the agent needs to continue a conversation.
+
+    Model input messages are dropped, as they are rebuilt from the memory on every step, and so are images.
+    """
+    if isinstance(step, TaskStep):
+        return {"v": CODEC_VERSION, "type": "task", "task": step.task}
+    if isinstance(step, ActionStep):
+        return {
+            "v": CODEC_VERSION,
+            "type": "action",
+            "step_number": step.step_number,
+            "timing": _timing(step.timing),
+            "tool_calls": None
+            if step.tool_calls is None
+            else [[tc.name, make_json_serializable(tc.arguments), tc.id] for tc in step.tool_calls],
+            "error": step.error.dict() if step.error else None,
+            "model_output": step.model_output,
+            "code_action": step.code_action,
+            "observations": truncate_observation(step.observations),
+            "action_output": make_json_serializable(step.action_output),
+            "token_usage": _token_usage(step.token_usage),
+            "is_final_answer": step.is_final_answer,
+        }
+    if isinstance(step, PlanningStep):
+        return {
+            "v": CODEC_VERSION,
+            "type": "planning",
+            "plan": step.plan,
+            "timing": _timing(step.timing),
+            "token_usage": _token_usage(step.token_usage),
+        }
+    if isinstance(step, FinalAnswerStep):
+        return {"v": CODEC_VERSION, "type": "final_answer", "output": make_json_serializable(step.output)}
+    raise TypeError(f"Cannot serialize memory step of type {type(step).__name__}")
+
+
+def _error_from_dict(data: dict[str, str]) -> AgentError:
+    error_cls = getattr(smolagents_utils, data["type"], AgentError)
+    if not (isinstance(error_cls, type) and issubclass(error_cls, AgentError)):
+        error_cls = AgentError
+    return error_cls(data["message"], _SILENT_LOGGER)
+
+
+def step_from_dict(data: dict[str, Any]):
+    if data.get("v") != CODEC_VERSION:
+        raise ValueError(f"Unsupported memory step version {data.get('v')}")
+    token_usage = TokenUsage(*data["token_usage"]) if data.get("token_usage") else None
+    match data["type"]:
+        case "task":
+            return TaskStep(task=data["task"])
+        case "action":
+            return ActionStep(
+                step_number=data["step_number"],
+                timing=Timing(*data["timing"]),
+                tool_calls=None
+                if data["tool_calls"] is None
+                else [ToolCall(name, arguments, id_) for name, arguments, id_ in data["tool_calls"]],
+                error=_error_from_dict(data["error"]) if data["error"] else None,
+                model_output=data["model_output"],
+                code_action=data["code_action"],
+                observations=data["observations"],
+                action_output=data["action_output"],
+                token_usage=token_usage,
+                is_final_answer=data["is_final_answer"],
+            )
+        case "planning":
+            return PlanningStep(
+                model_input_messages=[],
+                model_output_message=ChatMessage(role=MessageRole.ASSISTANT, content=data["plan"]),
+                plan=data["plan"],
+                timing=Timing(*data["timing"]),
+                token_usage=token_usage,
+            )
+        case "final_answer":
+            return FinalAnswerStep(output=data["output"])
+    raise ValueError(f"Unknown memory step type {data['type']}")
+
+
+def encode_step(step) -> bytes:
+    return encode(step_to_dict(step))
+
+
+def decode_step(data: bytes):
+    return step_from_dict(decode(data))
+
+
+def build_memory(system_prompt: str, steps: list) -> AgentMemory:
+    memory = AgentMemory(system_prompt)
+    memory.steps = steps
+    return memory
@@ -0,0 +1,177 @@
+import dataclasses
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, ClassVar
+
+from smolagents import ActionStep, AgentMemory, PlanningStep, TaskStep
+from smolagents.monitoring import Timing
+
+from ai_assistant.memory_codec import build_memory, truncate_observation
+from ai_assistant.model_router import ROUTING_PATH
+from ai_assistant.schema_retrieval import estimate_tokens
+
+LOGGER = logging.getLogger(__name__)
+
+SUMMARY_HEADER = "Summary of this earlier task, its intermediate steps were compacted:"
+_BOILERPLATE = re.compile(r"^(Execution logs:|Last output from code snippet:|None)$")
+
+
+def step_tokens(step) -> int:
+    if not isinstance(step, (TaskStep, ActionStep, PlanningStep)):
+        return 0
+    return sum(
+        estimate_tokens(part.get("text", ""))
+        for message in step.to_messages()
+        for part in message.content
+        if isinstance(part, dict)
+    )
+
+
+def split_turns(steps: list) -> list[list]:
+    """
+    Splits memory steps into turns, each starting with the task of one prompt.
+    """
+    turns: list[list] = []
+    for step in steps:
+        if isinstance(step, TaskStep) or not turns:
+            turns.append([])
+        turns[-1].append(step)
+    return turns
+
+
+class MemoryCompactor:
+    """
+    Keeps the conversation history of follow-up prompts within a token budget per model.
+
+    Memories within budget are left untouched. Otherwise the oldest turns are replaced by their task and one summary
+    step holding the short outputs of their successful steps and their final answer, until the history fits in
+    `target` of the budget, so that the next turns can append without compacting again. If that is not enough,
+    observations of the most recent turns are truncated and then the oldest summarized turns are dropped.
+    """
+
+    DEFAULT_BUDGET: ClassVar[int] = int(os.environ.get("MEMORY_TOKEN_BUDGET", 8000))
+    TARGET: ClassVar[float] = float(os.environ.get("MEMORY_COMPACTION_TARGET", 0.6))
+    KEEP_TURNS: ClassVar[int] = int(os.environ.get("MEMORY_KEEP_TURNS", 1))
+    FACT_CHARS: ClassVar[int] = int(os.environ.get("MEMORY_FACT_CHARS", 200))
+    MAX_FACTS: ClassVar[int] = int(os.environ.get("MEMORY_MAX_FACTS", 5))
+    ANSWER_CHARS: ClassVar[int] = int(os.environ.get("MEMORY_ANSWER_CHARS", 1000))
+    KEPT_OBSERVATION_CHARS: ClassVar[int] = int(os.environ.get("MEMORY_KEPT_OBSERVATION_CHARS", 4000))
+
+    def __init__(self, path: str = ROUTING_PATH, default_budget: int | None = None, keep_turns: int | None = None):
+        models = json.loads(Path(path).read_text())["models"]
+        self.budgets = {
+            key: model["memory_token_budget"] for key, model in models.items() if "memory_token_budget" in model
+        }
+        self.default_budget = default_budget or self.DEFAULT_BUDGET
+        self.keep_turns = self.KEEP_TURNS if keep_turns is None else keep_turns
+        self.compactions = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.turns_summarized = 0
+        self.turns_dropped = 0
+        self._lock = threading.Lock()
+
+    def budget(self, model: str | None) -> int:
+        return self.budgets.get(model, self.default_budget)
+
+    def compact(self, memory: AgentMemory, model: str | None = None) -> AgentMemory:
+        """
+        Returns the memory itself if it fits in the budget of the model, otherwise a compacted copy.
+
+        Stored memories share their step objects, so compacted steps are always new objects.
+        """
+        budget = self.budget(model)
+        turns = split_turns(memory.steps)
+        tokens = [[step_tokens(step) for step in turn] for turn in turns]
+        before = total = sum(map(sum, tokens))
+        if before <= budget:
+            return memory
+
+        target = int(budget * self.TARGET)
+        summarized = dropped = 0
+        recent = max(len(turns) - self.keep_turns, 0)
+        for i in range(recent):
+            if total <= target:
+                break
+            if (compacted := self.summarize(turns[i])) is turns[i]:
+                continue
+            compacted_tokens = [step_tokens(step) for step in compacted]
+            total += sum(compacted_tokens) - sum(tokens[i])
+            turns[i], tokens[i] = compacted, compacted_tokens
+            summarized += 1
+        for i in range(recent, len(turns)):
+            if total <= target:
+                break
+            truncated = [self._truncate(step) for step in turns[i]]
+            truncated_tokens = [step_tokens(step) for step in truncated]
+            total += sum(truncated_tokens) - sum(tokens[i])
+            turns[i], tokens[i] = truncated, truncated_tokens
+        while total > target and len(turns) > max(self.keep_turns, 1):
+            total -= sum(tokens.pop(0))
+            turns.pop(0)
+            dropped += 1
+
+        with self._lock:
+            self.compactions += 1
+            self.tokens_before += before
+            self.tokens_after += total
+            self.turns_summarized += summarized
+            self.turns_dropped += dropped
+        LOGGER.info(
+            f"Compacted memory from {before} to {total} tokens (budget {budget}), "
+            f"summarized {summarized} and dropped {dropped} turns"
+        )
+        return build_memory(memory.system_prompt.system_prompt, [step for turn in turns for step in turn])
+
+    def summarize(self, turn: list) -> list:
+        task = [step for step in turn if isinstance(step, TaskStep)]
+        actions = [step for step in turn if isinstance(step, ActionStep)]
+        if not actions:
+            return task
+        if len(actions) == 1 and (actions[0].observations or "").startswith(SUMMARY_HEADER):
+            return turn
+        facts = [fact for step in actions if not step.error and (fact := self._fact(step.observations))]
+        final = next((step for step in reversed(actions) if step.is_final_answer), actions[-1])
+        lines = [SUMMARY_HEADER]
+        lines += [f"- {fact}" for fact in facts[-self.MAX_FACTS :]]
+        lines.append(f"Final answer: {str(final.action_output)[: self.ANSWER_CHARS]}")
+        summary = ActionStep(
+            step_number=final.step_number,
+            timing=Timing(start_time=actions[0].timing.start_time, end_time=final.timing.end_time),
+            observations="\n".join(lines),
+            action_output=final.action_output,
+            is_final_answer=final.is_final_answer,
+        )
+        return [*task, summary]
+
+    def _fact(self, observations: str | None) -> str | None:
+        if not observations:
+            return None
+        lines = [line.strip() for line in observations.splitlines()]
+        fact = " ".join(line for line in lines if line and not _BOILERPLATE.match(line))
+        if len(fact) > self.FACT_CHARS:
+            fact = f"{fact[: self.FACT_CHARS]}... [{len(fact) - self.FACT_CHARS} characters dropped]"
+        return fact or None
+
+    def _truncate(self, step):
+        if not isinstance(step, ActionStep) or not step.observations:
+            return step
+        observations = truncate_observation(step.observations, self.KEPT_OBSERVATION_CHARS)
+        return step if observations is step.observations else dataclasses.replace(step, observations=observations)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "compactions": self.compactions,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "turns_summarized": self.turns_summarized,
+                "turns_dropped": self.turns_dropped,
+            }
+
+
+MEMORY_COMPACTOR = MemoryCompactor()
@@ -1,6 +1,7 @@
+import hashlib
 import logging
 import os
-import pickle
+import tempfile
 import uuid
 from abc import ABC, abstractmethod
 from typing import ClassVar
@@ -9,13 +10,44 @@ from uuid import UUID
 import redis
 from smolagents import AgentMemory
 
+from ai_assistant.cache import SqliteTTLStore, TTLCache
+from ai_assistant.memory_codec import (
+    CODEC_VERSION,
+    build_memory,
+    decode,
+    decode_step,
+    encode,
+    encode_step,
+    step_from_dict,
+    step_to_dict,
+)
+
 LOGGER = logging.getLogger(__name__)
 
 
+def approximate_size(value, depth: int = 6) -> int:
+    """
+    Rough byte size of a memory object graph, counting the strings it holds, which dominate real memories.
+    """
+    if value is None or depth < 0:
+        return 0
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(approximate_size(v, depth - 1) for v in value)
+    if isinstance(value, dict):
+        return sum(approximate_size(v, depth - 1) for k, v in value.items() if k != "raw")
+    if isinstance(value, AgentMemory):
+        return approximate_size(value.system_prompt, depth) + approximate_size(value.steps, depth)
+    if hasattr(value, "__dict__"):
+        return approximate_size(vars(value), depth - 1)
+    return 8
+
+
 class MessageStore(ABC):
-    def save_memory(self, memory: AgentMemory) -> UUID:
+    def save_memory(self, memory: AgentMemory, parent_id: UUID | None = None) -> UUID:
         LOGGER.debug("Saving memory")
-        memory_id = self._save_memory(memory)
+        memory_id = self._save_memory(memory, parent_id)
         LOGGER.info(f"Saved memory with ID {memory_id}")
         return memory_id
 
@@ -28,8 +60,11 @@ class MessageStore(ABC):
         LOGGER.info(f"Retrieved memory with ID {memory_id}")
         return memory
 
+    def stats(self) -> dict[str, int]:
+        return {}
+
     @abstractmethod
-    def _save_memory(self, memory: AgentMemory) -> UUID:
+    def _save_memory(self, memory: AgentMemory, parent_id: UUID | None) -> UUID:
         raise NotImplementedError
 
     @abstractmethod
@@ -38,18 +73,92 @@ class MessageStore(ABC):
 
 
 class MemoryMessageStore(MessageStore):
-    memory: dict[UUID, AgentMemory] = {}
+    """
+    In-process store, bounded by entry count and an approximate byte budget, with the same expiry as Redis.
+    """
+
+    memory: TTLCache
+
+    MAX_ENTRIES: ClassVar[int] = int(os.environ.get("MEMORY_STORE_MAX_ENTRIES", 10_000))
+    MAX_BYTES: ClassVar[int] = int(os.environ.get("MEMORY_STORE_MAX_BYTES", 256 * 1024 * 1024))
+
+    def __init__(self, expire: int = 60 * 60, max_entries: int | None = None, max_bytes: int | None = None):
+        self.memory = TTLCache(
+            max_entries=max_entries or self.MAX_ENTRIES,
+            ttl=expire,
+            max_bytes=max_bytes or self.MAX_BYTES,
+            sizer=approximate_size,
+        )
+
+    def stats(self) -> dict[str, int]:
+        return self.memory.stats()
+
+    def _save_memory(self, memory: AgentMemory, parent_id: UUID | None) -> UUID:
+        memory_id = uuid.uuid4()
+        self.memory.set(memory_id, memory)
+        return memory_id
+
+    def _get_memory(self, memory_id: UUID) -> AgentMemory | None:
+        memory = self.memory.get(memory_id)
+        if memory is None:
+            return None
+        # The agent appends to the memory it runs with, hand out a copy so the stored turn stays unchanged.
+        return build_memory(memory.system_prompt.system_prompt, list(memory.steps))
+
+
+class SqliteMessageStore(MessageStore):
+    """
+    Store in a local SQLite file shared by all worker processes of a host, for multiple workers without Redis.
+
+    Every memory is one compressed row holding its system prompt and all its steps, expired rows are deleted on save.
+    """
 
-    def _save_memory(self, memory: AgentMemory) -> UUID:
+    PATH: ClassVar[str] = os.environ.get(
+        "MESSAGE_STORE_PATH", os.path.join(tempfile.gettempdir(), "ai_assistant_memories.sqlite3")
+    )
+
+    def __init__(self, path: str | None = None, expire: int = 60 * 60):
+        self.path = path or self.PATH
+        self.expire = expire
+        self.memories = SqliteTTLStore(self.path, "memories")
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self.memories)}
+
+    def _save_memory(self, memory: AgentMemory, parent_id: UUID | None) -> UUID:
         memory_id = uuid.uuid4()
-        self.memory[memory_id] = memory
+        data = encode(
+            {
+                "v": CODEC_VERSION,
+                "prompt": memory.system_prompt.system_prompt,
+                "steps": [step_to_dict(step) for step in memory.steps],
+            }
+        )
+        self.memories.set(str(memory_id), data, self.expire)
         return memory_id
 
     def _get_memory(self, memory_id: UUID) -> AgentMemory | None:
-        return self.memory.get(memory_id)
+        if (data := self.memories.get(str(memory_id))) is None:
+            return None
+        value = decode(data)
+        if value.get("v") != CODEC_VERSION:
+            LOGGER.warning(f"Ignoring memory {memory_id} with unsupported version {value.get('v')}")
+            return None
+        return build_memory(value["prompt"], [step_from_dict(step) for step in value["steps"]])
 
 
 class RedisMessageStore(MessageStore):
+    """
+    Stores conversations as an append-only chain of segments, one per turn.
+
+    Every saved memory gets a small metadata record listing its ancestor segments, and a Redis list holding only the
+    steps that were added since its parent. The system prompt is stored once per distinct prompt. Loading a memory
+    costs two round trips regardless of the conversation length.
+
+    Segments are decoded when the memory is loaded, not lazily: the compactor measures every step and the agent writes
+    all of them into its first prompt, so each loaded step is decoded right away either way.
+    """
+
     conn: redis.Redis
     expire: int
 
@@ -60,14 +169,72 @@ class RedisMessageStore(MessageStore):
     def __init__(self, expire: int = 60 * 60):
         self.conn = redis.Redis(host=self.HOST, port=self.PORT, password=self.PASS)
         self.expire = expire
+        self._written_prompts: set[str] = set()
 
-    def _save_memory(self, memory: AgentMemory) -> UUID:
+    @staticmethod
+    def _meta_key(memory_id: UUID | str) -> str:
+        return f"memory:{memory_id}"
+
+    @staticmethod
+    def _steps_key(memory_id: UUID | str) -> str:
+        return f"memory:{memory_id}:steps"
+
+    @staticmethod
+    def _prompt_key(prompt_hash: str) -> str:
+        return f"memory-prompt:{prompt_hash}"
+
+    def _get_meta(self, memory_id: UUID) -> dict | None:
+        data = self.conn.get(self._meta_key(memory_id))
+        if data is None:
+            return None
+        meta = decode(data)
+        if meta.get("v") != CODEC_VERSION:
+            LOGGER.warning(f"Ignoring memory {memory_id} with unsupported version {meta.get('v')}")
+            return None
+        return meta
+
+    def _save_memory(self, memory: AgentMemory, parent_id: UUID | None) -> UUID:
         memory_id = uuid.uuid4()
-        self.conn.set(str(memory_id), pickle.dumps(memory), ex=self.expire)
+        parent = self._get_meta(parent_id) if parent_id else None
+        chain = [*parent["chain"], str(parent_id)] if parent else []
+        new_steps = memory.steps[parent["length"] :] if parent else memory.steps
+
+        system_prompt = memory.system_prompt.system_prompt
+        prompt_hash = hashlib.sha256(system_prompt.encode()).hexdigest()
+        meta = {"v": CODEC_VERSION, "chain": chain, "length": len(memory.steps), "prompt": prompt_hash}
+
+        pipe = self.conn.pipeline(transaction=False)
+        prompt_written = prompt_hash in self._written_prompts
+        if prompt_written:
+            pipe.expire(self._prompt_key(prompt_hash), self.expire)
+        else:
+            pipe.set(self._prompt_key(prompt_hash), encode(system_prompt), ex=self.expire)
+        if new_steps:
+            pipe.rpush(self._steps_key(memory_id), *(encode_step(step) for step in new_steps))
+            pipe.expire(self._steps_key(memory_id), self.expire)
+        pipe.set(self._meta_key(memory_id), encode(meta), ex=self.expire)
+        for ancestor in chain:
+            pipe.expire(self._meta_key(ancestor), self.expire)
+            pipe.expire(self._steps_key(ancestor), self.expire)
+        results = pipe.execute()
+        if prompt_written and not results[0]:
+            self.conn.set(self._prompt_key(prompt_hash), encode(system_prompt), ex=self.expire)
+        self._written_prompts.add(prompt_hash)
         return memory_id
 
     def _get_memory(self, memory_id: UUID) -> AgentMemory | None:
-        try:
-            return pickle.loads(self.conn.get(str(memory_id)))
-        except TypeError:
+        meta = self._get_meta(memory_id)
+        if meta is None:
+            return None
+
+        pipe = self.conn.pipeline(transaction=False)
+        for segment in [*meta["chain"], str(memory_id)]:
+            pipe.lrange(self._steps_key(segment), 0, -1)
+        pipe.get(self._prompt_key(meta["prompt"]))
+        *segments, system_prompt = pipe.execute()
+
+        steps = [decode_step(data) for segment in segments for data in segment]
+        if system_prompt is None or len(steps) != meta["length"]:
+            LOGGER.warning(f"Memory {memory_id} is incomplete, some of its segments have expired")
             return None
+        return build_memory(decode(system_prompt), steps)
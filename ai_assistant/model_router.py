@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, ClassVar, NamedTuple
+
+from google import genai
+from google.genai.types import GenerateContentConfig
+from smolagents import ChatMessage, Model
+
+from ai_assistant.agent_pool import AGENT_POOL
+from ai_assistant.cache import TTLCache
+from ai_assistant.configs import DEFAULT_LIGHT_MODEL
+from ai_assistant.entities import ENTITY_INDEX, normalize_name
+from ai_assistant.telemetry import METRICS, Counter, Histogram
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CASCADE = "gemini-flash-lite,gemini-flash,gemini-pro"
+ROUTING_PATH = os.environ.get("MODEL_ROUTING_PATH", str(Path(__file__).parent / "data" / "model_routing.json"))
+
+DIFFICULTY_SYSTEM_PROMPT = """You route questions for a Deadlock game assistant that answers them by writing Python
+code and ClickHouse SQL.
+
+Respond with ONLY "EASY" if the question needs a single lookup: an ID, a rank or badge, a list of heroes or items, or
+one simple count or value.
+
+Respond with ONLY "HARD" if the question needs joins, aggregations over several dimensions, comparisons, trends or
+multi-step reasoning."""
+
+MODEL_CALLS = METRICS.register(Counter("ai_assistant_model_calls_total", "Agent LLM calls by model and outcome."))
+MODEL_COST = METRICS.register(Counter("ai_assistant_model_cost_usd_total", "Estimated agent LLM spend by model."))
+MODEL_ESCALATIONS = METRICS.register(
+    Counter("ai_assistant_model_escalations_total", "Agent runs moved to a stronger model.")
+)
+MODEL_CALL_SECONDS = METRICS.register(Histogram("ai_assistant_model_call_seconds", "Agent LLM call duration by model."))
+
+
+class ModelSaturated(Exception):
+    pass
+
+
+class Route(NamedTuple):
+    difficulty: str | None
+    source: str
+    models: list[str]
+
+
+class DifficultyClassifier:
+    """
+    Tiered difficulty estimate: weighted cue terms decide clear prompts locally, previous light model verdicts are
+    cached by normalized prompt, and the light model is only asked about the remaining prompts if enabled.
+
+    Every hero or item mentioned beyond the first adds to the score, as it is another dimension to compare.
+    """
+
+    ENTITY_WEIGHT: ClassVar[float] = 0.75
+    USE_LLM: ClassVar[bool] = os.environ.get("ROUTER_LLM_CLASSIFIER", "false").lower() in ("true", "1", "yes")
+    CACHE_TTL: ClassVar[int] = int(os.environ.get("ROUTER_CACHE_TTL", 24 * 60 * 60))
+    CACHE_SIZE: ClassVar[int] = int(os.environ.get("ROUTER_CACHE_SIZE", 10_000))
+
+    def __init__(self, path: str = ROUTING_PATH, use_llm: bool | None = None):
+        config = json.loads(Path(path).read_text())
+        self.terms = {normalize_name(term): weight for term, weight in config["terms"].items()}
+        self.easy_threshold = config["easy_threshold"]
+        self.hard_threshold = config["hard_threshold"]
+        self.use_llm = self.USE_LLM if use_llm is None else use_llm
+        self.model_id = os.environ.get("LIGHT_MODEL", DEFAULT_LIGHT_MODEL)
+        self.client: genai.Client | None = None
+        self.cache = TTLCache(max_entries=self.CACHE_SIZE, ttl=self.CACHE_TTL)
+        self.config = GenerateContentConfig(
+            max_output_tokens=1,
+            temperature=0.0,
+            response_mime_type="text/x.enum",
+            response_schema={"type": "string", "enum": ["EASY", "HARD"]},
+        )
+
+    def score(self, prompt: str) -> float:
+        text = f" {normalize_name(prompt)} "
+        score = sum(weight for term, weight in self.terms.items() if f" {term} " in text)
+        entities = sum(
+            1
+            for kind in ("hero", "item")
+            for name in ENTITY_INDEX.names(kind)
+            if len(name) >= 3 and f" {name} " in text
+        )
+        return score + self.ENTITY_WEIGHT * max(entities - 1, 0)
+
+    def verdict(self, prompt: str) -> str | None:
+        score = self.score(prompt)
+        if score <= self.easy_threshold:
+            return "easy"
+        if score >= self.hard_threshold:
+            return "hard"
+        return None
+
+    def classify(self, prompt: str) -> tuple[str | None, str]:
+        if (difficulty := self.verdict(prompt)) is not None:
+            return difficulty, "local"
+        if (difficulty := self.cache.get(normalize_name(prompt))) is not None:
+            return difficulty, "cache"
+        if not self.use_llm or not os.environ.get("GEMINI_API_KEY"):
+            return None, "none"
+        try:
+            self.client = self.client or genai.Client()
+            response = self.client.models.generate_content(
+                model=self.model_id,
+                contents=f"{DIFFICULTY_SYSTEM_PROMPT}\n\nUser prompt: {prompt}\n\nRespond with exactly one word: EASY or HARD",
+                config=self.config,
+            )
+        except Exception as e:
+            LOGGER.error(f"Error during light model difficulty check: {e}")
+            return None, "llm"
+        result = (response.text or "").strip().upper()
+        LOGGER.info(f"Light model ({self.model_id}) difficulty check: '{prompt[:100]}...' -> {result}")
+        if result not in ("EASY", "HARD"):
+            return None, "llm"
+        self.cache.set(normalize_name(prompt), result.lower())
+        return result.lower(), "llm"
+
+
+class ModelRouter:
+    """
+    Picks a cascade of models per prompt: prompts classified as easy start on the light model, all others on the
+    default model. A run moves one model up its cascade when a call fails, when the concurrency limit of its model
+    stays exhausted, or after repeated step errors, so the strongest model is only used when the cheaper ones struggle.
+
+    Models outside of the cascade, like a local ollama as light model, escalate to the default model.
+    """
+
+    CASCADE: ClassVar[list[str]] = os.environ.get("ROUTER_CASCADE", DEFAULT_CASCADE).split(",")
+    EASY_MODEL: ClassVar[str] = os.environ.get("ROUTER_EASY_MODEL", "gemini-flash-lite")
+    DEFAULT_MODEL: ClassVar[str] = os.environ.get("ROUTER_DEFAULT_MODEL", "gemini-flash")
+    MAX_STEP_ERRORS: ClassVar[int] = int(os.environ.get("ROUTER_MAX_STEP_ERRORS", 2))
+    QUEUE_TIMEOUT: ClassVar[float] = float(os.environ.get("ROUTER_QUEUE_TIMEOUT", 5))
+    MAX_CONCURRENCY: ClassVar[int] = int(os.environ.get("ROUTER_MAX_CONCURRENCY", 16))
+
+    def __init__(
+        self,
+        classifier: DifficultyClassifier,
+        models: Callable[[str], Model],
+        path: str = ROUTING_PATH,
+        cascade: list[str] | None = None,
+        easy_model: str | None = None,
+        default_model: str | None = None,
+    ):
+        self.classifier = classifier
+        self.models = models
+        self.cascade = cascade or self.CASCADE
+        self.easy_model = easy_model or self.EASY_MODEL
+        self.default_model = default_model or self.DEFAULT_MODEL
+        self.pricing: dict[str, dict[str, float]] = json.loads(Path(path).read_text())["models"]
+        self.limits: dict[str, threading.BoundedSemaphore] = {}
+        self.usage: dict[str, dict[str, float]] = {}
+        self.routes: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def route(self, prompt: str) -> Route:
+        difficulty, source = self.classifier.classify(prompt)
+        start = self.easy_model if difficulty == "easy" else self.default_model
+        route = Route(difficulty, source, self._cascade_from(start))
+        with self._lock:
+            self.routes[difficulty or "unknown"] = self.routes.get(difficulty or "unknown", 0) + 1
+        LOGGER.info(f"Routing prompt as {difficulty} ({source}) to {route.models}")
+        return route
+
+    def model(self, prompt: str) -> "RoutedModel":
+        return RoutedModel(self, self.route(prompt))
+
+    def _cascade_from(self, key: str) -> list[str]:
+        if key in self.cascade:
+            return self.cascade[self.cascade.index(key) :]
+        if key == self.default_model:
+            return [key]
+        return [key, *self._cascade_from(self.default_model)]
+
+    def _limit(self, key: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if (limit := self.limits.get(key)) is None:
+                max_concurrency = self.pricing.get(key, {}).get("max_concurrency", self.MAX_CONCURRENCY)
+                limit = self.limits[key] = threading.BoundedSemaphore(max_concurrency)
+        return limit
+
+    def _record(self, key: str, **amounts: float) -> None:
+        with self._lock:
+            usage = self.usage.setdefault(key, {})
+            for name, amount in amounts.items():
+                usage[name] = usage.get(name, 0) + amount
+
+    def call(self, key: str, messages: list, wait: bool = True, **kwargs) -> ChatMessage:
+        """
+        Calls a model within its concurrency limit and accounts for latency, tokens and cost.
+
+        Without `wait`, raises ModelSaturated if no slot frees up within the queue timeout.
+        """
+        limit = self._limit(key)
+        if not limit.acquire(timeout=None if wait else self.QUEUE_TIMEOUT):
+            MODEL_CALLS.inc(model=key, outcome="saturated")
+            self._record(key, saturated=1)
+            raise ModelSaturated(f"All {key} slots are busy")
+        started = time.perf_counter()
+        try:
+            message = self.models(key).generate(messages, **kwargs)
+        except Exception:
+            MODEL_CALLS.inc(model=key, outcome="error")
+            self._record(key, errors=1, seconds=time.perf_counter() - started)
+            raise
+        finally:
+            limit.release()
+        duration = time.perf_counter() - started
+        input_tokens = message.token_usage.input_tokens if message.token_usage else 0
+        output_tokens = message.token_usage.output_tokens if message.token_usage else 0
+        prices = self.pricing.get(key, {})
+        cost = (input_tokens * prices.get("input_price", 0) + output_tokens * prices.get("output_price", 0)) / 1e6
+        MODEL_CALLS.inc(model=key, outcome="ok")
+        MODEL_CALL_SECONDS.observe(duration, model=key)
+        MODEL_COST.inc(cost, model=key)
+        self._record(
+            key, calls=1, seconds=duration, input_tokens=input_tokens, output_tokens=output_tokens, cost_usd=cost
+        )
+        return message
+
+    def escalated(self, key: str, reason: str) -> None:
+        MODEL_ESCALATIONS.inc(model=key, reason=reason)
+        self._record(key, escalations=1)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "routes": dict(self.routes),
+                "models": {
+                    key: {
+                        **{name: round(value, 6) for name, value in usage.items()},
+                        "mean_seconds": round(usage.get("seconds", 0) / usage["calls"], 4)
+                        if usage.get("calls")
+                        else None,
+                    }
+                    for key, usage in self.usage.items()
+                },
+            }
+
+
+class RoutedModel(Model):
+    """
+    Model of one agent run that delegates every call to the current model of its route.
+    """
+
+    def __init__(self, router: ModelRouter, route: Route):
+        super().__init__(model_id=route.models[0])
+        self.router = router
+        self.route = route
+        self.index = 0
+        self.step_errors = 0
+
+    @property
+    def current(self) -> str:
+        return self.route.models[self.index]
+
+    def escalate(self, reason: str) -> bool:
+        if self.index + 1 >= len(self.route.models):
+            return False
+        self.router.escalated(self.current, reason)
+        self.index += 1
+        self.model_id = self.current
+        self.step_errors = 0
+        LOGGER.info(f"Escalating agent run to {self.current} after {reason}")
+        return True
+
+    def step_failed(self) -> None:
+        self.step_errors += 1
+        if self.step_errors >= self.router.MAX_STEP_ERRORS:
+            self.escalate("step_errors")
+
+    def generate(self, messages, stop_sequences=None, response_format=None, tools_to_call_from=None, **kwargs):
+        while True:
+            last = self.index + 1 >= len(self.route.models)
+            try:
+                return self.router.call(
+                    self.current,
+                    messages,
+                    wait=last,
+                    stop_sequences=stop_sequences,
+                    response_format=response_format,
+                    tools_to_call_from=tools_to_call_from,
+                    **kwargs,
+                )
+            except ModelSaturated:
+                self.escalate("saturated")
+            except Exception as e:
+                LOGGER.warning(f"Model {self.current} failed: {e}")
+                if not self.escalate("error"):
+                    raise
+
+
+MODEL_ROUTER = ModelRouter(DifficultyClassifier(), AGENT_POOL.model)
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Callable, ClassVar
+
+import redis
+import sqlglot
+from sqlglot import exp
+
+from ai_assistant.cache import MISSING, SingleFlight, TTLCache
+from ai_assistant.message_store import RedisMessageStore
+from ai_assistant.results import QueryResult
+
+LOGGER = logging.getLogger(__name__)
+
+
+def normalize_query(sql: str) -> tuple[str, set[str]]:
+    """
+    Returns a canonical form of a ClickHouse query and the tables it reads.
+
+    Keywords, whitespace and table aliases are normalized through the sqlglot AST, so trivially different spellings of
+    the same query share a cache entry. Column aliases are kept as they determine the keys of the result rows.
+    """
+    try:
+        expression = sqlglot.parse_one(sql, read="clickhouse")
+    except sqlglot.errors.ParseError:
+        return " ".join(sql.split()), set()
+
+    cte_names = {cte.alias_or_name for cte in expression.find_all(exp.CTE)}
+    tables = {table.name for table in expression.find_all(exp.Table) if table.name not in cte_names}
+
+    aliases = {}
+    for table in expression.find_all(exp.Table):
+        if table.alias and table.alias not in aliases:
+            aliases[table.alias] = f"_t{len(aliases)}"
+    for table in expression.find_all(exp.Table):
+        if table.alias:
+            table.set("alias", exp.TableAlias(this=exp.to_identifier(aliases[table.alias])))
+    for column in expression.find_all(exp.Column):
+        if column.table in aliases:
+            column.set("table", exp.to_identifier(aliases[column.table]))
+    return expression.sql(dialect="clickhouse"), tables
+
+
+class QueryCache:
+    """
+    Result cache for ClickHouse queries with an in-process LRU tier and an optional shared Redis tier.
+
+    Entries expire after the TTL of the most volatile table the query reads, and concurrent identical queries are
+    executed only once.
+    """
+
+    MAX_ENTRIES: ClassVar[int] = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", 512))
+    DEFAULT_TTL: ClassVar[int] = int(os.environ.get("QUERY_CACHE_TTL", 5 * 60))
+    STATIC_TTL: ClassVar[int] = int(os.environ.get("QUERY_CACHE_STATIC_TTL", 24 * 60 * 60))
+    STATIC_TABLES: ClassVar[set[str]] = {"heroes", "items"}
+    REDIS_PREFIX: ClassVar[str] = "query-cache:"
+
+    def __init__(self, max_entries: int | None = None, use_redis: bool | None = None):
+        self.local = TTLCache(max_entries=max_entries or self.MAX_ENTRIES)
+        self.single_flight = SingleFlight()
+        if use_redis is None:
+            use_redis = "REDIS_HOST" in os.environ
+        self.redis = (
+            redis.Redis(host=RedisMessageStore.HOST, port=RedisMessageStore.PORT, password=RedisMessageStore.PASS)
+            if use_redis
+            else None
+        )
+        self.redis_hits = 0
+
+    def ttl_for(self, tables: set[str]) -> int:
+        # Queries without tables, or that failed to parse, may read anything, like now().
+        if tables and all(table in self.STATIC_TABLES for table in tables):
+            return self.STATIC_TTL
+        return self.DEFAULT_TTL
+
+    def get_or_execute(self, sql: str, execute: Callable[[str], QueryResult]) -> QueryResult:
+        normalized, tables = normalize_query(sql)
+        key = hashlib.sha256(normalized.encode()).hexdigest()
+        if (result := self.local.get(key, MISSING)) is not MISSING:
+            return result
+        return self.single_flight.do(key, lambda: self._load(key, sql, tables, execute))
+
+    def stats(self) -> dict[str, int]:
+        return {**self.local.stats(), "redis_hits": self.redis_hits, "deduplicated": self.single_flight.shared}
+
+    def _load(self, key: str, sql: str, tables: set[str], execute: Callable[[str], QueryResult]) -> QueryResult:
+        ttl = self.ttl_for(tables)
+        if (result := self._redis_get(key)) is not MISSING:
+            self.redis_hits += 1
+            self.local.set(key, result, ttl=ttl)
+            return result
+        result = execute(sql)
+        self.local.set(key, result, ttl=ttl)
+        self._redis_set(key, result, ttl)
+        return result
+
+    def _redis_get(self, key: str) -> QueryResult | object:
+        if self.redis is None:
+            return MISSING
+        try:
+            if (value := self.redis.get(self.REDIS_PREFIX + key)) is not None:
+                return QueryResult.from_dict(json.loads(value))
+        except (redis.RedisError, ValueError, KeyError) as e:
+            LOGGER.warning(f"Failed to read query cache entry from Redis: {e}")
+        return MISSING
+
+    def _redis_set(self, key: str, result: QueryResult, ttl: int) -> None:
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(self.REDIS_PREFIX + key, json.dumps(result.to_dict()), ex=ttl)
+        except (redis.RedisError, TypeError) as e:
+            LOGGER.warning(f"Failed to write query cache entry to Redis: {e}")
+
+
+QUERY_CACHE = QueryCache()
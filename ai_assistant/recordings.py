@@ -0,0 +1,455 @@
+import asyncio
+import builtins
+import functools
+import hashlib
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from contextlib import closing
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, AsyncGenerator, ClassVar, Generator
+
+from smolagents import ChatMessage, Model, Tool
+from smolagents.models import MessageRole
+from smolagents.monitoring import TokenUsage
+
+from ai_assistant.memory_codec import decode, encode
+from ai_assistant.results import QueryResult
+from ai_assistant.streaming import dumps
+
+LOGGER = logging.getLogger(__name__)
+
+RECORDING_VERSION = 1
+_RECORDING_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def encode_value(value: Any) -> Any:
+    """
+    Converts a tool result to JSON, query results are tagged so they are restored as such.
+    """
+    if isinstance(value, QueryResult):
+        return {"$query_result": value.to_dict()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): encode_value(v) for k, v in value.items()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def decode_value(value: Any) -> Any:
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    if isinstance(value, dict):
+        if len(value) == 1 and "$query_result" in value:
+            return QueryResult.from_dict(value["$query_result"])
+        return {k: decode_value(v) for k, v in value.items()}
+    return value
+
+
+def _text(message) -> str:
+    content = message.content if isinstance(message, ChatMessage) else message["content"]
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content)
+    return content or ""
+
+
+def _role(message) -> str:
+    role = message.role if isinstance(message, ChatMessage) else message["role"]
+    return getattr(role, "value", role)
+
+
+def messages_digest(messages) -> str:
+    """
+    Short fingerprint of the model input, recordings keep it instead of the input itself, which repeats the system
+    prompt and all earlier steps on every call.
+    """
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{_role(message)}\n{_text(message)}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(" ".join(prompt.lower().split()).encode()).hexdigest()[:16]
+
+
+class Recording:
+    """
+    One agent session: its request, the SSE events it streamed and the model and tool calls it made, each with its
+    offset from the start of the session and its duration.
+    """
+
+    def __init__(
+        self,
+        prompt: str,
+        model: str | None = None,
+        memory_id: Any = None,
+        protocol: str = "full",
+        encoding: str = "json",
+        recording_id: str | None = None,
+        started_at: float | None = None,
+    ):
+        self.id = recording_id or uuid.uuid4().hex
+        self.prompt = prompt
+        self.model = model
+        self.memory_id = str(memory_id) if memory_id else None
+        self.protocol = protocol
+        self.encoding = encoding
+        self.started_at = time.time() if started_at is None else started_at
+        self.started = time.perf_counter()
+        self.events: list[tuple[float, str]] = []
+        self.model_calls: list[dict[str, Any]] = []
+        self.tool_calls: list[dict[str, Any]] = []
+
+    def offset(self) -> float:
+        return round(time.perf_counter() - self.started, 4)
+
+    @property
+    def duration(self) -> float:
+        return self.events[-1][0] if self.events else 0.0
+
+    def add_model_call(self, at: float, duration: float, messages, message: ChatMessage) -> None:
+        usage = message.token_usage
+        self.model_calls.append(
+            {
+                "at": at,
+                "duration": round(duration, 4),
+                "input": messages_digest(messages),
+                "content": _text(message),
+                "tokens": [usage.input_tokens, usage.output_tokens] if usage else None,
+            }
+        )
+
+    def add_tool_call(
+        self, at: float, duration: float, tool: str, arguments: dict[str, Any], result: Any = None, error=None
+    ) -> None:
+        call = {"at": at, "duration": round(duration, 4), "tool": tool, "arguments": encode_value(arguments)}
+        if error is not None:
+            call.update(error=str(error), error_type=type(error).__name__)
+        else:
+            call["result"] = encode_value(result)
+        self.tool_calls.append(call)
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "prompt": self.prompt,
+            "model": self.model,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "events": len(self.events),
+            "model_calls": len(self.model_calls),
+            "tool_calls": len(self.tool_calls),
+        }
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "v": RECORDING_VERSION,
+            "id": self.id,
+            "prompt": self.prompt,
+            "model": self.model,
+            "memory_id": self.memory_id,
+            "protocol": self.protocol,
+            "encoding": self.encoding,
+            "started_at": self.started_at,
+            "events": self.events,
+            "model_calls": self.model_calls,
+            "tool_calls": self.tool_calls,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Recording":
+        if data.get("v") != RECORDING_VERSION:
+            raise ValueError(f"Unsupported recording version {data.get('v')}")
+        recording = cls(
+            data["prompt"],
+            data["model"],
+            data["memory_id"],
+            data["protocol"],
+            data["encoding"],
+            data["id"],
+            data["started_at"],
+        )
+        recording.events = [(at, event) for at, event in data["events"]]
+        recording.model_calls = data["model_calls"]
+        recording.tool_calls = data["tool_calls"]
+        return recording
+
+
+CURRENT_RECORDING: ContextVar[Recording | None] = ContextVar("current_recording", default=None)
+
+
+class Substitution:
+    """
+    Answers the model and tool calls of a re-executed session with the responses of its recording, after their
+    recorded duration divided by `speed`, or right away with a speed of 0.
+
+    Model calls are answered in order. Tool calls are matched by tool and arguments, falling back to the next recorded
+    call of the same tool. Inputs that differ from the recording are counted, as the run then no longer follows it.
+    """
+
+    def __init__(self, recording: Recording, speed: float = 1.0):
+        self.recording = recording
+        self.speed = speed
+        self.model_calls = list(recording.model_calls)
+        self.tool_calls: dict[str, list[dict[str, Any]]] = {}
+        for call in recording.tool_calls:
+            self.tool_calls.setdefault(call["tool"], []).append(call)
+        self.delayed = 0.0
+        self.model_mismatches = 0
+        self.tool_mismatches = 0
+        self.missing = 0
+        self._lock = threading.Lock()
+
+    def model_call(self, messages) -> ChatMessage:
+        with self._lock:
+            if not self.model_calls:
+                self.missing += 1
+                raise LookupError("No recorded model call left")
+            call = self.model_calls.pop(0)
+            if call["input"] != messages_digest(messages):
+                self.model_mismatches += 1
+        self._wait(call["duration"])
+        return ChatMessage(
+            role=MessageRole.ASSISTANT,
+            content=call["content"],
+            token_usage=TokenUsage(*call["tokens"]) if call["tokens"] else None,
+        )
+
+    def tool_call(self, tool: str, arguments: dict[str, Any]) -> Any:
+        arguments = encode_value(arguments)
+        with self._lock:
+            calls = self.tool_calls.get(tool, [])
+            call = next((call for call in calls if call["arguments"] == arguments), None)
+            if call is None and calls:
+                call = calls[0]
+                self.tool_mismatches += 1
+            if call is None:
+                self.missing += 1
+                raise LookupError(f"No recorded call of {tool} left")
+            calls.remove(call)
+        self._wait(call["duration"])
+        if "error" in call:
+            error_type = getattr(builtins, call["error_type"], Exception)
+            if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+                error_type = Exception
+            raise error_type(call["error"])
+        return decode_value(call["result"])
+
+    def summary(self, elapsed: float) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "recording_id": self.recording.id,
+                "speed": self.speed,
+                "elapsed": round(elapsed, 4),
+                "upstream": round(self.delayed, 4),
+                "overhead": round(elapsed - self.delayed, 4),
+                "model_mismatches": self.model_mismatches,
+                "tool_mismatches": self.tool_mismatches,
+                "missing": self.missing,
+            }
+
+    def _wait(self, duration: float) -> None:
+        if self.speed <= 0:
+            return
+        delay = duration / self.speed
+        time.sleep(delay)
+        with self._lock:
+            self.delayed += delay
+
+
+CURRENT_SUBSTITUTION: ContextVar[Substitution | None] = ContextVar("current_substitution", default=None)
+# Tools called by other tools, like search_steam_profiles, are part of the outer call.
+_IN_TOOL: ContextVar[bool] = ContextVar("in_recorded_tool", default=False)
+
+
+def recorded_model(model: Model) -> Model:
+    generate = model.generate
+
+    @functools.wraps(generate)
+    def recorded_generate(messages, *args, **kwargs):
+        if (substitution := CURRENT_SUBSTITUTION.get()) is not None:
+            return substitution.model_call(messages)
+        if (recording := CURRENT_RECORDING.get()) is None:
+            return generate(messages, *args, **kwargs)
+        at, started = recording.offset(), time.perf_counter()
+        message = generate(messages, *args, **kwargs)
+        recording.add_model_call(at, time.perf_counter() - started, messages, message)
+        return message
+
+    model.generate = recorded_generate
+    return model
+
+
+def recorded_tool(tool: Tool) -> Tool:
+    forward = tool.forward
+    names = list(tool.inputs)
+
+    @functools.wraps(forward)
+    def recorded_forward(*args, **kwargs):
+        substitution, recording = CURRENT_SUBSTITUTION.get(), CURRENT_RECORDING.get()
+        if _IN_TOOL.get() or (substitution is None and recording is None):
+            return forward(*args, **kwargs)
+        arguments = {**dict(zip(names, args)), **kwargs}
+        if substitution is not None:
+            return substitution.tool_call(tool.name, arguments)
+        at, started = recording.offset(), time.perf_counter()
+        token = _IN_TOOL.set(True)
+        try:
+            result = forward(*args, **kwargs)
+        except Exception as e:
+            recording.add_tool_call(at, time.perf_counter() - started, tool.name, arguments, error=e)
+            raise
+        finally:
+            _IN_TOOL.reset(token)
+        recording.add_tool_call(at, time.perf_counter() - started, tool.name, arguments, result=result)
+        return result
+
+    tool.forward = recorded_forward
+    return tool
+
+
+def substituted(
+    recording: Recording, events: Generator[str, None, None], speed: float = 1.0
+) -> Generator[str, None, None]:
+    """
+    Passes the events of a re-executed session through while its model and tool calls are answered from the
+    recording, then sends `event: replay` with the time spent in the server apart from the simulated upstream calls.
+    """
+    substitution = Substitution(recording, speed)
+    started = time.perf_counter()
+    token = CURRENT_SUBSTITUTION.set(substitution)
+    try:
+        with closing(events):
+            yield from events
+    finally:
+        CURRENT_SUBSTITUTION.reset(token)
+    yield f"event: replay\ndata: {dumps(substitution.summary(time.perf_counter() - started))}\n\n"
+
+
+async def recorded_events(recording: Recording, speed: float = 1.0) -> AsyncGenerator[str, None]:
+    """
+    Streams the events of a recording at their recorded offsets divided by `speed`, or all at once with a speed of 0.
+    """
+    started = time.perf_counter()
+    for at, event in recording.events:
+        if speed > 0 and (delay := at / speed - (time.perf_counter() - started)) > 0:
+            await asyncio.sleep(delay)
+        yield event
+
+
+class RecordingStore:
+    """
+    Records sampled agent sessions to compressed files, one per session, keeping the most recent `max_files`.
+
+    Files are named by a hash of the prompt and the recording id, so the latest recording of a prompt is found without
+    reading the others. Recordings hold prompts and answers of users, recording is off by default.
+    """
+
+    ENABLED: ClassVar[bool] = os.environ.get("RECORD_SESSIONS", "false").lower() in ("true", "1", "yes")
+    DIRECTORY: ClassVar[str] = os.environ.get(
+        "RECORDINGS_DIR", os.path.join(tempfile.gettempdir(), "ai_assistant_recordings")
+    )
+    SAMPLE_RATE: ClassVar[float] = float(os.environ.get("RECORDINGS_SAMPLE_RATE", 1.0))
+    MAX_FILES: ClassVar[int] = int(os.environ.get("RECORDINGS_MAX_FILES", 1000))
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        enabled: bool | None = None,
+        sample_rate: float | None = None,
+        max_files: int | None = None,
+    ):
+        self.directory = Path(directory or self.DIRECTORY)
+        self.enabled = self.ENABLED if enabled is None else enabled
+        self.sample_rate = self.SAMPLE_RATE if sample_rate is None else sample_rate
+        self.max_files = max_files or self.MAX_FILES
+        self.saved = 0
+
+    def sample(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def record(self, recording: Recording, events: Generator[str, None, None]) -> Generator[str, None, None]:
+        """
+        Passes the events through while recording them and the model and tool calls behind them. The recording is
+        saved once the stream ended, also with an error; streams that the client abandoned are dropped.
+        """
+        token = CURRENT_RECORDING.set(recording)
+        try:
+            with closing(events):
+                for event in events:
+                    recording.events.append((recording.offset(), event))
+                    yield event
+        finally:
+            CURRENT_RECORDING.reset(token)
+        self.save(recording)
+
+    def save(self, recording: Recording) -> None:
+        path = self.directory / f"{prompt_key(recording.prompt)}.{recording.id}.rec"
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(encode(recording.to_dict()))
+            os.replace(tmp_path, path)
+            self.saved += 1
+            self._prune()
+        except OSError as e:
+            LOGGER.warning(f"Failed to save recording {recording.id}: {e}")
+
+    def load(self, recording_id: str) -> Recording | None:
+        if not _RECORDING_ID.fullmatch(recording_id):
+            return None
+        path = next(self.directory.glob(f"*.{recording_id}.rec"), None)
+        return self._read(path) if path is not None else None
+
+    def find(self, prompt: str, model: str | None = None) -> Recording | None:
+        """
+        The latest recording of a prompt, of the given model if there is one.
+        """
+        for path in sorted(self._paths(f"{prompt_key(prompt)}.*.rec"), key=self._modified, reverse=True):
+            if (recording := self._read(path)) is not None and (model is None or recording.model == model):
+                return recording
+        return None
+
+    def summaries(self) -> list[dict[str, Any]]:
+        recordings = (self._read(path) for path in self._paths("*.rec"))
+        return sorted((r.summary() for r in recordings if r is not None), key=lambda s: s["started_at"])
+
+    def stats(self) -> dict[str, Any]:
+        return {"enabled": self.enabled, "sample_rate": self.sample_rate, "saved": self.saved}
+
+    def _paths(self, pattern: str) -> list[Path]:
+        return list(self.directory.glob(pattern)) if self.directory.is_dir() else []
+
+    @staticmethod
+    def _modified(path: Path) -> float:
+        try:
+            return path.stat().st_mtime
+        except OSError:
+            return 0.0
+
+    def _read(self, path: Path) -> Recording | None:
+        try:
+            return Recording.from_dict(decode(path.read_bytes()))
+        except (OSError, ValueError, KeyError, TypeError, zlib.error) as e:
+            LOGGER.warning(f"Failed to read recording {path.name}: {e}")
+            return None
+
+    def _prune(self) -> None:
+        paths = self._paths("*.rec")
+        if len(paths) <= self.max_files:
+            return
+        for path in sorted(paths, key=self._modified)[: len(paths) - self.max_files]:
+            path.unlink(missing_ok=True)
+
+
+RECORDINGS = RecordingStore()
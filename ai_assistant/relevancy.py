@@ -1,13 +1,21 @@
+import json
 import logging
 import os
+import threading
+from pathlib import Path
+from typing import ClassVar
 
 from google import genai
 from google.genai.types import GenerateContentConfig
 
+from ai_assistant.cache import TTLCache
 from ai_assistant.configs import DEFAULT_LIGHT_MODEL
+from ai_assistant.entities import ENTITY_INDEX, normalize_name
 
 LOGGER = logging.getLogger(__name__)
 
+LEXICON_PATH = os.environ.get("RELEVANCY_LEXICON_PATH", str(Path(__file__).parent / "data" / "relevancy_lexicon.json"))
+
 RELEVANCY_SYSTEM_PROMPT = """You are a relevancy checker for a Deadlock game assistant.
 
 Deadlock is a 6v6 team-based third-person shooter and MOBA where:
@@ -34,42 +42,136 @@ Respond with ONLY "NO" if the prompt is about:
 Be strict - only accept prompts that could potentially be about Deadlock."""
 
 
+IRRELEVANT_PROMPT_MESSAGE = (
+    "This assistant only handles Deadlock game-related questions. "
+    "Please ask about Deadlock gameplay, heroes, items, statistics, or other game-related topics."
+)
+
+
+class LexicalRelevancyModel:
+    """
+    Weighted keyword model that decides obvious prompts locally.
+
+    Every known term found in the normalized prompt adds its weight, names of heroes and items from the entity index
+    count as positive terms once the index is loaded. Scores between the two thresholds are left undecided.
+    """
+
+    ENTITY_WEIGHT: ClassVar[float] = 1.0
+
+    def __init__(self, path: str = LEXICON_PATH):
+        lexicon = json.loads(Path(path).read_text())
+        self.terms = {normalize_name(term): weight for term, weight in lexicon["terms"].items()}
+        self.yes_threshold = lexicon["yes_threshold"]
+        self.no_threshold = lexicon["no_threshold"]
+
+    def score(self, prompt: str) -> float:
+        text = f" {normalize_name(prompt)} "
+        score = sum(weight for term, weight in self.terms.items() if f" {term} " in text)
+        for kind in ("hero", "item"):
+            for name in ENTITY_INDEX.names(kind):
+                if len(name) >= 3 and name not in self.terms and f" {name} " in text:
+                    score += self.ENTITY_WEIGHT
+        return score
+
+    def verdict(self, prompt: str) -> bool | None:
+        score = self.score(prompt)
+        if score >= self.yes_threshold:
+            return True
+        if score <= self.no_threshold:
+            return False
+        return None
+
+
 class RelevancyChecker:
+    """
+    Tiered relevancy check: the local lexical model answers obvious prompts, previous LLM verdicts are cached by
+    normalized prompt, and only the remaining ambiguous prompts are sent to the light model.
+
+    A check that fails accepts the prompt, whether it is awaited or runs speculatively alongside the agent.
+    """
+
+    CACHE_TTL: ClassVar[int] = int(os.environ.get("RELEVANCY_CACHE_TTL", 24 * 60 * 60))
+    CACHE_SIZE: ClassVar[int] = int(os.environ.get("RELEVANCY_CACHE_SIZE", 10_000))
+
     def __init__(self):
         self.model_id = os.environ.get("LIGHT_MODEL", DEFAULT_LIGHT_MODEL)
         self.client = genai.Client()
+        self.lexical_model = LexicalRelevancyModel()
+        self.cache = TTLCache(max_entries=self.CACHE_SIZE, ttl=self.CACHE_TTL)
+        self.tier_counts = {"local": 0, "cache": 0, "llm": 0}
+        # Checks run on the agent and setup threads as well as on the event loop.
+        self._counts_lock = threading.Lock()
+        self.config = GenerateContentConfig(
+            max_output_tokens=1,
+            temperature=0.0,
+            response_mime_type="text/x.enum",
+            response_schema={
+                "type": "string",
+                "enum": ["YES", "NO"],
+            },
+        )
 
     def is_relevant(self, prompt: str) -> bool:
         try:
+            if (verdict := self.fast_verdict(prompt)) is not None:
+                return verdict
             if not os.environ.get("GEMINI_API_KEY"):
                 LOGGER.warning("GEMINI_API_KEY not set, will not run relevancy check")
                 return True
-
-            full_prompt = (
-                f"{RELEVANCY_SYSTEM_PROMPT}\n\nUser prompt: {prompt}\n\nRespond with exactly one word: YES or NO"
-            )
-
             response = self.client.models.generate_content(
-                model=self.model_id,
-                contents=full_prompt,
-                config=GenerateContentConfig(
-                    max_output_tokens=1,
-                    temperature=0.0,
-                    response_mime_type="text/x.enum",
-                    response_schema={
-                        "type": "string",
-                        "enum": ["YES", "NO"],
-                    },
-                ),
+                model=self.model_id, contents=self._llm_prompt(prompt), config=self.config
             )
+            return self._llm_verdict(prompt, response.text)
+        except Exception as e:
+            LOGGER.error(f"Error during relevancy check, accepting the prompt: {e}")
+            return True
 
-            result = response.text.strip().upper()
-            LOGGER.info(f"Light model ({self.model_id}) relevancy check: '{prompt[:100]}...' -> {result}")
-            return result == "YES"
+    async def is_relevant_async(self, prompt: str) -> bool:
+        try:
+            if (verdict := self.fast_verdict(prompt)) is not None:
+                return verdict
+            if not os.environ.get("GEMINI_API_KEY"):
+                LOGGER.warning("GEMINI_API_KEY not set, will not run relevancy check")
+                return True
+            response = await self.client.aio.models.generate_content(
+                model=self.model_id, contents=self._llm_prompt(prompt), config=self.config
+            )
+            return self._llm_verdict(prompt, response.text)
         except Exception as e:
-            LOGGER.error(f"Error during light model relevancy check: {e}")
+            LOGGER.error(f"Error during relevancy check, accepting the prompt: {e}")
             return True
 
+    def fast_verdict(self, prompt: str) -> bool | None:
+        if (verdict := self.lexical_model.verdict(prompt)) is not None:
+            self._count("local")
+            LOGGER.info(f"Local relevancy check: '{prompt[:100]}...' -> {verdict}")
+            return verdict
+        if (verdict := self.cache.get(normalize_name(prompt))) is not None:
+            self._count("cache")
+            return verdict
+        return None
+
+    def stats(self) -> dict[str, int]:
+        with self._counts_lock:
+            counts = dict(self.tier_counts)
+        return {**counts, "cache_entries": len(self.cache)}
+
+    def _count(self, tier: str) -> None:
+        with self._counts_lock:
+            self.tier_counts[tier] += 1
+
+    @staticmethod
+    def _llm_prompt(prompt: str) -> str:
+        return f"{RELEVANCY_SYSTEM_PROMPT}\n\nUser prompt: {prompt}\n\nRespond with exactly one word: YES or NO"
+
+    def _llm_verdict(self, prompt: str, text: str | None) -> bool:
+        result = (text or "").strip().upper()
+        LOGGER.info(f"Light model ({self.model_id}) relevancy check: '{prompt[:100]}...' -> {result}")
+        self._count("llm")
+        if result in ("YES", "NO"):
+            self.cache.set(normalize_name(prompt), result == "YES")
+        return result == "YES"
+
 
 if __name__ == "__main__":
     checker = RelevancyChecker()
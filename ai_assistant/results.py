@@ -0,0 +1,176 @@
+import codecs
+import itertools
+import json
+import os
+import re
+from array import array
+from typing import Any, ClassVar, Iterable, Iterator
+
+_DECODER = json.JSONDecoder()
+_SEPARATORS = re.compile(r"[\s,]*")
+
+
+# Python type of the values of each array typecode, a value of another type turns the column into a list.
+_ARRAY_TYPES = {"q": int, "d": float}
+
+
+def _new_column(value: Any) -> array | list:
+    if type(value) is int and -(2**63) <= value < 2**63:
+        return array("q")
+    if type(value) is float:
+        return array("d")
+    return []
+
+
+def _pack(values: list) -> array | list:
+    column = _new_column(values[0]) if values else []
+    if isinstance(column, array) and any(type(value) is not _ARRAY_TYPES[column.typecode] for value in values):
+        return values
+    try:
+        column.extend(values)
+    except (TypeError, OverflowError):
+        return values
+    return column
+
+
+class QueryResult:
+    """
+    Columnar ClickHouse query result: column names are stored once and numeric columns are packed into typed arrays.
+
+    Indexing with an int returns a row as dict, indexing with a column name returns that column, and iterating yields
+    row dicts, so code written against a list of dicts keeps working. Printing shows a compact summary instead of
+    every row.
+    """
+
+    MAX_ROWS: ClassVar[int] = int(os.environ.get("QUERY_MAX_ROWS", 100_000))
+    SUMMARY_ROWS: ClassVar[int] = int(os.environ.get("QUERY_SUMMARY_ROWS", 20))
+
+    def __init__(self, columns: list[str], data: dict[str, array | list], total_rows: int | None = None):
+        self.columns = columns
+        self.data = data
+        self.num_rows = len(data[columns[0]]) if columns else 0
+        self.total_rows = self.num_rows if total_rows is None else total_rows
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_rows > self.num_rows
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict[str, Any]], max_rows: int | None = None) -> "QueryResult":
+        max_rows = cls.MAX_ROWS if max_rows is None else max_rows
+        columns: list[str] = []
+        data: dict[str, array | list] = {}
+        total_rows = 0
+        for row in rows:
+            total_rows += 1
+            if total_rows > max_rows:
+                continue
+            if not columns:
+                columns = list(row)
+                data = {column: _new_column(row[column]) for column in columns}
+            for column in columns:
+                values, value = data[column], row.get(column)
+                # Arrays would quietly turn ints into floats, or bools into ints.
+                if isinstance(values, array) and type(value) is not _ARRAY_TYPES[values.typecode]:
+                    values = data[column] = values.tolist()
+                try:
+                    values.append(value)
+                except (TypeError, OverflowError):
+                    values = data[column] = values.tolist()
+                    values.append(value)
+        return cls(columns, data, total_rows)
+
+    @classmethod
+    def from_json_chunks(cls, chunks: Iterable[bytes], max_rows: int | None = None) -> "QueryResult":
+        return cls.from_rows(iter_json_array(chunks), max_rows)
+
+    @classmethod
+    def from_dict(cls, value: dict[str, Any]) -> "QueryResult":
+        data = {column: _pack(values) for column, values in zip(value["columns"], value["data"])}
+        return cls(value["columns"], data, value["total_rows"])
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "columns": self.columns,
+            "data": [list(self.data[c]) for c in self.columns],
+            "total_rows": self.total_rows,
+        }
+
+    def row(self, index: int) -> dict[str, Any]:
+        return {column: self.data[column][index] for column in self.columns}
+
+    def rows(self) -> list[dict[str, Any]]:
+        return list(self)
+
+    def column(self, name: str) -> list:
+        return list(self.data[name])
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        columns = [self.data[column] for column in self.columns]
+        for values in zip(*columns):
+            yield dict(zip(self.columns, values))
+
+    def __getitem__(self, key: int | slice | str):
+        if isinstance(key, str):
+            return self.column(key)
+        if isinstance(key, slice):
+            return [self.row(i) for i in range(*key.indices(self.num_rows))]
+        if key < 0:
+            key += self.num_rows
+        if not 0 <= key < self.num_rows:
+            raise IndexError("QueryResult index out of range")
+        return self.row(key)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, QueryResult):
+            return self.columns == other.columns and self.rows() == other.rows()
+        if isinstance(other, list):
+            return self.rows() == other
+        return NotImplemented
+
+    def __str__(self) -> str:
+        shown = min(self.num_rows, self.SUMMARY_ROWS)
+        lines = [f"QueryResult: {self.num_rows} rows x {len(self.columns)} columns", " | ".join(self.columns)]
+        lines += [" | ".join(str(self.data[c][i]) for c in self.columns) for i in range(shown)]
+        if shown < self.num_rows:
+            lines.append(f"... {self.num_rows - shown} more rows, iterate or index the result to access them")
+        if self.truncated:
+            lines.append(f"Result truncated to {self.num_rows} of {self.total_rows} rows, aggregate in SQL instead")
+        return "\n".join(lines)
+
+    __repr__ = __str__
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Incrementally parses a top-level JSON array, yielding its elements while the response is still being received.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer, position, started = "", 0, False
+    for chunk in itertools.chain(chunks, [None]):
+        final = chunk is None
+        buffer = buffer[position:] + decoder.decode(chunk or b"", final=final)
+        position = 0
+        while (position := _SEPARATORS.match(buffer, position).end()) < len(buffer):
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError(f"Expected a JSON array, got {buffer[position : position + 100]!r}")
+                started, position = True, position + 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                value, end = _DECODER.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break
+            if end == len(buffer) and not final:
+                # A number at the end of the buffer might continue in the next chunk.
+                break
+            yield value
+            position = end
+    raise ValueError("Unexpected end of JSON array")
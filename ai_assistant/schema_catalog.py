@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import ClassVar
+
+from ai_assistant.utils import format_schema, list_clickhouse_tables, schema
+
+LOGGER = logging.getLogger(__name__)
+
+
+class SchemaCatalog:
+    """
+    Lazily loaded view of the ClickHouse table schemas.
+
+    Schemas are read from an on-disk snapshot when available, so workers can start without touching the SQL API.
+    Once the data is older than the TTL it is refreshed in a background thread, fetching all tables concurrently.
+    """
+
+    SNAPSHOT_VERSION: ClassVar[int] = 1
+
+    SNAPSHOT_PATH: ClassVar[str] = os.environ.get(
+        "SCHEMA_SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "ai_assistant_schema.json")
+    )
+    TTL: ClassVar[int] = int(os.environ.get("SCHEMA_TTL", 6 * 60 * 60))
+    FETCH_WORKERS: ClassVar[int] = int(os.environ.get("SCHEMA_FETCH_WORKERS", 8))
+
+    def __init__(self, snapshot_path: str | None = None, ttl: int | None = None, fetch_workers: int | None = None):
+        self.snapshot_path = Path(snapshot_path or self.SNAPSHOT_PATH)
+        self.ttl = self.TTL if ttl is None else ttl
+        self.fetch_workers = fetch_workers or self.FETCH_WORKERS
+        self._schemas: dict[str, dict[str, str]] | None = None
+        self._fetched_at = 0.0
+        self._context: tuple[dict[str, dict[str, str]], str] | None = None
+        self._lock = threading.Lock()
+        self._refresh_thread: threading.Thread | None = None
+
+    @property
+    def is_stale(self) -> bool:
+        return time.time() - self._fetched_at > self.ttl
+
+    def schemas(self) -> dict[str, dict[str, str]]:
+        if self._schemas is None:
+            with self._lock:
+                if self._schemas is None:
+                    self._load()
+        if self.is_stale:
+            self._refresh_in_background()
+        return self._schemas or {}
+
+    def tables(self) -> list[str]:
+        return list(self.schemas())
+
+    def table_schema(self, table: str) -> dict[str, str] | None:
+        return self.schemas().get(table)
+
+    def context(self) -> str:
+        schemas = self.schemas()
+        if self._context is None or self._context[0] is not schemas:
+            self._context = (schemas, "\n\n".join(format_schema(t, c) for t, c in schemas.items()))
+        return self._context[1]
+
+    def refresh(self) -> None:
+        schemas = self.fetch()
+        fetched_at = time.time()
+        self._set(schemas, fetched_at)
+        self._save_snapshot(schemas, fetched_at)
+
+    def warm(self) -> None:
+        """
+        Loads the schemas and refreshes them right away if they are stale, so processes started afterwards find a fresh
+        snapshot.
+        """
+        if self._schemas is None and (snapshot := self._load_snapshot()):
+            self._set(snapshot["tables"], snapshot["fetched_at"])
+        if self.is_stale:
+            try:
+                self.refresh()
+            except Exception as e:
+                LOGGER.error(f"Failed to fetch ClickHouse schemas: {e}")
+
+    def fetch(self) -> dict[str, dict[str, str]]:
+        tables = list_clickhouse_tables()
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as pool:
+            return dict(zip(tables, pool.map(schema, tables)))
+
+    def _set(self, schemas: dict[str, dict[str, str]], fetched_at: float) -> None:
+        self._schemas = schemas
+        self._fetched_at = fetched_at
+
+    def _load(self) -> None:
+        if snapshot := self._load_snapshot():
+            LOGGER.info(f"Loaded schema snapshot with {len(snapshot['tables'])} tables from {self.snapshot_path}")
+            self._set(snapshot["tables"], snapshot["fetched_at"])
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            LOGGER.error(f"Failed to fetch ClickHouse schemas, retrying in background: {e}")
+            self._set({}, 0.0)
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self._background_refresh, daemon=True)
+            self._refresh_thread.start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+            LOGGER.info("Refreshed ClickHouse schemas")
+        except Exception as e:
+            LOGGER.warning(f"Background schema refresh failed, keeping previous schemas: {e}")
+
+    def _load_snapshot(self) -> dict | None:
+        try:
+            snapshot = json.loads(self.snapshot_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if snapshot.get("version") != self.SNAPSHOT_VERSION:
+            LOGGER.info(f"Ignoring schema snapshot with version {snapshot.get('version')}")
+            return None
+        return snapshot
+
+    def _save_snapshot(self, schemas: dict[str, dict[str, str]], fetched_at: float) -> None:
+        snapshot = {"version": self.SNAPSHOT_VERSION, "fetched_at": fetched_at, "tables": schemas}
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.snapshot_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(snapshot))
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            LOGGER.warning(f"Failed to write schema snapshot to {self.snapshot_path}: {e}")
+
+
+if __name__ == "__main__":
+    catalog = SchemaCatalog()
+    catalog.refresh()
+    print(f"Wrote {len(catalog.tables())} table schemas to {catalog.snapshot_path}")
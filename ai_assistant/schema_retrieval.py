@@ -0,0 +1,122 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+from pathlib import Path
+from typing import ClassVar
+
+from ai_assistant.schema_catalog import SchemaCatalog
+from ai_assistant.utils import format_schema
+
+LOGGER = logging.getLogger(__name__)
+
+KEYWORDS_PATH = os.environ.get("SCHEMA_KEYWORDS_PATH", str(Path(__file__).parent / "data" / "schema_keywords.json"))
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+TABLE_NAME_WEIGHT = 3.0
+KEYWORD_WEIGHT = 2.0
+COLUMN_WEIGHT = 1.0
+
+
+def tokenize(text: str) -> set[str]:
+    return {token[:-1] if len(token) > 3 and token.endswith("s") else token for token in _TOKEN.findall(text.lower())}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+class SchemaRetriever:
+    """
+    Picks the table schemas that are relevant for a prompt, so the instructions only describe a few tables instead of
+    all of them.
+
+    Tables are indexed by the words in their name, their columns and hand-written keywords, and ranked by the
+    IDF-weighted overlap with the prompt. Pinned tables are always included, all other tables are listed by name and
+    can be fetched by the agent with the `get_table_schemas` tool.
+    """
+
+    TOP_K: ClassVar[int] = int(os.environ.get("SCHEMA_TOP_K", 3))
+
+    def __init__(self, catalog: SchemaCatalog, top_k: int | None = None, keywords_path: str = KEYWORDS_PATH):
+        keywords = json.loads(Path(keywords_path).read_text())
+        self.catalog = catalog
+        self.top_k = self.TOP_K if top_k is None else top_k
+        self.pinned: list[str] = keywords["pinned"]
+        self.keywords: dict[str, list[str]] = keywords["tables"]
+        self.requests = 0
+        self.full_tokens = 0
+        self.sent_tokens = 0
+        self._index: tuple[dict, dict[str, dict[str, float]], dict[str, float]] | None = None
+        self._lock = threading.Lock()
+
+    def rank(self, prompt: str) -> list[tuple[str, float]]:
+        documents, idf = self._get_index()
+        tokens = tokenize(prompt)
+        scores = [
+            (table, sum(weights[token] * idf[token] for token in tokens if token in weights))
+            for table, weights in documents.items()
+        ]
+        return sorted((s for s in scores if s[1] > 0), key=lambda s: -s[1])
+
+    def retrieve(self, prompt: str) -> list[str]:
+        schemas = self.catalog.schemas()
+        tables = [table for table in self.pinned if table in schemas]
+        ranked = [table for table, _ in self.rank(prompt) if table not in tables]
+        return tables + ranked[: self.top_k]
+
+    def context(self, prompt: str) -> str:
+        schemas = self.catalog.schemas()
+        tables = self.retrieve(prompt)
+        others = [table for table in schemas if table not in tables]
+        context = "\n\n".join(format_schema(table, schemas[table]) for table in tables)
+        if others:
+            context += (
+                f"\n\nOther available tables, use `get_table_schemas` to look up their columns: {', '.join(others)}"
+            )
+
+        full_tokens, sent_tokens = estimate_tokens(self.catalog.context()), estimate_tokens(context)
+        with self._lock:
+            self.requests += 1
+            self.full_tokens += full_tokens
+            self.sent_tokens += sent_tokens
+        LOGGER.info(
+            f"Schema context with {len(tables)}/{len(schemas)} tables: ~{sent_tokens} tokens instead of ~{full_tokens}"
+        )
+        return context
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "requests": self.requests,
+            "full_tokens": self.full_tokens,
+            "sent_tokens": self.sent_tokens,
+            "saved_ratio": 1 - self.sent_tokens / self.full_tokens if self.full_tokens else 0.0,
+        }
+
+    def _get_index(self) -> tuple[dict[str, dict[str, float]], dict[str, float]]:
+        schemas = self.catalog.schemas()
+        index = self._index
+        if index is None or index[0] is not schemas:
+            index = self._index = (schemas, *self._build_index(schemas))
+        return index[1], index[2]
+
+    def _build_index(self, schemas: dict[str, dict[str, str]]) -> tuple[dict[str, dict[str, float]], dict[str, float]]:
+        documents = {}
+        for table, columns in schemas.items():
+            weights: dict[str, float] = {}
+            for text, weight in [
+                *((column, COLUMN_WEIGHT) for column in columns),
+                *((keyword, KEYWORD_WEIGHT) for keyword in self.keywords.get(table, [])),
+                (table, TABLE_NAME_WEIGHT),
+            ]:
+                for token in tokenize(text):
+                    weights[token] = max(weights.get(token, 0.0), weight)
+            documents[table] = weights
+        frequencies: dict[str, int] = {}
+        for weights in documents.values():
+            for token in weights:
+                frequencies[token] = frequencies.get(token, 0) + 1
+        idf = {token: math.log(1 + len(documents) / frequency) for token, frequency in frequencies.items()}
+        return documents, idf
@@ -0,0 +1,71 @@
+import argparse
+import logging
+import os
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from ai_assistant.configs import SCHEMA_CATALOG
+from ai_assistant.entities import ENTITY_INDEX
+
+LOGGER = logging.getLogger(__name__)
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    Uvicorn server that fails readiness checks and new agent runs as soon as it is asked to exit. Uvicorn then stops
+    accepting connections and waits up to the graceful shutdown timeout for the streams in flight to finish.
+    """
+
+    def handle_exit(self, sig, frame) -> None:
+        # Imported here, the app is loaded by the server itself, in the worker process.
+        from ai_assistant import api
+
+        api.drain()
+        super().handle_exit(sig, frame)
+
+
+def prepare() -> None:
+    """
+    Fetches the schemas and entities once before starting the workers, which then load them from the snapshots.
+    """
+    SCHEMA_CATALOG.warm()
+    ENTITY_INDEX.warm()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the AI Assistant API")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", 1)))
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=float(os.environ.get("DRAIN_TIMEOUT", 120)),
+        help="Seconds to let streams in flight finish on shutdown",
+    )
+    args = parser.parse_args()
+
+    # Workers are spawned, not forked, they read the worker count to pick message and observation stores shared
+    # between them.
+    os.environ["WEB_WORKERS"] = str(args.workers)
+    logging.basicConfig(level=logging.INFO)
+    prepare()
+
+    config = uvicorn.Config(
+        "ai_assistant.api:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.drain_timeout,
+    )
+    server = DrainingServer(config)
+    if args.workers > 1:
+        LOGGER.info(f"Starting {args.workers} workers")
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import difflib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import ClassVar, NamedTuple
+
+import sqlglot
+from sqlglot import exp
+
+from ai_assistant.configs import SCHEMA_CATALOG
+from ai_assistant.results import QueryResult
+from ai_assistant.schema_catalog import SchemaCatalog
+from ai_assistant.utils import EXCLUDED_TABLES
+
+LOGGER = logging.getLogger(__name__)
+
+HINTS_PATH = os.environ.get("SQL_TABLE_HINTS_PATH", str(Path(__file__).parent / "data" / "table_hints.json"))
+
+
+class QueryRejected(ValueError):
+    """
+    Raised for queries that are rejected before they are sent upstream, the message tells the agent how to fix them.
+    """
+
+
+class TableHint(NamedTuple):
+    rows: int
+    key_columns: tuple[str, ...]
+
+
+class QueryPlan(NamedTuple):
+    sql: str
+    tables: set[str]
+    estimated_rows: int
+    notes: list[str]
+
+
+def _suggest(name: str, candidates) -> str:
+    if matches := difflib.get_close_matches(name, list(candidates), n=3, cutoff=0.6):
+        return f"{name} (did you mean {', '.join(matches)}?)"
+    return name
+
+
+class SqlPlanner:
+    """
+    Local pre-flight stage for agent written SQL.
+
+    Queries are parsed once, checked against the cached table schemas, capped with a LIMIT and rejected when the
+    estimated scan is too large, so mistakes are reported to the agent without a round trip to the SQL API.
+    """
+
+    MAX_LIMIT: ClassVar[int] = int(os.environ.get("SQL_MAX_LIMIT", QueryResult.MAX_ROWS))
+    MAX_SCAN_ROWS: ClassVar[int] = int(os.environ.get("SQL_MAX_SCAN_ROWS", 500_000_000))
+
+    def __init__(
+        self,
+        catalog: SchemaCatalog,
+        hints_path: str = HINTS_PATH,
+        max_limit: int | None = None,
+        max_scan_rows: int | None = None,
+    ):
+        hints = json.loads(Path(hints_path).read_text())
+        self.catalog = catalog
+        self.default_rows = hints["default_rows"]
+        self.key_filter_selectivity = hints["key_filter_selectivity"]
+        self.hints = {
+            table: TableHint(hint["rows"], tuple(hint["key_columns"])) for table, hint in hints["tables"].items()
+        }
+        self.max_limit = max_limit or self.MAX_LIMIT
+        self.max_scan_rows = max_scan_rows or self.MAX_SCAN_ROWS
+        self.planned = 0
+        self.rejected = 0
+        self.limits_added = 0
+
+    def hint_for(self, table: str) -> TableHint:
+        return self.hints.get(table) or TableHint(self.default_rows, ())
+
+    def plan(self, sql: str) -> QueryPlan:
+        try:
+            plan = self._plan(sql)
+        except QueryRejected as e:
+            self.rejected += 1
+            LOGGER.info(f"Rejected query: {e}")
+            raise
+        self.planned += 1
+        return plan
+
+    def stats(self) -> dict[str, int]:
+        return {"planned": self.planned, "rejected": self.rejected, "limits_added": self.limits_added}
+
+    def _plan(self, sql: str) -> QueryPlan:
+        try:
+            expressions = [e for e in sqlglot.parse(sql) if e is not None]
+        except sqlglot.errors.ParseError as e:
+            error = e.errors[0] if e.errors else {}
+            raise QueryRejected(
+                f"Invalid SQL: {error.get('description', e)} at line {error.get('line')}, column {error.get('col')}, "
+                f"near {error.get('highlight')!r}."
+            ) from e
+        if len(expressions) != 1:
+            raise QueryRejected(f"Expected exactly one SQL statement, got {len(expressions)}.")
+        expression = expressions[0]
+        if not isinstance(expression, exp.Query):
+            raise QueryRejected("Only SELECT queries are allowed.")
+
+        cte_names = {cte.alias_or_name for cte in expression.find_all(exp.CTE)}
+        tables = {t.name for t in expression.find_all(exp.Table) if t.name and t.name not in cte_names}
+        self._check_tables(tables)
+        self._check_columns(expression, cte_names)
+
+        estimated_rows = self._estimate_rows(expression, cte_names)
+        if estimated_rows > self.max_scan_rows:
+            raise QueryRejected(
+                f"Query would scan about {estimated_rows:,} rows, the limit is {self.max_scan_rows:,}. "
+                f"Filter large tables on their key columns ({self._key_columns_hint(tables)}), for example "
+                "`match_id IN (SELECT match_id FROM match_info WHERE start_time > now() - INTERVAL 7 DAY)`."
+            )
+
+        expression, notes = self._apply_limit(expression)
+        return QueryPlan(expression.sql(dialect="clickhouse"), tables, estimated_rows, notes)
+
+    def _check_tables(self, tables: set[str]) -> None:
+        if excluded := sorted(tables & EXCLUDED_TABLES):
+            raise QueryRejected(f"Tables are not available: {', '.join(excluded)}.")
+        schemas = self.catalog.schemas()
+        if schemas and (unknown := sorted(t for t in tables if t not in schemas)):
+            raise QueryRejected(f"Unknown tables: {', '.join(_suggest(t, schemas) for t in unknown)}.")
+
+    def _check_columns(self, expression: exp.Query, cte_names: set[str]) -> None:
+        """
+        Checks column references against the schemas of the tables the query reads.
+
+        Names that the query defines itself (select aliases, lambda parameters, CTEs and subqueries) are accepted, and
+        ClickHouse nested columns like `items.item_id` are matched by their full dotted name.
+        """
+        schemas = self.catalog.schemas()
+        if not schemas:
+            return
+        sources: dict[str, str] = {}
+        for table in expression.find_all(exp.Table):
+            if table.name in schemas:
+                sources[table.alias_or_name] = table.name
+                sources.setdefault(table.name, table.name)
+        columns = {column for table in set(sources.values()) for column in schemas[table]}
+        defined = (
+            {alias.alias for alias in expression.find_all(exp.Alias)}
+            | {param.name for lambda_ in expression.find_all(exp.Lambda) for param in lambda_.expressions}
+            | {subquery.alias for subquery in expression.find_all(exp.Subquery) if subquery.alias}
+            | {table.alias_or_name for table in expression.find_all(exp.Table) if table.name in cte_names}
+            | cte_names
+        )
+
+        unknown = []
+        for column in expression.find_all(exp.Column):
+            if isinstance(column.this, exp.Star):
+                continue
+            parts = [part.name for part in column.parts]
+            name = ".".join(parts)
+            if len(parts) > 1 and parts[0] in sources:
+                if ".".join(parts[1:]) not in schemas[sources[parts[0]]]:
+                    unknown.append(_suggest(name, [f"{parts[0]}.{c}" for c in schemas[sources[parts[0]]]]))
+            elif parts[0] not in defined and name not in columns:
+                unknown.append(_suggest(name, columns))
+        if unknown:
+            hint = "" if all("did you mean" in u for u in unknown) else " String literals need single quotes."
+            raise QueryRejected(f"Unknown columns: {', '.join(unknown)}.{hint}")
+
+    def _estimate_rows(self, expression: exp.Query, cte_names: set[str]) -> int:
+        """
+        Estimates the rows read by summing a size hint over every table scan, scans filtered on one of the table's key
+        columns read only a fraction of it, and unfiltered scans that only need a LIMIT stop early.
+        """
+        total = 0
+        for select in expression.find_all(exp.Select):
+            sources = [select.args["from"].this] if select.args.get("from") else []
+            sources += [join.this for join in select.args.get("joins") or []]
+            for source in sources:
+                if not isinstance(source, exp.Table) or source.name in cte_names:
+                    continue
+                hint = self.hint_for(source.name)
+                rows = hint.rows
+                if self._filters_on_key(select, source, hint):
+                    rows = int(rows * self.key_filter_selectivity)
+                elif (limit := self._limit_value(select)) is not None and self._can_stop_early(select):
+                    rows = min(rows, limit)
+                total += rows
+        return total
+
+    def _filters_on_key(self, select: exp.Select, source: exp.Table, hint: TableHint) -> bool:
+        for clause in ("where", "prewhere"):
+            if condition := select.args.get(clause):
+                for column in condition.find_all(exp.Column):
+                    if column.name in hint.key_columns and column.table in ("", source.alias_or_name):
+                        return True
+        return False
+
+    @staticmethod
+    def _limit_value(select: exp.Query) -> int | None:
+        limit = select.args.get("limit")
+        value = limit.expression if limit is not None else None
+        return int(value.this) if isinstance(value, exp.Literal) and value.is_int else None
+
+    @staticmethod
+    def _can_stop_early(select: exp.Select) -> bool:
+        return not (
+            select.args.get("where")
+            or select.args.get("group")
+            or select.args.get("order")
+            or select.args.get("distinct")
+            or select.args.get("joins")
+            or any(e.find(exp.AggFunc) for e in select.expressions)
+        )
+
+    def _key_columns_hint(self, tables: set[str]) -> str:
+        return "; ".join(
+            f"{table}: {', '.join(self.hint_for(table).key_columns)}"
+            for table in sorted(tables, key=lambda t: -self.hint_for(t).rows)
+            if self.hint_for(table).key_columns
+        )
+
+    def _apply_limit(self, expression: exp.Query) -> tuple[exp.Query, list[str]]:
+        limit = self._limit_value(expression)
+        if limit is not None and limit <= self.max_limit:
+            return expression, []
+        if expression.args.get("limit") is not None and limit is None:
+            # Non-literal limits are left to the SQL API.
+            return expression, []
+        if isinstance(expression, exp.SetOperation) and limit is None:
+            # A LIMIT after a UNION would only apply to its last SELECT in ClickHouse.
+            expression = exp.select("*").from_(expression.subquery("_union"))
+        self.limits_added += 1
+        note = f"Capped LIMIT {limit} to {self.max_limit}" if limit is not None else f"Added LIMIT {self.max_limit}"
+        return expression.limit(self.max_limit, copy=False), [note]
+
+
+SQL_PLANNER = SqlPlanner(SCHEMA_CATALOG)
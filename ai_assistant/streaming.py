@@ -0,0 +1,185 @@
+import base64
+import logging
+import os
+import sqlite3
+import tempfile
+import uuid
+import zlib
+from typing import Any, ClassVar
+
+import orjson
+import redis
+from smolagents import ActionOutput, ActionStep, ChatMessageStreamDelta, FinalAnswerStep, PlanningStep
+
+from ai_assistant.cache import SqliteTTLStore, TTLCache
+from ai_assistant.message_store import RedisMessageStore
+
+LOGGER = logging.getLogger(__name__)
+
+PROTOCOLS = ("full", "lean")
+ENCODINGS = ("json", "deflate")
+
+
+def dumps(value: Any) -> str:
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def full_payload(step) -> dict[str, Any] | None:
+    """
+    The original step format: every message of a step, including the tool call that repeats its code.
+    """
+    if isinstance(step, ActionStep):
+        return {"type": "action", "data": [m.dict() for m in step.to_messages()]}
+    elif isinstance(step, ActionOutput):
+        return {
+            "type": "action_output",
+            "data": step.dict() if hasattr(step, "dict") else str(step),
+        }
+    elif isinstance(step, PlanningStep):
+        return {
+            "type": "planning",
+            "data": [m.dict() for m in step.to_messages()],
+        }
+    elif isinstance(step, ChatMessageStreamDelta):
+        return {"type": "delta", "data": {"content": step.content}}
+    elif isinstance(step, FinalAnswerStep):
+        return {"type": "final_answer", "data": step.output}
+    return None
+
+
+class ObservationStore:
+    """
+    Keeps full observations of streamed steps whose events only carry a truncated preview, so clients can fetch them.
+
+    The fetch can land on any worker, so like the message store, observations are shared through Redis if it is
+    configured, or a local SQLite file with multiple workers. Each worker also keeps the ones it streamed in memory.
+    """
+
+    MAX_CHARS: ClassVar[int] = int(os.environ.get("STREAM_OBSERVATION_CHARS", 2000))
+    TTL: ClassVar[int] = int(os.environ.get("OBSERVATION_TTL", 60 * 60))
+    MAX_BYTES: ClassVar[int] = int(os.environ.get("OBSERVATION_STORE_MAX_BYTES", 64 * 1024 * 1024))
+    PATH: ClassVar[str] = os.environ.get(
+        "OBSERVATION_STORE_PATH", os.path.join(tempfile.gettempdir(), "ai_assistant_observations.sqlite3")
+    )
+    REDIS_PREFIX: ClassVar[str] = "observation:"
+
+    def __init__(self, max_chars: int | None = None, use_redis: bool | None = None, path: str | None = None):
+        self.max_chars = max_chars or self.MAX_CHARS
+        self.cache = TTLCache(max_entries=10_000, ttl=self.TTL, max_bytes=self.MAX_BYTES, sizer=len)
+        if use_redis is None:
+            use_redis = "REDIS_HOST" in os.environ
+        self.redis = (
+            redis.Redis(host=RedisMessageStore.HOST, port=RedisMessageStore.PORT, password=RedisMessageStore.PASS)
+            if use_redis
+            else None
+        )
+        if path is None and not use_redis and int(os.environ.get("WEB_WORKERS", 1)) > 1:
+            path = self.PATH
+        self.shared = SqliteTTLStore(path, "observations") if path is not None else None
+
+    def preview(self, observations: str) -> tuple[str, str | None]:
+        if len(observations) <= self.max_chars:
+            return observations, None
+        observation_id = uuid.uuid4().hex
+        self.cache.set(observation_id, observations)
+        self._store_shared(observation_id, observations)
+        return (
+            f"{observations[: self.max_chars]}\n... [{len(observations) - self.max_chars} more characters]",
+            observation_id,
+        )
+
+    def get(self, observation_id: str) -> str | None:
+        if (observations := self.cache.get(observation_id)) is not None:
+            return observations
+        return self._get_shared(observation_id)
+
+    def stats(self) -> dict[str, int]:
+        return self.cache.stats()
+
+    def _store_shared(self, observation_id: str, observations: str) -> None:
+        try:
+            if self.redis is not None:
+                self.redis.set(self.REDIS_PREFIX + observation_id, observations, ex=self.TTL)
+            elif self.shared is not None:
+                self.shared.set(observation_id, observations, self.TTL)
+        except (redis.RedisError, sqlite3.Error) as e:
+            LOGGER.warning(f"Failed to share observation {observation_id}: {e}")
+
+    def _get_shared(self, observation_id: str) -> str | None:
+        try:
+            if self.redis is not None:
+                value = self.redis.get(self.REDIS_PREFIX + observation_id)
+                return value.decode() if value is not None else None
+            if self.shared is not None:
+                return self.shared.get(observation_id)
+        except (redis.RedisError, sqlite3.Error) as e:
+            LOGGER.warning(f"Failed to read shared observation {observation_id}: {e}")
+        return None
+
+
+OBSERVATIONS = ObservationStore()
+
+
+class EventEncoder:
+    """
+    Formats the agent steps of one stream as server-sent events.
+
+    The `lean` protocol sends each step once with only its own content: no tool call message repeating the code, no
+    model output that was already streamed as deltas, no action outputs that the final answer repeats, and observations
+    cut to a preview that can be fetched in full by id. The `deflate` encoding compresses the step events of a stream
+    with one shared raw deflate context, flushed per event and base64 encoded, so later events reuse the vocabulary of
+    earlier ones; clients decode them with a single decompressor per stream.
+    """
+
+    def __init__(self, protocol: str = "full", encoding: str = "json", observations: ObservationStore = OBSERVATIONS):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown protocol {protocol}, expected one of {PROTOCOLS}")
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding {encoding}, expected one of {ENCODINGS}")
+        self.protocol = protocol
+        self.observations = observations
+        self.compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS) if encoding == "deflate" else None
+        self.streamed_deltas = False
+
+    def step(self, step) -> str | None:
+        payload = full_payload(step) if self.protocol == "full" else self.lean_payload(step)
+        return None if payload is None else self.event("agentStep", payload)
+
+    def event(self, name: str, payload: Any) -> str:
+        data = dumps(payload)
+        if self.compressor is not None:
+            compressed = self.compressor.compress(data.encode()) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+            data = base64.b64encode(compressed).decode()
+        return f"event: {name}\ndata: {data}\n\n"
+
+    def lean_payload(self, step) -> dict[str, Any] | None:
+        if isinstance(step, ChatMessageStreamDelta):
+            self.streamed_deltas = True
+            return {"type": "delta", "content": step.content}
+        if isinstance(step, ActionStep):
+            payload: dict[str, Any] = {"type": "action", "step": step.step_number}
+            if self.streamed_deltas:
+                payload["streamed"] = True
+            elif step.model_output is not None:
+                payload["model_output"] = step.model_output
+            if step.observations is not None:
+                payload["observation"], observation_id = self.observations.preview(step.observations)
+                if observation_id is not None:
+                    payload["observation_id"] = observation_id
+            if step.error is not None:
+                payload["error"] = str(step.error)
+            if step.timing.duration is not None:
+                payload["duration"] = round(step.timing.duration, 3)
+            self.streamed_deltas = False
+            return payload
+        if isinstance(step, PlanningStep):
+            payload = (
+                {"type": "planning", "streamed": True}
+                if self.streamed_deltas
+                else {"type": "planning", "plan": step.plan}
+            )
+            self.streamed_deltas = False
+            return payload
+        if isinstance(step, FinalAnswerStep):
+            return {"type": "final_answer", "data": step.output}
+        return None
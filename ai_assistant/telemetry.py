@@ -0,0 +1,205 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, NamedTuple
+
+from smolagents import Model, Tool
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _label_key(labels: dict[str, Any]) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.values: dict[tuple[tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self.values.items())
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"] + [
+            f"{self.name}{_format_labels(labels)} {value}" for labels, value in values
+        ]
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        # Per label set: cumulative count per bucket, then sum and count.
+        self.values: dict[tuple[tuple[str, str], ...], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            values = self.values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = [(labels, list(v)) for labels, v in self.values.items()]
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, v in values:
+            for bound, count in zip(self.buckets, v):
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', str(bound)),))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {v[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {v[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {v[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics registry rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, Counter | Gauge | Histogram] = {}
+
+    def register[M: Counter | Gauge | Histogram](self, metric: M) -> M:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics.values() for line in metric.render()) + "\n"
+
+
+METRICS = MetricsRegistry()
+SPAN_SECONDS = METRICS.register(
+    Histogram("ai_assistant_span_duration_seconds", "Duration of request phases, LLM calls and tool calls.")
+)
+SPAN_ERRORS = METRICS.register(Counter("ai_assistant_span_errors_total", "Request phases and calls that raised."))
+LLM_TOKENS = METRICS.register(Counter("ai_assistant_llm_tokens_total", "Tokens used by LLM calls."))
+
+
+class Span(NamedTuple):
+    name: str
+    start: float
+    duration: float
+    attributes: dict[str, Any]
+
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return {
+            "total": round(time.perf_counter() - self.started, 4),
+            "spans": [
+                {"name": s.name, "start": round(s.start, 4), "duration": round(s.duration, 4), **s.attributes}
+                for s in spans
+            ],
+        }
+
+
+CURRENT_TRACE: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def tracing() -> Iterator[Trace]:
+    trace = Trace()
+    token = CURRENT_TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        CURRENT_TRACE.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[dict[str, Any]]:
+    """
+    Times a block, records it in the histogram of its name and in the trace of the current request if there is one.
+
+    The yielded attributes can be extended inside the block and end up in the trace.
+    """
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except GeneratorExit:
+        attributes["cancelled"] = True
+        raise
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        SPAN_ERRORS.inc(span=name)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        SPAN_SECONDS.observe(duration, span=name)
+        if (trace := CURRENT_TRACE.get()) is not None:
+            trace.add(Span(name, start - trace.started, duration, attributes))
+
+
+def traced_tool(tool: Tool) -> Tool:
+    forward = tool.forward
+
+    @functools.wraps(forward)
+    def traced_forward(*args, **kwargs):
+        with span(f"tool.{tool.name}"):
+            return forward(*args, **kwargs)
+
+    tool.forward = traced_forward
+    return tool
+
+
+def traced_model(model: Model) -> Model:
+    generate = model.generate
+
+    @functools.wraps(generate)
+    def traced_generate(*args, **kwargs):
+        with span("llm", model=getattr(model, "model_id", None) or type(model).__name__) as attributes:
+            message = generate(*args, **kwargs)
+            if usage := message.token_usage:
+                attributes.update(input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+                LLM_TOKENS.inc(usage.input_tokens, direction="input")
+                LLM_TOKENS.inc(usage.output_tokens, direction="output")
+            return message
+
+    model.generate = traced_generate
+    return model
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from ai_assistant.admission import AdmissionController, AdmissionRejected, TokenBucket, parse_weights
+
+
+def controller(**kwargs) -> AdmissionController:
+    return AdmissionController(**{"rate": 0, "max_concurrency": 1, "max_queue": 8, "use_redis": False, **kwargs})
+
+
+def test_token_bucket_allows_bursts_then_limits_the_rate():
+    bucket = TokenBucket(rate=1, burst=3)
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert 0.9 < bucket.take() <= 1
+
+
+def test_rate_limit_is_per_key():
+    admission = controller(rate=0.01, burst=2, max_concurrency=10)
+    admission.submit("a")
+    admission.submit("a")
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.submit("a")
+    assert rejected.value.retry_after > 0
+    assert admission.submit("b").granted
+
+
+def test_full_queue_is_rejected():
+    admission = controller(max_queue=1)
+    assert admission.submit("a").granted
+    assert not admission.submit("a").granted
+    with pytest.raises(AdmissionRejected):
+        admission.submit("b")
+
+
+def test_fair_queuing_interleaves_keys_by_weight():
+    admission = controller(max_queue=16, weights={"heavy": 2})
+    running = admission.submit("busy")
+    queued = [admission.submit(key) for key in ["busy"] * 4 + ["quiet"] * 2 + ["heavy"] * 4]
+    order = []
+    for _ in queued:
+        admission.release(running)
+        running = next(ticket for ticket in queued if ticket.granted and not ticket.done)
+        order.append(running.key)
+    assert order[:6] == ["heavy", "busy", "quiet", "heavy", "heavy", "busy"]
+    assert sorted(order) == sorted(ticket.key for ticket in queued)
+
+
+def test_wait_reports_positions_until_admitted():
+    async def scenario():
+        admission = controller()
+        running = admission.submit("a")
+        first, second = admission.submit("b"), admission.submit("c")
+        positions = []
+
+        async def wait():
+            async for position in admission.wait(second):
+                positions.append(position)
+
+        waiting = asyncio.create_task(wait())
+        await asyncio.sleep(0)
+        admission.release(running)
+        await asyncio.sleep(0)
+        admission.release(first)
+        await waiting
+        return positions, second.granted, admission.stats()
+
+    positions, granted, stats = asyncio.run(scenario())
+    assert positions == [2, 1]
+    assert granted
+    assert stats["active"] == 1 and stats["queued"] == 0
+
+
+def test_wait_times_out_and_leaves_the_queue():
+    async def scenario():
+        admission = controller(queue_timeout=0.05)
+        admission.submit("a")
+        ticket = admission.submit("b")
+        with pytest.raises(TimeoutError):
+            async for _ in admission.wait(ticket):
+                pass
+        return admission.stats()
+
+    assert asyncio.run(scenario())["queued"] == 0
+
+
+def test_parse_weights():
+    assert parse_weights("a=2, b=0.5,") == {"a": 2.0, "b": 0.5}
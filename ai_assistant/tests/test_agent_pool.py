@@ -0,0 +1,62 @@
+import pytest
+
+from ai_assistant.agent_pool import AgentPool
+from ai_assistant.benchmarks.scripted_model import ScriptedModel
+from ai_assistant.tools import ALL_TOOLS
+
+TRAJECTORIES = {"task": ["<code>\nanswer = 42\nfinal_answer(answer)\n</code>"]}
+
+
+def make_pool(size: int = 2) -> AgentPool:
+    return AgentPool({"scripted": lambda: ScriptedModel(TRAJECTORIES)}, ALL_TOOLS, size=size)
+
+
+def test_agent_pool_reuses_and_resets_agents():
+    pool = make_pool()
+    with pool.agent("scripted") as agent:
+        agent.instructions = "Only answer questions about Deadlock."
+        assert agent.run("task") == 42
+        first = agent
+    assert len(first.memory.steps) == 0
+    assert first.instructions is None
+    assert "answer" not in first.python_executor.state
+    assert first.monitor.get_total_token_counts().input_tokens == 0
+
+    with pool.agent("scripted") as agent:
+        assert agent is first
+        assert agent.run("task") == 42
+    assert pool.stats()["created"] == 1
+    assert pool.stats()["reused"] == 1
+
+
+def test_agent_pool_shares_model_and_system_prompts():
+    pool = make_pool()
+    first, second = pool.acquire("scripted"), pool.acquire("scripted")
+    assert first is not second
+    assert first.model is second.model
+    second.instructions = "Custom instructions"
+    assert "Custom instructions" in second.system_prompt
+    assert "Custom instructions" not in first.system_prompt
+    assert first.system_prompt is pool.acquire("scripted").system_prompt
+
+
+def test_agent_pool_discards_failed_and_surplus_agents():
+    pool = make_pool(size=1)
+    with pytest.raises(RuntimeError):
+        with pool.agent("scripted"):
+            raise RuntimeError("boom")
+    assert pool.stats()["idle"] == {}
+
+    agents = [pool.acquire("scripted") for _ in range(3)]
+    for agent in agents:
+        pool.release("scripted", agent)
+    assert pool.stats()["idle"] == {"scripted": 1}
+    assert pool.stats()["discarded"] == 3
+
+
+def test_agent_pool_warm():
+    pool = make_pool(size=2)
+    pool.warm("scripted", 5)
+    assert pool.stats()["idle"] == {"scripted": 2}
+    pool.clear()
+    assert pool.stats()["idle"] == {}
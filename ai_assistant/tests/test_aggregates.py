@@ -0,0 +1,93 @@
+import os
+import time
+
+import pytest
+
+from ai_assistant.aggregates import AggregateStore, AggregateTable, write_table
+
+COLUMNS = {"hero_id": "I", "day": "H", "badge": "B", "matches": "I", "wins": "I"}
+ROWS = [
+    {"hero_id": 7, "day": 20002, "badge": 100, "matches": 10, "wins": 6},
+    {"hero_id": 1, "day": 20001, "badge": 50, "matches": 4, "wins": 1},
+    {"hero_id": 7, "day": 20000, "badge": 50, "matches": 20, "wins": 8},
+    {"hero_id": 1, "day": 20002, "badge": 100, "matches": 6, "wins": 3},
+    {"hero_id": 7, "day": 20001, "badge": 110, "matches": 5, "wins": 5},
+]
+
+
+def load_rows(sql: str) -> list[dict]:
+    return [{**row, "item_id": row["hero_id"]} for row in ROWS]
+
+
+@pytest.fixture
+def table(tmp_path):
+    write_table(tmp_path / "hero.agg", "hero_id", COLUMNS, ROWS)
+    return AggregateTable(tmp_path / "hero.agg")
+
+
+def test_write_table_orders_rows_by_key_and_day(table):
+    assert table.rows == 5
+    assert list(table.columns["hero_id"]) == [1, 1, 7, 7, 7]
+    assert list(table.columns["day"]) == [20001, 20002, 20000, 20001, 20002]
+    assert table.index == {1: (0, 2), 7: (2, 5)}
+
+
+def test_totals_filters_and_groups(table):
+    assert table.totals() == {(1, None): [10, 4], (7, None): [35, 19]}
+    assert table.totals(keys=[7, 3]) == {(7, None): [35, 19]}
+    assert table.totals(min_badge=100) == {(1, None): [6, 3], (7, None): [15, 11]}
+    assert table.totals(keys=[7], max_badge=100, since_day=20001) == {(7, None): [10, 6]}
+    assert table.totals(keys=[7], by="badge") == {(7, 50): [20, 8], (7, 100): [10, 6], (7, 110): [5, 5]}
+    assert table.totals(keys=[1], by="day") == {(1, 20001): [4, 1], (1, 20002): [6, 3]}
+
+
+def test_write_table_accepts_quoted_integers(tmp_path):
+    # ClickHouse sends UInt64 values as JSON strings.
+    rows = [{name: str(value) for name, value in row.items()} for row in ROWS]
+    write_table(tmp_path / "hero.agg", "hero_id", COLUMNS, rows)
+    assert AggregateTable(tmp_path / "hero.agg").totals(keys=[7]) == {(7, None): [35, 19]}
+
+
+def test_write_table_handles_no_rows(tmp_path):
+    write_table(tmp_path / "hero.agg", "hero_id", COLUMNS, [])
+    table = AggregateTable(tmp_path / "hero.agg")
+    assert table.rows == 0
+    assert table.totals() == {}
+
+
+def test_store_refreshes_stale_aggregates_once(tmp_path):
+    queries = []
+
+    def loader(sql: str):
+        queries.append(sql)
+        return load_rows(sql)
+
+    store = AggregateStore(directory=str(tmp_path), loader=loader, refresh_interval=60, enabled=False)
+    assert store.table("hero") is None
+
+    store.refresh()
+    assert len(queries) == 2
+    assert "INTERVAL 30 DAY" in queries[0]
+    assert store.table("hero").totals(keys=[1]) == {(1, None): [10, 4]}
+
+    # Fresh files are kept, also when another process asks for a refresh.
+    store.refresh()
+    assert len(queries) == 2
+    assert AggregateStore(directory=str(tmp_path), loader=loader, enabled=False).table("item").rows == 5
+
+    store.refresh_interval = 0
+    store.refresh()
+    assert len(queries) == 4
+
+
+def test_store_reloads_replaced_files(tmp_path):
+    store = AggregateStore(directory=str(tmp_path), loader=load_rows, enabled=False)
+    store.refresh()
+    first = store.table("hero")
+    assert store.table("hero") is first
+
+    write_table(tmp_path / "hero.agg", "hero_id", COLUMNS, ROWS[:2])
+    os.utime(tmp_path / "hero.agg", ns=(0, time.time_ns() + 10**9))
+    assert store.table("hero").rows == 2
+    assert first.rows == 5
+    assert store.stats()["hero"]["rows"] == 2
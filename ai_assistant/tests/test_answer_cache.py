@@ -0,0 +1,58 @@
+from ai_assistant.answer_cache import AnswerCache, prompt_tokens, without_memory_id
+
+EVENTS = [
+    'event: agentStep\ndata: {"type": "final_answer", "data": "52%"}\n\n',
+    "event: memoryId\ndata: d450bc53-9b2c-42af-bd29-5ba0ce57184c\n\n",
+]
+
+
+def record(cache: AnswerCache, prompt: str, events: list[str], model: str = "default") -> list[str]:
+    return list(cache.record(prompt, model, (event for event in events)))
+
+
+def test_prompt_tokens_ignore_filler_words():
+    assert prompt_tokens("What is the win rate of Seven?") == prompt_tokens("win rate of seven")
+    assert prompt_tokens("win rate of Seven") != prompt_tokens("win rate of Haze")
+
+
+def test_answer_cache_keeps_word_order():
+    cache = AnswerCache(use_redis=False, similarity=0.75)
+    assert cache.key(prompt_tokens("Is Haze better than Seven?"), "default") != cache.key(
+        prompt_tokens("Is Seven better than Haze?"), "default"
+    )
+    record(cache, "Is Haze better than Seven?", EVENTS)
+    assert cache.get("is haze better than seven", "default") == EVENTS
+    assert cache.get("Is Seven better than Haze?", "default") is None
+
+
+def test_without_memory_id_splits_recorded_id():
+    assert without_memory_id(EVENTS) == (EVENTS[:1], "d450bc53-9b2c-42af-bd29-5ba0ce57184c")
+    assert without_memory_id(EVENTS[:1]) == (EVENTS[:1], None)
+
+
+def test_answer_cache_replays_completed_streams():
+    cache = AnswerCache(use_redis=False)
+    assert cache.get("What is the win rate of Seven?", "default") is None
+    assert record(cache, "What is the win rate of Seven?", EVENTS) == EVENTS
+    assert cache.get("win rate of seven", "default") == EVENTS
+    assert cache.get("win rate of seven", "gemini-pro") is None
+    assert cache.get("win rate of haze", "default") is None
+
+
+def test_answer_cache_skips_failed_and_interrupted_streams():
+    cache = AnswerCache(use_redis=False)
+    record(cache, "win rate of seven", ["event: error\ndata: boom\n\n", *EVENTS])
+    stream = cache.record("best items for haze", "default", (event for event in EVENTS))
+    next(stream)
+    stream.close()
+    assert cache.get("win rate of seven", "default") is None
+    assert cache.get("best items for haze", "default") is None
+    assert cache.stats()["stored"] == 0
+
+
+def test_answer_cache_similarity_fallback():
+    cache = AnswerCache(use_redis=False, similarity=0.75)
+    record(cache, "best early items for haze", EVENTS)
+    assert cache.get("best early game items for haze", "default") == EVENTS
+    assert cache.get("best items for wraith", "default") is None
+    assert cache.stats()["similar_hits"] == 1
@@ -0,0 +1,67 @@
+import subprocess
+import sys
+
+from ai_assistant.benchmarks.mock_upstream import MockDeadlockApi
+from ai_assistant.benchmarks.scripted_model import ScriptedModel
+from ai_assistant.benchmarks.service import percentile
+from ai_assistant.upstream import UpstreamClient
+
+
+def test_percentile():
+    assert percentile([3.0, 1.0, 2.0, 4.0], 50) == 2.0
+    assert percentile([3.0, 1.0, 2.0, 4.0], 99) == 4.0
+
+
+def test_mock_upstream_serves_sql_and_schemas():
+    client = UpstreamClient()
+    MockDeadlockApi().install(client)
+    assert client.get_json("https://api.deadlock-api.com/v1/sql/tables") == [
+        "heroes",
+        "items",
+        "match_info",
+        "match_player",
+    ]
+    assert client.get_json("https://api.deadlock-api.com/v1/sql", params={"query": "SELECT id, name FROM heroes"})[
+        0
+    ] == {
+        "id": 1,
+        "name": "Abrams",
+    }
+
+
+def test_scripted_model_follows_trajectory():
+    model = ScriptedModel({"task": ["first", "second"]})
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "New task:\ntask"}]
+    assert model.generate(messages).content == "first"
+    messages.append({"role": "assistant", "content": "first"})
+    assert model.generate(messages).content == "second"
+
+
+def test_benchmark_runs_offline():
+    # In a separate process, as the benchmark loads the shared entity and schema caches from the mock.
+    args = ["--clients", "2", "--requests", "3", "--upstream-latency", "0", "--model-latency", "0"]
+    result = subprocess.run(
+        [sys.executable, "-m", "ai_assistant.benchmarks.service", *args], capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    assert "ttfe_p95" in result.stdout
+
+
+def test_agent_setup_benchmark_runs_offline():
+    result = subprocess.run(
+        [sys.executable, "-m", "ai_assistant.benchmarks.agent_setup", "--model", "scripted", "--iterations", "5"],
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    assert "pooled" in result.stdout
+
+
+def test_replay_benchmark_runs_offline():
+    args = ["--speed", "0", "--model-latency", "0", "--upstream-latency", "0"]
+    result = subprocess.run(
+        [sys.executable, "-m", "ai_assistant.benchmarks.replay", *args], capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    assert "overhead_p95" in result.stdout
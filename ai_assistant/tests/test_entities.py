@@ -0,0 +1,65 @@
+import pytest
+
+from ai_assistant.entities import BKTree, EntityIndex, normalize_name
+
+ENTITIES = {
+    "hero": [(7, "Wraith"), (13, "Haze"), (18, "Mo & Krill"), (11, "Dynamo")],
+    "item": [(1548066885, "Extended Magazine"), (2, "Extra Health"), (3, "Headshot Booster")],
+    "rank": [(9, "Phantom"), (10, "Ascendant"), (11, "Eternus")],
+}
+
+
+@pytest.fixture
+def index() -> EntityIndex:
+    return EntityIndex(loader=lambda: ENTITIES)
+
+
+def test_normalize_name():
+    assert normalize_name("  Mo & Krill!") == "mo and krill"
+
+
+def test_bk_tree_search():
+    tree = BKTree()
+    for i, word in enumerate(["haze", "maze", "wraith", "warden"]):
+        tree.add(word, (i, word))
+    assert sorted(key for _, key, _ in tree.search("haze", 1)) == ["haze", "maze"]
+    assert tree.search("xxxxxx", 1) == []
+
+
+def test_entity_index_lookup(index):
+    assert index.best("hero", "Wraith").id == 7
+    assert index.best("hero", "Wrath", max_distance=1).id == 7
+    assert index.best("hero", "Wrth", max_distance=1) is None
+    assert index.best("hero", "krill").id == 18
+    assert index.best("item", "Extended Magazin", max_distance=6).id == 1548066885
+    assert index.best("rank", "ascendnt").id == 10
+    assert index.name_of("hero", 18) == "Mo & Krill"
+    assert index.name_of("item", 4) is None
+
+
+def test_entity_index_ranked_candidates(index):
+    matches = index.lookup("item", "Extra Healt", limit=3)
+    assert matches[0].name == "Extra Health"
+    assert [m.score for m in matches] == sorted((m.score for m in matches), reverse=True)
+
+
+def test_entity_index_lookup_many(index):
+    results = index.lookup_many("hero", ["Haze", "Wraith"], limit=1)
+    assert {name: matches[0].id for name, matches in results.items()} == {"Haze": 13, "Wraith": 7}
+
+
+def test_entity_index_rejects_unknown_kind(index):
+    with pytest.raises(ValueError):
+        index.lookup("ability", "Smoke Bomb")
+
+
+def test_entity_index_starts_from_snapshot(tmp_path):
+    snapshot_path = str(tmp_path / "entities.json")
+    EntityIndex(loader=lambda: ENTITIES, snapshot_path=snapshot_path).warm()
+
+    def unreachable():
+        raise AssertionError("should load the snapshot")
+
+    index = EntityIndex(loader=unreachable, snapshot_path=snapshot_path)
+    assert index.best("hero", "Mo and Krill").id == 18
+    assert index.best("item", "Extended Magazine").id == 1548066885
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ai_assistant.executor import AgentExecutor, run_concurrently, speculate
+from ai_assistant.telemetry import span, tracing
+
+
+def test_agent_executor_streams_all_events():
+    executor = AgentExecutor(max_workers=2, queue_size=2)
+
+    async def consume():
+        return [item async for item in executor.stream(iter(str(i) for i in range(10)))]
+
+    assert asyncio.run(consume()) == [str(i) for i in range(10)]
+    assert executor.active == 0
+
+
+def test_agent_executor_applies_backpressure():
+    executor = AgentExecutor(max_workers=1, queue_size=2)
+    produced = []
+
+    def events():
+        for i in range(10):
+            produced.append(i)
+            yield str(i)
+
+    async def consume():
+        stream = executor.stream(events())
+        await anext(stream)
+        await asyncio.sleep(0.1)
+        await stream.aclose()
+
+    asyncio.run(consume())
+    assert len(produced) <= 4
+
+
+def test_agent_executor_cancels_on_disconnect():
+    executor = AgentExecutor(max_workers=1, queue_size=1)
+    closed = threading.Event()
+
+    def events():
+        try:
+            while True:
+                yield "event"
+        finally:
+            closed.set()
+
+    async def consume():
+        stream = executor.stream(events())
+        await anext(stream)
+        await stream.aclose()
+
+    asyncio.run(consume())
+    assert closed.wait(timeout=1)
+
+
+def test_agent_executor_propagates_errors():
+    executor = AgentExecutor(max_workers=1)
+
+    def events():
+        yield "event"
+        raise RuntimeError("boom")
+
+    async def consume():
+        return [item async for item in executor.stream(events())]
+
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(consume())
+
+
+def test_speculate_resolves_future_from_event_loop():
+    async def check(result):
+        await asyncio.sleep(0.01)
+        return result
+
+    async def failing_check():
+        raise RuntimeError("boom")
+
+    async def run():
+        futures = [speculate(check(True)), speculate(check(False)), speculate(failing_check())]
+        await asyncio.sleep(0.05)
+        return [future.result(timeout=1) for future in futures]
+
+    assert asyncio.run(run()) == [True, False, False]
+
+    async def run_with_fallback():
+        future = speculate(failing_check(), fallback=True)
+        await asyncio.sleep(0.05)
+        return future.result(timeout=1)
+
+    assert asyncio.run(run_with_fallback()) is True
+
+
+def test_run_concurrently_overlaps_calls_and_keeps_context():
+    def slow(value):
+        time.sleep(0.2)
+        if value == 3:
+            raise ValueError("three")
+        with span("call"):
+            return value * 2
+
+    with tracing() as trace:
+        started = time.perf_counter()
+        futures = run_concurrently(slow, [1, 2, 3])
+        elapsed = time.perf_counter() - started
+    assert elapsed < 0.5
+    assert [f.result() for f in futures[:2]] == [2, 4]
+    assert isinstance(futures[2].exception(), ValueError)
+    assert len(trace.spans) == 2
@@ -0,0 +1,57 @@
+from smolagents import ActionStep, PlanningStep, TaskStep, ToolCall
+from smolagents.models import ChatMessage, MessageRole
+from smolagents.monitoring import AgentLogger, LogLevel, Timing, TokenUsage
+from smolagents.utils import AgentExecutionError
+
+from ai_assistant.memory_codec import decode, decode_step, encode, encode_step, truncate_observation
+
+
+def roundtrip(step):
+    return decode_step(encode_step(step))
+
+
+def test_encode_compresses_large_documents():
+    small, large = {"a": 1}, {"a": "x" * 10_000}
+    assert decode(encode(small)) == small
+    assert decode(encode(large)) == large
+    assert len(encode(large)) < 1_000
+
+
+def test_action_step_roundtrip_preserves_messages():
+    step = ActionStep(
+        step_number=2,
+        timing=Timing(start_time=1.0, end_time=2.5),
+        model_input_messages=[ChatMessage(role=MessageRole.USER, content="huge prompt")],
+        tool_calls=[ToolCall(name="python_interpreter", arguments="print(1)", id="call_1")],
+        error=AgentExecutionError("division by zero", AgentLogger(level=LogLevel.OFF)),
+        model_output="Thought: compute\n<code>print(1)</code>",
+        code_action="print(1)",
+        observations="1",
+        action_output=1,
+        token_usage=TokenUsage(input_tokens=10, output_tokens=5),
+    )
+    restored = roundtrip(step)
+    assert restored.model_input_messages is None
+    assert [m.dict() for m in restored.to_messages()] == [m.dict() for m in step.to_messages()]
+    assert isinstance(restored.error, AgentExecutionError)
+    assert restored.token_usage.total_tokens == 15
+    assert restored.timing.duration == 1.5
+
+
+def test_planning_and_task_steps_roundtrip():
+    task = TaskStep(task="How many heroes are there?")
+    plan = PlanningStep(
+        model_input_messages=[],
+        model_output_message=ChatMessage(role=MessageRole.ASSISTANT, content="1. Query heroes"),
+        plan="1. Query heroes",
+        timing=Timing(start_time=1.0, end_time=2.0),
+    )
+    assert roundtrip(task).task == task.task
+    assert [m.dict() for m in roundtrip(plan).to_messages()] == [m.dict() for m in plan.to_messages()]
+
+
+def test_truncate_observation():
+    assert truncate_observation("short", max_chars=10) == "short"
+    truncated = truncate_observation("x" * 30, max_chars=10)
+    assert truncated.startswith("x" * 10)
+    assert "truncated 20 characters" in truncated
@@ -0,0 +1,97 @@
+from smolagents import ActionStep, AgentMemory, TaskStep
+from smolagents.monitoring import AgentLogger, LogLevel, Timing
+from smolagents.utils import AgentExecutionError
+
+from ai_assistant.memory_compaction import SUMMARY_HEADER, MemoryCompactor, split_turns, step_tokens
+
+
+def turn(i: int) -> list:
+    rows = "\n".join(f"{{'match_id': {n}, 'kills': {n % 20}}}" for n in range(300))
+    return [
+        TaskStep(task=f"Question {i}"),
+        ActionStep(
+            step_number=1,
+            timing=Timing(start_time=float(i), end_time=i + 0.5),
+            model_output=f"Thought: look up the player\n<code>print(search_steam_profile('player{i}'))</code>",
+            observations=f"Execution logs:\nAccount ID: {1000 + i}\nLast output from code snippet:\nNone",
+        ),
+        ActionStep(
+            step_number=2,
+            timing=Timing(start_time=i + 0.5, end_time=i + 0.7),
+            model_output="<code>1/0</code>",
+            error=AgentExecutionError("division by zero", AgentLogger(level=LogLevel.OFF)),
+        ),
+        ActionStep(
+            step_number=3,
+            timing=Timing(start_time=i + 0.7, end_time=i + 1.0),
+            model_output="<code>rows = clickhouse_query(sql)\nprint(rows)\nfinal_answer(len(rows))</code>",
+            observations=f"Execution logs:\n{rows}\nLast output from code snippet:\n300",
+            action_output=f"answer {i}",
+            is_final_answer=True,
+        ),
+    ]
+
+
+def memory(turns: int) -> AgentMemory:
+    memory = AgentMemory("system prompt")
+    memory.steps = [step for i in range(turns) for step in turn(i)]
+    return memory
+
+
+def tokens(memory: AgentMemory) -> int:
+    return sum(step_tokens(step) for step in memory.steps)
+
+
+def test_memory_within_budget_is_unchanged():
+    compactor = MemoryCompactor(default_budget=100_000)
+    original = memory(2)
+    assert compactor.compact(original) is original
+    assert compactor.stats()["compactions"] == 0
+
+
+def test_compaction_summarizes_old_turns_and_keeps_the_last():
+    compactor = MemoryCompactor(default_budget=5000, keep_turns=1)
+    original = memory(4)
+    steps = list(original.steps)
+    compacted = compactor.compact(original)
+
+    assert original.steps == steps and original.steps[3].observations == steps[3].observations
+    assert tokens(compacted) <= 5000 * compactor.TARGET
+    turns = split_turns(compacted.steps)
+    assert [s.observations for s in turns[-1][1:]] == [s.observations for s in turn(3)[1:]]
+    summary = turns[0][1].observations
+    assert turns[0][0].task == "Question 0"
+    assert summary.startswith(SUMMARY_HEADER)
+    assert "Account ID: 1000" in summary
+    assert "division by zero" not in summary
+    assert "characters dropped" in summary
+    assert summary.endswith("Final answer: answer 0")
+    assert compactor.stats()["turns_summarized"] >= 1
+
+
+def test_per_turn_history_stays_flat():
+    compactor = MemoryCompactor(default_budget=6000, keep_turns=1)
+    current = AgentMemory("system prompt")
+    sizes = []
+    for i in range(20):
+        current = compactor.compact(current)
+        sizes.append(tokens(current))
+        current.steps = [*current.steps, *turn(i)]
+    assert max(sizes) <= 6000
+    # Summaries are not summarized again.
+    summaries = [s.observations for s in current.steps if isinstance(s, ActionStep) and s.observations]
+    assert all(SUMMARY_HEADER not in summary[len(SUMMARY_HEADER) :] for summary in summaries)
+
+
+def test_compaction_drops_oldest_turns_and_truncates_recent_observations():
+    compactor = MemoryCompactor(default_budget=1000, keep_turns=1)
+    compacted = compactor.compact(memory(10))
+    assert len(split_turns(compacted.steps)) < 10
+    assert split_turns(compacted.steps)[-1][0].task == "Question 9"
+    assert compactor.stats()["turns_dropped"] > 0
+
+
+def test_budget_per_model():
+    compactor = MemoryCompactor(default_budget=1234)
+    assert compactor.budget("gemini-pro") > compactor.budget("gemini-flash-lite")
+    assert compactor.budget("unknown") == 1234
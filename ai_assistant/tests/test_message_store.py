@@ -1,8 +1,8 @@
 import os
 import pytest
-from smolagents import AgentMemory
+from smolagents import AgentMemory, TaskStep
 
-from ai_assistant.message_store import MemoryMessageStore, RedisMessageStore
+from ai_assistant.message_store import MemoryMessageStore, RedisMessageStore, SqliteMessageStore, approximate_size
 
 
 def test_memory_message_store():
@@ -14,6 +14,56 @@ def test_memory_message_store():
     assert retrieved_memory.steps == prev_memory.steps
 
 
+def test_memory_message_store_returns_copies():
+    store = MemoryMessageStore()
+    memory_id = store.save_memory(AgentMemory("test"))
+    store.get_memory(memory_id).steps.append(TaskStep(task="follow-up"))
+    assert store.get_memory(memory_id).steps == []
+
+
+def test_sqlite_message_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "memories.sqlite3")
+    memory = AgentMemory("test")
+    memory.steps.append(TaskStep(task="How many heroes are there?"))
+    memory_id = SqliteMessageStore(path).save_memory(memory)
+    retrieved = SqliteMessageStore(path).get_memory(memory_id)
+    assert retrieved.system_prompt.system_prompt == "test"
+    assert [step.task for step in retrieved.steps] == ["How many heroes are there?"]
+
+
+def test_sqlite_message_store_expires(tmp_path):
+    store = SqliteMessageStore(str(tmp_path / "memories.sqlite3"), expire=-1)
+    memory_id = store.save_memory(AgentMemory("test"))
+    assert store.get_memory(memory_id) is None
+    store.save_memory(AgentMemory("test"))
+    assert store.stats()["entries"] == 1
+
+
+def test_memory_message_store_evicts():
+    store = MemoryMessageStore(max_entries=2)
+    ids = [store.save_memory(AgentMemory("test")) for _ in range(3)]
+    assert store.get_memory(ids[0]) is None
+    assert store.get_memory(ids[2]) is not None
+    assert store.stats()["evictions"] == 1
+
+
+def test_memory_message_store_byte_budget():
+    store = MemoryMessageStore(max_bytes=1_000)
+    memory = AgentMemory("test")
+    memory.steps.append(TaskStep(task="x" * 600))
+    first_id = store.save_memory(memory)
+    second_id = store.save_memory(memory)
+    assert store.get_memory(first_id) is None
+    assert store.get_memory(second_id) is not None
+    assert store.stats()["bytes"] == approximate_size(memory)
+
+
+def test_memory_message_store_expires():
+    store = MemoryMessageStore(expire=0)
+    memory_id = store.save_memory(AgentMemory("test"))
+    assert store.get_memory(memory_id) is None
+
+
 @pytest.mark.skipif("REDIS_HOST" not in os.environ, reason="Redis not available")
 def test_redis_message_store():
     store = RedisMessageStore()
@@ -22,3 +72,19 @@ def test_redis_message_store():
     retrieved_memory = store.get_memory(memory_id)
     assert retrieved_memory.system_prompt == prev_memory.system_prompt
     assert retrieved_memory.steps == prev_memory.steps
+
+
+@pytest.mark.skipif("REDIS_HOST" not in os.environ, reason="Redis not available")
+def test_redis_message_store_appends_turns():
+    store = RedisMessageStore()
+    memory = AgentMemory("test")
+    memory.steps.append(TaskStep(task="first"))
+    first_id = store.save_memory(memory)
+
+    memory = store.get_memory(first_id)
+    memory.steps.append(TaskStep(task="second"))
+    second_id = store.save_memory(memory, parent_id=first_id)
+
+    assert store.conn.llen(store._steps_key(second_id)) == 1
+    assert [step.task for step in store.get_memory(second_id).steps] == ["first", "second"]
+    assert [step.task for step in store.get_memory(first_id).steps] == ["first"]
@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+from smolagents import ChatMessage, Model
+from smolagents.models import MessageRole
+from smolagents.monitoring import TokenUsage
+
+from ai_assistant.model_router import DifficultyClassifier, ModelRouter, RoutedModel
+
+CASCADE = ["gemini-flash-lite", "gemini-flash", "gemini-pro"]
+
+
+class FakeModel(Model):
+    def __init__(self, fail: bool = False):
+        super().__init__(model_id="fake")
+        self.fail = fail
+        self.calls = 0
+
+    def generate(self, messages, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("rate limited")
+        return ChatMessage(
+            role=MessageRole.ASSISTANT, content="ok", token_usage=TokenUsage(input_tokens=1000, output_tokens=100)
+        )
+
+
+def make_router(models: dict[str, FakeModel], easy_model: str = "gemini-flash-lite") -> ModelRouter:
+    return ModelRouter(
+        DifficultyClassifier(use_llm=False),
+        models.__getitem__,
+        cascade=CASCADE,
+        easy_model=easy_model,
+        default_model="gemini-flash",
+    )
+
+
+def test_difficulty_classifier_decides_clear_prompts():
+    classifier = DifficultyClassifier(use_llm=False)
+    assert classifier.verdict("What is the hero id of Haze?") == "easy"
+    assert classifier.verdict("What rank is badge 104?") == "easy"
+    assert classifier.verdict("Compare the win rate trend of Haze over time") == "hard"
+    assert classifier.verdict("How do souls work?") is None
+    assert classifier.classify("How do souls work?") == (None, "none")
+
+
+def test_router_starts_easy_prompts_on_the_light_model():
+    router = make_router({})
+    assert router.route("What is the hero id of Haze?").models == CASCADE
+    assert router.route("How do souls work?").models == CASCADE[1:]
+    assert make_router({}, easy_model="ollama").route("What is the item id of Monster Rounds?").models == [
+        "ollama",
+        *CASCADE[1:],
+    ]
+    assert router.stats()["routes"] == {"easy": 1, "unknown": 1}
+
+
+def test_routed_model_escalates_on_failure_and_accounts_cost():
+    models = {"gemini-flash-lite": FakeModel(fail=True), "gemini-flash": FakeModel(), "gemini-pro": FakeModel()}
+    router = make_router(models)
+    model = router.model("What is the hero id of Haze?")
+    assert model.generate([]).content == "ok"
+    assert model.current == "gemini-flash"
+    stats = router.stats()["models"]
+    assert stats["gemini-flash-lite"]["errors"] == 1
+    assert stats["gemini-flash-lite"]["escalations"] == 1
+    assert stats["gemini-flash"]["calls"] == 1
+    assert stats["gemini-flash"]["cost_usd"] == pytest.approx((1000 * 0.3 + 100 * 2.5) / 1e6)
+    assert models["gemini-pro"].calls == 0
+
+
+def test_routed_model_escalates_after_step_errors():
+    router = make_router({})
+    model = RoutedModel(router, router.route("How do souls work?"))
+    for _ in range(router.MAX_STEP_ERRORS):
+        model.step_failed()
+    assert model.current == "gemini-pro"
+    # The strongest model has nowhere to escalate to.
+    for _ in range(router.MAX_STEP_ERRORS):
+        model.step_failed()
+    assert model.current == "gemini-pro"
+
+
+def test_routed_model_raises_once_the_cascade_is_exhausted():
+    router = make_router({"gemini-flash": FakeModel(fail=True), "gemini-pro": FakeModel(fail=True)})
+    with pytest.raises(RuntimeError):
+        router.model("How do souls work?").generate([])
+
+
+def test_routed_model_spills_over_when_a_model_is_saturated():
+    models = {"gemini-flash": FakeModel(), "gemini-pro": FakeModel()}
+    router = make_router(models)
+    router.QUEUE_TIMEOUT = 0.01
+    router.limits["gemini-flash"] = threading.BoundedSemaphore(1)
+    router.limits["gemini-flash"].acquire()
+    model = router.model("How do souls work?")
+    assert model.generate([]).content == "ok"
+    assert model.current == "gemini-pro"
+    assert router.stats()["models"]["gemini-flash"]["saturated"] == 1
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import sqlglot
+
+from ai_assistant.cache import SingleFlight, TTLCache
+from ai_assistant.query_cache import QueryCache, normalize_query
+from ai_assistant.results import QueryResult
+
+
+def transpiled(sql: str) -> str:
+    return sqlglot.transpile(sql, write="clickhouse")[0]
+
+
+def test_normalize_query_collapses_spelling():
+    a, tables = normalize_query(
+        transpiled(
+            "select  count(distinct mp.match_id) from match_player as mp join match_info mi on mp.match_id=mi.match_id"
+        )
+    )
+    b, _ = normalize_query(
+        transpiled(
+            "SELECT COUNT(DISTINCT p.match_id)\nFROM match_player AS p JOIN match_info AS i ON p.match_id = i.match_id"
+        )
+    )
+    assert a == b
+    assert tables == {"match_player", "match_info"}
+
+
+def test_normalize_query_keeps_column_aliases():
+    assert normalize_query("SELECT 1 AS a")[0] != normalize_query("SELECT 1 AS b")[0]
+
+
+def test_normalize_query_ignores_ctes():
+    _, tables = normalize_query("WITH x AS (SELECT * FROM heroes) SELECT * FROM x")
+    assert tables == {"heroes"}
+
+
+def test_ttl_cache_lru_and_expiry():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    cache.set("d", 4, ttl=0)
+    assert cache.get("d") is None
+    assert cache.stats()["evictions"] == 2
+
+
+def test_ttl_cache_byte_budget():
+    cache = TTLCache(max_bytes=10, sizer=len)
+    cache.set("a", "x" * 6)
+    cache.set("b", "x" * 6)
+    assert "a" not in cache
+    assert cache.bytes == 6
+
+
+def test_single_flight_deduplicates_concurrent_calls():
+    single_flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return 42
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(single_flight.do("k", slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [42] * 5
+    assert len(calls) == 1
+
+
+def test_query_cache_hits_and_ttls():
+    cache = QueryCache(use_redis=False)
+    executed = []
+
+    def execute(sql):
+        executed.append(sql)
+        return QueryResult.from_rows([{"id": 1}])
+
+    assert cache.get_or_execute("SELECT id FROM heroes", execute) == [{"id": 1}]
+    assert cache.get_or_execute("select id   from heroes", execute) == [{"id": 1}]
+    assert len(executed) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.ttl_for({"heroes"}) == QueryCache.STATIC_TTL
+    assert cache.ttl_for({"heroes", "match_player"}) == QueryCache.DEFAULT_TTL
+
+
+def test_query_cache_uses_default_ttl_without_tables():
+    cache = QueryCache(use_redis=False)
+    assert cache.ttl_for(set()) == QueryCache.DEFAULT_TTL
+    assert cache.ttl_for(normalize_query("SELECT now()")[1]) == QueryCache.DEFAULT_TTL
+    assert cache.ttl_for(normalize_query("SELECT count() FROM (SELECT 1")[1]) == QueryCache.DEFAULT_TTL
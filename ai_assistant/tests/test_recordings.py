@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+from smolagents import ChatMessage, Model, tool
+from smolagents.models import MessageRole
+
+from ai_assistant.recordings import (
+    Recording,
+    RecordingStore,
+    decode_value,
+    encode_value,
+    recorded_events,
+    recorded_model,
+    recorded_tool,
+    substituted,
+)
+from ai_assistant.results import QueryResult
+
+
+class EchoModel(Model):
+    def __init__(self):
+        super().__init__(model_id="echo")
+        self.calls = 0
+
+    def generate(self, messages, stop_sequences=None, response_format=None, tools_to_call_from=None, **kwargs):
+        self.calls += 1
+        return ChatMessage(role=MessageRole.ASSISTANT, content=f"answer {self.calls}")
+
+
+@pytest.fixture
+def lookup():
+    calls = []
+
+    @tool
+    def lookup(name: str) -> int:
+        """
+        Test tool.
+
+        Args:
+            name: The name to look up.
+        """
+        calls.append(name)
+        if name == "missing":
+            raise ValueError("Not found")
+        return len(calls)
+
+    lookup.calls = calls
+    return recorded_tool(lookup)
+
+
+def session(model: Model, lookup, names: list[str]):
+    messages = [{"role": "user", "content": "New task:\nquestion"}]
+    yield f"event: agentStep\ndata: {model.generate(messages).content}\n\n"
+    for name in names:
+        try:
+            yield f"event: agentStep\ndata: {lookup(name=name)}\n\n"
+        except (ValueError, LookupError) as e:
+            yield f"event: error\ndata: {e}\n\n"
+
+
+def test_values_round_trip():
+    result = QueryResult.from_rows([{"hero_id": 1, "win_rate": 0.5}])
+    value = {"results": [result, 3], "name": "Haze"}
+    assert decode_value(encode_value(value)) == value
+
+
+def test_recorded_session_is_reexecuted_without_upstream_calls(tmp_path, lookup):
+    store = RecordingStore(directory=str(tmp_path), enabled=True)
+    model = recorded_model(EchoModel())
+    recording = Recording("question", model="echo")
+    events = list(store.record(recording, session(model, lookup, ["haze", "missing"])))
+    assert lookup.calls == ["haze", "missing"]
+
+    loaded = store.find("  Question ")
+    assert loaded.id == recording.id
+    assert [event for _, event in loaded.events] == events
+    assert [call["tool"] for call in loaded.tool_calls] == ["lookup", "lookup"]
+
+    replayed = list(substituted(loaded, session(model, lookup, ["haze", "missing"]), speed=0))
+    assert replayed[:-1] == events
+    assert replayed[-1].startswith("event: replay")
+    assert '"model_mismatches":0,"tool_mismatches":0,"missing":0' in replayed[-1]
+    assert model.calls == 1
+    assert lookup.calls == ["haze", "missing"]
+
+
+def test_substitution_counts_divergence(tmp_path, lookup):
+    store = RecordingStore(directory=str(tmp_path), enabled=True)
+    model = recorded_model(EchoModel())
+    recording = Recording("question")
+    list(store.record(recording, session(model, lookup, ["haze"])))
+
+    replayed = list(substituted(recording, session(model, lookup, ["wraith", "seven"]), speed=0))
+    assert replayed[1] == "event: agentStep\ndata: 1\n\n"
+    assert replayed[2] == "event: error\ndata: No recorded call of lookup left\n\n"
+    assert '"tool_mismatches":1,"missing":1' in replayed[-1]
+
+
+def test_recorded_events_keep_their_pace():
+    recording = Recording("question")
+    recording.events = [(0.0, "a"), (0.05, "b")]
+
+    async def replay(speed: float) -> float:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        assert [event async for event in recorded_events(recording, speed)] == ["a", "b"]
+        return loop.time() - started
+
+    assert asyncio.run(replay(1.0)) >= 0.04
+    assert asyncio.run(replay(0)) < 0.04
+
+
+def test_store_keeps_the_latest_recordings(tmp_path):
+    store = RecordingStore(directory=str(tmp_path), max_files=2)
+    assert not store.sample()
+    for prompt in ["first", "second", "third"]:
+        store.save(Recording(prompt))
+    assert [summary["prompt"] for summary in store.summaries()] == ["second", "third"]
+    assert store.find("first") is None
+    assert store.load("../first") is None
+    assert store.find("third", model="other") is None
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
+
+import pytest
+
+from ai_assistant.executor import speculate
+from ai_assistant.relevancy import LexicalRelevancyModel, RelevancyChecker
+
+
+@pytest.fixture
+def checker(monkeypatch) -> RelevancyChecker:
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    return RelevancyChecker()
+
+
+def test_lexical_model_decides_obvious_prompts():
+    model = LexicalRelevancyModel()
+    assert model.verdict("What is the win rate of Wraith this patch?") is True
+    assert model.verdict("Is Extended Magazine worth buying on Wraith?") is True
+    assert model.verdict("How do I fix a deadlock between two threads in Java?") is False
+    assert model.verdict("Best agents in Valorant?") is False
+    assert model.verdict("Tell me a joke") is None
+
+
+def test_relevancy_checker_caches_llm_verdicts(checker):
+    calls = []
+
+    class Response:
+        text = "NO"
+
+    def generate_content(**kwargs):
+        calls.append(kwargs)
+        return Response()
+
+    checker.client.models.generate_content = generate_content
+    assert checker.is_relevant("Tell me a joke") is False
+    assert checker.is_relevant("tell me a JOKE!") is False
+    assert len(calls) == 1
+    assert checker.stats()["cache"] == 1
+
+
+def test_relevancy_checker_skips_llm_for_local_verdicts(checker):
+    def generate_content(**kwargs):
+        raise AssertionError("LLM should not be called")
+
+    checker.client.models.generate_content = generate_content
+    assert checker.is_relevant("Best items for Haze?") is True
+    assert checker.stats()["local"] == 1
+
+
+def test_relevancy_checker_counts_concurrent_checks(checker):
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: checker.fast_verdict("Best items for Haze?"), range(2000)))
+    assert checker.stats()["local"] == 2000
+
+
+@pytest.mark.parametrize("speculative", [False, True])
+def test_relevancy_checker_accepts_prompts_when_the_check_fails(checker, speculative):
+    async def generate_content(**kwargs):
+        raise ConnectionError("light model unavailable")
+
+    def verdict(prompt):
+        raise RuntimeError("lexicon unavailable")
+
+    checker.client.aio.models.generate_content = generate_content
+
+    async def check(prompt):
+        if not speculative:
+            return await checker.is_relevant_async(prompt)
+        future = speculate(checker.is_relevant_async(prompt), fallback=True)
+        await asyncio.sleep(0.05)
+        return future.result(timeout=1)
+
+    assert asyncio.run(check("Tell me a joke")) is True
+    checker.lexical_model.verdict = verdict
+    assert asyncio.run(check("Tell me a joke")) is True
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from ai_assistant.results import QueryResult, iter_json_array
+
+ROWS = [{"hero_id": i, "win_rate": i / 7, "name": f"Héro {i}"} for i in range(40)]
+
+
+def chunked(data: bytes, size: int) -> list[bytes]:
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 64, 10_000])
+def test_iter_json_array_across_chunk_boundaries(size):
+    assert list(iter_json_array(chunked(json.dumps(ROWS).encode(), size))) == ROWS
+
+
+def test_iter_json_array_numbers_split_across_chunks():
+    assert list(iter_json_array([b"[1, 2", b"3, 4", b"5]"])) == [1, 23, 45]
+    assert list(iter_json_array([b"[]"])) == []
+
+
+def test_iter_json_array_rejects_invalid_input():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"error": "x"}']))
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'[{"a": 1},']))
+
+
+def test_query_result_packs_numeric_columns():
+    result = QueryResult.from_json_chunks(chunked(json.dumps(ROWS).encode(), 16))
+    assert result.data["hero_id"].typecode == "q"
+    assert result.data["win_rate"].typecode == "d"
+    assert isinstance(result.data["name"], list)
+    assert result == ROWS
+    assert result[-1] == ROWS[-1]
+    assert result["hero_id"] == list(range(40))
+    assert result[1:3] == ROWS[1:3]
+
+
+def test_query_result_mixed_column_falls_back_to_list():
+    result = QueryResult.from_rows([{"a": 1}, {"a": None}, {"a": 2**70}])
+    assert result["a"] == [1, None, 2**70]
+
+
+def test_query_result_keeps_mixed_int_and_float_values():
+    for values in ([1, 2.5, 3], [1.5, 2, 3.5], [1, True]):
+        result = QueryResult.from_rows([{"a": value} for value in values])
+        assert isinstance(result.data["a"], list)
+        assert [(type(value), value) for value in result["a"]] == [(type(value), value) for value in values]
+        packed = QueryResult.from_dict(result.to_dict())
+        assert [type(value) for value in packed["a"]] == [type(value) for value in values]
+
+
+def test_query_result_truncates_and_summarizes():
+    result = QueryResult.from_rows(ROWS, max_rows=25)
+    assert len(result) == 25
+    assert result.total_rows == 40
+    assert result.truncated
+    summary = str(result)
+    assert "QueryResult: 25 rows x 3 columns" in summary
+    assert "5 more rows" in summary
+    assert "truncated to 25 of 40 rows" in summary
+
+
+def test_query_result_round_trips_through_dict():
+    result = QueryResult.from_rows(ROWS, max_rows=10)
+    restored = QueryResult.from_dict(json.loads(json.dumps(result.to_dict())))
+    assert restored == result
+    assert restored.total_rows == 40
+    assert restored.data["win_rate"].typecode == "d"
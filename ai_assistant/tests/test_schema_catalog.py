@@ -0,0 +1,85 @@
+import json
+
+from ai_assistant import schema_catalog
+from ai_assistant.schema_catalog import SchemaCatalog
+
+SCHEMAS = {
+    "heroes": {"id": "UInt32", "name": "String"},
+    "items": {"id": "UInt32", "name": "String", "avatar": "String"},
+}
+
+
+def fake_upstream(monkeypatch) -> list[str]:
+    calls = []
+
+    def list_tables():
+        calls.append("tables")
+        return list(SCHEMAS)
+
+    def schema(table):
+        calls.append(table)
+        return SCHEMAS[table]
+
+    monkeypatch.setattr(schema_catalog, "list_clickhouse_tables", list_tables)
+    monkeypatch.setattr(schema_catalog, "schema", schema)
+    return calls
+
+
+def test_schema_catalog_is_lazy_and_writes_snapshot(tmp_path, monkeypatch):
+    calls = fake_upstream(monkeypatch)
+    snapshot_path = tmp_path / "schema.json"
+    catalog = SchemaCatalog(snapshot_path=str(snapshot_path))
+    assert calls == []
+
+    assert catalog.schemas() == SCHEMAS
+    assert sorted(calls) == ["heroes", "items", "tables"]
+    assert "## Table: items\nid: UInt32\nname: String" in catalog.context()
+    assert "avatar" not in catalog.context()
+
+    snapshot = json.loads(snapshot_path.read_text())
+    assert snapshot["version"] == SchemaCatalog.SNAPSHOT_VERSION
+    assert snapshot["tables"] == SCHEMAS
+
+
+def test_schema_catalog_starts_from_snapshot(tmp_path, monkeypatch):
+    calls = fake_upstream(monkeypatch)
+    snapshot_path = tmp_path / "schema.json"
+    SchemaCatalog(snapshot_path=str(snapshot_path)).refresh()
+    calls.clear()
+
+    catalog = SchemaCatalog(snapshot_path=str(snapshot_path))
+    assert catalog.table_schema("heroes") == SCHEMAS["heroes"]
+    assert calls == []
+
+
+def test_schema_catalog_ignores_other_snapshot_versions(tmp_path, monkeypatch):
+    calls = fake_upstream(monkeypatch)
+    snapshot_path = tmp_path / "schema.json"
+    snapshot_path.write_text(json.dumps({"version": -1, "fetched_at": 0, "tables": {}}))
+
+    assert SchemaCatalog(snapshot_path=str(snapshot_path)).tables() == list(SCHEMAS)
+    assert "tables" in calls
+
+
+def test_schema_catalog_survives_unreachable_upstream(tmp_path, monkeypatch):
+    def fail():
+        raise ConnectionError("unreachable")
+
+    monkeypatch.setattr(schema_catalog, "list_clickhouse_tables", fail)
+    catalog = SchemaCatalog(snapshot_path=str(tmp_path / "schema.json"))
+    assert catalog.schemas() == {}
+    assert catalog.context() == ""
+
+
+def test_schema_catalog_warm_refreshes_stale_snapshot(tmp_path, monkeypatch):
+    calls = fake_upstream(monkeypatch)
+    snapshot_path = tmp_path / "schema.json"
+    snapshot_path.write_text(json.dumps({"version": SchemaCatalog.SNAPSHOT_VERSION, "fetched_at": 0, "tables": {}}))
+    catalog = SchemaCatalog(snapshot_path=str(snapshot_path))
+    catalog.warm()
+    assert sorted(calls) == ["heroes", "items", "tables"]
+    assert json.loads(snapshot_path.read_text())["tables"] == SCHEMAS
+
+    calls.clear()
+    SchemaCatalog(snapshot_path=str(snapshot_path)).warm()
+    assert calls == []
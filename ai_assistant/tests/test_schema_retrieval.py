@@ -0,0 +1,44 @@
+import json
+import time
+
+import pytest
+
+from ai_assistant.schema_catalog import SchemaCatalog
+from ai_assistant.schema_retrieval import SchemaRetriever, tokenize
+
+SCHEMAS = {
+    "match_info": {"match_id": "UInt64", "start_time": "DateTime", "duration_s": "UInt32"},
+    "match_player": {"match_id": "UInt64", "account_id": "UInt32", "hero_id": "UInt32", "kills": "UInt32"},
+    "heroes": {"id": "UInt32", "name": "String"},
+    "items": {"id": "UInt32", "name": "String", "cost": "UInt32", "tier": "UInt8"},
+    "steam_profiles": {"account_id": "UInt32", "personaname": "String", "countrycode": "String"},
+    "leaderboard": {"region": "String", "rank": "UInt32", "account_name": "String"},
+}
+
+
+@pytest.fixture
+def retriever(tmp_path) -> SchemaRetriever:
+    snapshot_path = tmp_path / "schema.json"
+    snapshot_path.write_text(json.dumps({"version": 1, "fetched_at": time.time(), "tables": SCHEMAS}))
+    return SchemaRetriever(SchemaCatalog(snapshot_path=str(snapshot_path)), top_k=1)
+
+
+def test_tokenize_strips_plurals():
+    assert tokenize("Which Items cost the most?") == {"which", "item", "cost", "the", "most"}
+
+
+def test_retrieve_pins_tables_and_ranks_the_rest(retriever):
+    assert retriever.retrieve("What is the most expensive item?") == ["match_info", "match_player", "items"]
+    assert retriever.retrieve("Who leads the leaderboard in Europe?") == ["match_info", "match_player", "leaderboard"]
+    assert retriever.retrieve("hello") == ["match_info", "match_player"]
+
+
+def test_context_lists_other_tables_and_reports_savings(retriever):
+    context = retriever.context("Which item tier costs the most?")
+    assert "## Table: items" in context
+    assert "## Table: heroes" not in context
+    assert "get_table_schemas" in context and "heroes" in context
+    stats = retriever.stats()
+    assert stats["requests"] == 1
+    assert 0 < stats["sent_tokens"] < stats["full_tokens"]
+    assert stats["saved_ratio"] > 0
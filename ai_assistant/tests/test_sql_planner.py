@@ -0,0 +1,75 @@
+import json
+import re
+import time
+
+import pytest
+
+from ai_assistant.schema_catalog import SchemaCatalog
+from ai_assistant.sql_planner import QueryRejected, SqlPlanner
+
+SCHEMAS = {
+    "match_player": {
+        "match_id": "UInt64",
+        "account_id": "UInt32",
+        "hero_id": "UInt32",
+        "kills": "UInt32",
+        "items.item_id": "Array(UInt32)",
+    },
+    "match_info": {"match_id": "UInt64", "start_time": "DateTime", "average_badge_team0": "UInt32"},
+    "heroes": {"id": "UInt32", "name": "String"},
+}
+
+
+@pytest.fixture
+def planner(tmp_path) -> SqlPlanner:
+    snapshot_path = tmp_path / "schema.json"
+    snapshot_path.write_text(json.dumps({"version": 1, "fetched_at": time.time(), "tables": SCHEMAS}))
+    return SqlPlanner(SchemaCatalog(snapshot_path=str(snapshot_path)), max_limit=1000)
+
+
+def test_planner_adds_and_caps_limit(planner):
+    assert planner.plan("SELECT id, name FROM heroes").sql == "SELECT id, name FROM heroes LIMIT 1000"
+    assert planner.plan("SELECT id FROM heroes LIMIT 5000").sql == "SELECT id FROM heroes LIMIT 1000"
+    assert planner.plan("SELECT id FROM heroes LIMIT 5").notes == []
+    assert planner.plan("SELECT 1 UNION ALL SELECT 2").sql.startswith("SELECT * FROM (SELECT 1 UNION ALL SELECT 2)")
+
+
+def test_planner_accepts_filtered_queries(planner):
+    plan = planner.plan(
+        "SELECT hero_id, avg(kills) AS k, arrayMap(x -> x + 1, items.item_id) FROM match_player AS mp "
+        "WHERE mp.match_id IN (SELECT match_id FROM match_info WHERE start_time > now() - INTERVAL 7 DAY) "
+        "GROUP BY hero_id ORDER BY k DESC"
+    )
+    assert plan.tables == {"match_player", "match_info"}
+    assert plan.estimated_rows < planner.max_scan_rows
+
+
+@pytest.mark.parametrize(
+    "sql, message",
+    [
+        ("SELECT FROM WHERE", "Invalid SQL"),
+        ("SELECT 1; SELECT 2", "exactly one SQL statement"),
+        ("DROP TABLE heroes", "Only SELECT"),
+        ("SELECT * FROM glicko", "not available: glicko"),
+        ("SELECT * FROM match_infos", "did you mean match_info?"),
+        ("SELECT mp.kils FROM match_player AS mp WHERE match_id = 1", "mp.kils (did you mean mp.kills?)"),
+        ('SELECT id FROM heroes WHERE name = "Haze"', "single quotes"),
+        ("SELECT hero_id, count() FROM match_player GROUP BY hero_id", "match_player: match_id"),
+        ("SELECT * FROM match_player AS mp JOIN match_info AS mi ON mp.match_id = mi.match_id", "would scan"),
+    ],
+)
+def test_planner_rejects(planner, sql, message):
+    with pytest.raises(QueryRejected, match=re.escape(message)):
+        planner.plan(sql)
+    assert planner.stats()["rejected"] == 1
+
+
+def test_planner_lets_limited_scans_stop_early(planner):
+    assert planner.plan("SELECT * FROM match_player LIMIT 10").estimated_rows == 10
+
+
+def test_planner_skips_schema_checks_without_schemas(tmp_path, monkeypatch):
+    catalog = SchemaCatalog(snapshot_path=str(tmp_path / "missing.json"))
+    monkeypatch.setattr(catalog, "refresh", lambda: (_ for _ in ()).throw(OSError("offline")))
+    monkeypatch.setattr(catalog, "_refresh_in_background", lambda: None)
+    assert SqlPlanner(catalog).plan("SELECT whatever FROM new_table").tables == {"new_table"}
@@ -0,0 +1,80 @@
+import base64
+import json
+import zlib
+
+from smolagents import ActionOutput, ActionStep, ChatMessageStreamDelta, FinalAnswerStep, ToolCall
+from smolagents.monitoring import Timing
+
+from ai_assistant.streaming import EventEncoder, ObservationStore, full_payload
+
+CODE = "rows = clickhouse_query(sql)\nprint(rows)"
+OBSERVATIONS = "Execution logs:\n" + "\n".join(f"{{'match_id': {n}, 'hero': 'Haze'}}" for n in range(200))
+
+
+def action_step() -> ActionStep:
+    return ActionStep(
+        step_number=1,
+        timing=Timing(start_time=1.0, end_time=2.25),
+        tool_calls=[ToolCall(name="python_interpreter", arguments=CODE, id="call_1")],
+        model_output=f"Thought: query\n<code>\n{CODE}\n</code>",
+        code_action=CODE,
+        observations=OBSERVATIONS,
+    )
+
+
+def data(event: str) -> str:
+    return event.split("data: ", 1)[1].removesuffix("\n\n")
+
+
+def test_full_protocol_keeps_the_original_format():
+    step = action_step()
+    assert json.loads(data(EventEncoder().step(step))) == json.loads(json.dumps(full_payload(step)))
+    assert json.loads(data(EventEncoder().step(ActionOutput(output=None, is_final_answer=False))))["type"] == (
+        "action_output"
+    )
+
+
+def test_lean_protocol_sends_each_step_once_with_an_observation_preview():
+    store = ObservationStore(max_chars=100)
+    encoder = EventEncoder("lean", observations=store)
+    step = action_step()
+    event = json.loads(data(encoder.step(step)))
+    assert event["model_output"] == step.model_output
+    assert "Calling tools" not in json.dumps(event)
+    assert len(event["observation"]) < 200
+    assert store.get(event["observation_id"]) == OBSERVATIONS
+    assert event["duration"] == 1.25
+    assert encoder.step(ActionOutput(output="95", is_final_answer=True)) is None
+    assert json.loads(data(encoder.step(FinalAnswerStep(output="95")))) == {"type": "final_answer", "data": "95"}
+    assert len(encoder.step(action_step())) < len(EventEncoder().step(action_step())) / 3
+
+
+def test_observation_store_shares_observations_between_workers(tmp_path):
+    path = str(tmp_path / "observations.sqlite3")
+    _, observation_id = ObservationStore(max_chars=100, use_redis=False, path=path).preview(OBSERVATIONS)
+    other = ObservationStore(max_chars=100, use_redis=False, path=path)
+    assert other.get(observation_id) == OBSERVATIONS
+    assert other.get("missing") is None
+    assert ObservationStore(max_chars=100, use_redis=False).get(observation_id) is None
+
+
+def test_lean_protocol_does_not_repeat_streamed_model_output():
+    encoder = EventEncoder("lean")
+    assert json.loads(data(encoder.step(ChatMessageStreamDelta(content="Thought")))) == {
+        "type": "delta",
+        "content": "Thought",
+    }
+    event = json.loads(data(encoder.step(action_step())))
+    assert event["streamed"] is True
+    assert "model_output" not in event
+    assert "model_output" in json.loads(data(encoder.step(action_step())))
+
+
+def test_deflate_encoding_shares_one_stream_per_response():
+    encoder = EventEncoder("full", "deflate")
+    events = [encoder.step(action_step()) for _ in range(3)]
+    decompressor = zlib.decompressobj(wbits=-zlib.MAX_WBITS)
+    decoded = [json.loads(decompressor.decompress(base64.b64decode(data(event)))) for event in events]
+    assert decoded == [json.loads(json.dumps(full_payload(action_step())))] * 3
+    # Repeated steps compress to a fraction of the first one.
+    assert len(events[2]) < len(events[0]) / 5
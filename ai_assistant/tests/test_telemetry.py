@@ -0,0 +1,50 @@
+import pytest
+from smolagents import tool
+
+from ai_assistant.telemetry import Counter, Histogram, MetricsRegistry, span, traced_tool, tracing
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.register(Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0)))
+    counter = registry.register(Counter("errors_total", "Errors."))
+    histogram.observe(0.05, span="llm")
+    histogram.observe(0.5, span="llm")
+    counter.inc(status='a"b')
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{span="llm",le="0.1"} 1.0' in lines
+    assert 'latency_seconds_bucket{span="llm",le="1.0"} 2.0' in lines
+    assert 'latency_seconds_bucket{span="llm",le="+Inf"} 2.0' in lines
+    assert 'latency_seconds_count{span="llm"} 2.0' in lines
+    assert 'errors_total{status="a\\"b"} 1.0' in lines
+
+
+def test_spans_are_recorded_in_the_current_trace():
+    with span("outside"):
+        pass
+    with tracing() as trace:
+        with span("phase", kind="test") as attributes:
+            attributes["rows"] = 3
+        with pytest.raises(ValueError), span("failing"):
+            raise ValueError
+    spans = trace.to_dict()["spans"]
+    assert [s["name"] for s in spans] == ["phase", "failing"]
+    assert spans[0]["kind"] == "test" and spans[0]["rows"] == 3
+    assert spans[1]["error"] == "ValueError"
+
+
+def test_traced_tool_records_a_span():
+    @tool
+    def double(value: int) -> int:
+        """
+        Doubles a value.
+
+        Args:
+            value: The value to double.
+        """
+        return value * 2
+
+    traced = traced_tool(double)
+    with tracing() as trace:
+        assert traced(value=2) == 4
+    assert trace.to_dict()["spans"][0]["name"] == "tool.double"
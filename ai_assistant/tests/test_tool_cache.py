@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+from smolagents import tool
+
+from ai_assistant.tool_cache import ToolCache
+
+
+def test_memoize_caches_results_per_key():
+    cache = ToolCache(use_redis=False)
+    calls = []
+
+    @tool
+    @cache.memoize(ttl=60, key=str.lower)
+    def lookup(name: str) -> int:
+        """
+        Test tool.
+
+        Args:
+            name: The name.
+        """
+        calls.append(name)
+        return len(calls)
+
+    assert lookup.inputs == {"name": {"type": "string", "description": "The name."}}
+    assert lookup("Haze") == 1
+    assert lookup(name="haze") == 1
+    assert lookup("Wraith") == 2
+    assert calls == ["Haze", "Wraith"]
+    assert cache.stats()["hit"] == 1
+
+
+def test_memoize_caches_negative_results_but_not_failures():
+    cache = ToolCache(use_redis=False)
+    calls = []
+
+    @cache.memoize(ttl=60, negative_ttl=60)
+    def search(name: str) -> int:
+        calls.append(name)
+        if name == "down":
+            raise ConnectionError("unreachable")
+        raise ValueError(f"{name} not found")
+
+    for _ in range(2):
+        with pytest.raises(ValueError, match="nobody not found"):
+            search("nobody")
+        with pytest.raises(ConnectionError):
+            search("down")
+    assert calls == ["nobody", "down", "down"]
+    assert cache.stats()["negative_hit"] == 1
+
+
+def test_memoize_serves_stale_results_while_refreshing():
+    cache = ToolCache(use_redis=False)
+    refreshed = threading.Event()
+    calls = []
+
+    @cache.memoize(ttl=0.05, stale_ttl=60)
+    def profile(name: str) -> int:
+        calls.append(name)
+        if len(calls) > 1:
+            refreshed.set()
+        return len(calls)
+
+    assert profile("Haze") == 1
+    time.sleep(0.1)
+    assert profile("Haze") == 1
+    assert refreshed.wait(timeout=1)
+    for _ in range(100):
+        if profile("Haze") == 2:
+            break
+        time.sleep(0.01)
+    assert profile("Haze") == 2
+    assert cache.stats()["stale"] >= 1
+
+
+def test_memoize_returns_copies():
+    cache = ToolCache(use_redis=False)
+
+    @cache.memoize(ttl=60)
+    def players() -> dict:
+        return {"Haze": 1}
+
+    players()["Wraith"] = 2
+    assert players() == {"Haze": 1}
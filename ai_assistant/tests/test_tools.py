@@ -1,9 +1,17 @@
+import pytest
+
+from ai_assistant import tools
+from ai_assistant.aggregates import AggregateStore
+from ai_assistant.entities import EntityIndex
 from ai_assistant.tools import (
     hero_name_to_id,
     search_steam_profile,
     item_name_to_id,
     rank_to_badge,
     clickhouse_query,
+    clickhouse_query_many,
+    search_steam_profiles,
+    win_rates,
 )
 
 
@@ -28,3 +36,48 @@ def test_search_steam_profile():
 
 def test_clickhouse_query():
     assert clickhouse_query("SELECT 1") == [{"1": 1}]
+
+
+def test_search_steam_profile_caches_raw_queries(monkeypatch):
+    queries = []
+
+    def get_json(url, params):
+        queries.append(params["search_query"])
+        return [{"account_id": len(queries)}]
+
+    monkeypatch.setattr(tools.UPSTREAM, "get_json", get_json)
+    assert search_steam_profile("[A]Bob-cache-test") == 1
+    assert search_steam_profile("A Bob-cache-test") == 2
+    assert search_steam_profile(" [A]Bob-cache-test ") == 1
+    assert queries == ["[A]Bob-cache-test", "A Bob-cache-test"]
+
+
+def test_search_steam_profiles():
+    assert search_steam_profiles(["johnpyp"]) == {"johnpyp": 127331261}
+
+
+def test_search_steam_profiles_reports_failures_separately(monkeypatch):
+    def get_json(url, params):
+        if params["search_query"] == "offline-player":
+            raise ConnectionError("upstream unreachable")
+        return []
+
+    monkeypatch.setattr(tools.UPSTREAM, "get_json", get_json)
+    assert search_steam_profiles(["missing-player"]) == {"missing-player": "Player not found"}
+    with pytest.raises(Exception, match="offline-player: upstream unreachable"):
+        search_steam_profiles(["missing-player", "offline-player"])
+
+
+def test_clickhouse_query_many():
+    assert clickhouse_query_many(["SELECT 1", "SELECT 2"]) == [[{"1": 1}], [{"2": 2}]]
+
+
+def test_win_rates_rejects_unknown_names(tmp_path, monkeypatch):
+    rows = [{"hero_id": 7, "item_id": 7, "day": 20000, "badge": 100, "matches": 10, "wins": 6}]
+    store = AggregateStore(directory=str(tmp_path), loader=lambda sql: rows, enabled=False)
+    store.refresh()
+    monkeypatch.setattr(tools, "AGGREGATES", store)
+    monkeypatch.setattr(tools, "ENTITY_INDEX", EntityIndex(loader=lambda: {"hero": [(7, "Wraith"), (13, "Haze")]}))
+    assert win_rates("hero", ["Wrath"])[0] == {"id": 7, "name": "Wraith", "matches": 10, "wins": 6, "win_rate": 0.6}
+    with pytest.raises(ValueError, match="Wrth"):
+        win_rates("hero", ["Wraith", "Wrth"])
@@ -0,0 +1,110 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from ai_assistant.upstream import CircuitBreaker, CircuitOpenError, UpstreamClient, UpstreamError
+
+
+def client_for(handler, retries: int = 2) -> UpstreamClient:
+    client = UpstreamClient(retries=retries, transport=httpx.MockTransport(handler))
+    client.BACKOFF = 0
+    return client
+
+
+def test_upstream_client_returns_json():
+    client = client_for(lambda request: httpx.Response(200, json={"query": request.url.params["query"]}))
+    assert client.get_json("https://api.example.com/v1/sql", params={"query": "SELECT 1"}) == {"query": "SELECT 1"}
+
+
+def test_upstream_client_retries_transient_errors():
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        if len(attempts) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, json=[1])
+
+    assert client_for(handler).get_json("https://api.example.com/v1/sql") == [1]
+    assert len(attempts) == 3
+
+
+def test_upstream_client_does_not_retry_client_errors():
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        return httpx.Response(400, text="Syntax error")
+
+    with pytest.raises(UpstreamError, match="Syntax error"):
+        client_for(handler).get_json("https://api.example.com/v1/sql")
+    assert len(attempts) == 1
+
+
+def test_upstream_client_opens_circuit():
+    def handler(request):
+        raise httpx.ConnectError("unreachable")
+
+    client = client_for(handler, retries=0)
+    for _ in range(CircuitBreaker().failure_threshold):
+        with pytest.raises(UpstreamError):
+            client.get("https://api.example.com/v1/sql")
+    with pytest.raises(CircuitOpenError):
+        client.get("https://api.example.com/v1/sql")
+
+
+def test_circuit_breaker_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.opened_at is not None
+    breaker.record_success()
+    assert breaker.allow()
+
+
+def test_circuit_breaker_half_open_admits_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    barrier = threading.Barrier(16)
+
+    def allow():
+        barrier.wait()
+        return breaker.allow()
+
+    for recover in (False, True):
+        breaker.record_failure()
+        time.sleep(0.06)
+        with ThreadPoolExecutor(16) as pool:
+            assert sum(pool.map(lambda _: allow(), range(16))) == 1
+        if recover:
+            breaker.record_success()
+            assert all(breaker.allow() for _ in range(16))
+        else:
+            # A failed probe re-opens the circuit for another timeout.
+            breaker.record_failure()
+            assert not breaker.allow()
+            breaker.record_success()
+
+
+def test_upstream_client_per_endpoint_timeouts():
+    client = client_for(lambda request: httpx.Response(200))
+    assert client.timeout_for("https://api.example.com/v1/sql?query=1") == UpstreamClient.TIMEOUTS["/v1/sql"]
+    assert client.timeout_for("https://api.example.com/v1/sql/tables") == UpstreamClient.TIMEOUTS["/v1/sql/tables"]
+    assert client.timeout_for("https://assets.example.com/v2/ranks") == UpstreamClient.DEFAULT_TIMEOUT
+
+
+def test_upstream_client_streams_body():
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        if len(attempts) < 2:
+            return httpx.Response(502)
+        return httpx.Response(200, content=iter([b'[{"a": 1},', b' {"a": 2}]']))
+
+    with client_for(handler).stream("https://api.example.com/v1/sql") as response:
+        assert b"".join(response.iter_bytes()) == b'[{"a": 1}, {"a": 2}]'
+    assert len(attempts) == 2
@@ -0,0 +1,179 @@
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, ClassVar, NamedTuple
+
+import redis
+
+from ai_assistant.cache import MISSING, SingleFlight, TTLCache
+from ai_assistant.message_store import RedisMessageStore
+from ai_assistant.telemetry import METRICS, Counter
+
+LOGGER = logging.getLogger(__name__)
+
+TOOL_CACHE_LOOKUPS = METRICS.register(
+    Counter("ai_assistant_tool_cache_lookups_total", "Memoized tool calls by tool and outcome.")
+)
+
+
+class CachedCall(NamedTuple):
+    value: Any
+    error: str | None
+    fresh_until: float
+
+
+class ToolCache:
+    """
+    Memoizes tools whose results rarely change, with an in-process LRU tier and an optional shared Redis tier.
+
+    Results are fresh for the TTL of their tool. Errors of the `negative` types, like a player that was not found, are
+    cached for the shorter negative TTL and raised again; other errors, like an unreachable API, are never cached.
+    Within `stale_ttl` after a result turned stale it is still returned, while one background call refreshes it.
+    """
+
+    MAX_ENTRIES: ClassVar[int] = int(os.environ.get("TOOL_CACHE_MAX_ENTRIES", 4096))
+    NEGATIVE_TTL: ClassVar[int] = int(os.environ.get("TOOL_CACHE_NEGATIVE_TTL", 10 * 60))
+    ENABLED: ClassVar[bool] = os.environ.get("TOOL_CACHE", "true").lower() in ("true", "1", "yes")
+    REDIS_PREFIX: ClassVar[str] = "tool-cache:"
+
+    def __init__(self, max_entries: int | None = None, use_redis: bool | None = None, enabled: bool | None = None):
+        self.local = TTLCache(max_entries=max_entries or self.MAX_ENTRIES)
+        self.single_flight = SingleFlight()
+        self.enabled = self.ENABLED if enabled is None else enabled
+        if use_redis is None:
+            use_redis = "REDIS_HOST" in os.environ
+        self.redis = (
+            redis.Redis(host=RedisMessageStore.HOST, port=RedisMessageStore.PORT, password=RedisMessageStore.PASS)
+            if use_redis
+            else None
+        )
+        self.refreshes = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tool-cache")
+        self.refreshing: set[str] = set()
+        self.counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def memoize(
+        self,
+        ttl: float,
+        negative_ttl: float | None = None,
+        stale_ttl: float = 0,
+        negative: tuple[type[Exception], ...] = (ValueError,),
+        key: Callable[..., Any] | None = None,
+    ) -> Callable[[Callable], Callable]:
+        """
+        Decorates a tool function, below `@tool`. `key` maps the arguments to the part of them that identifies the
+        result, by default all of them.
+        """
+        negative_ttl = self.NEGATIVE_TTL if negative_ttl is None else negative_ttl
+
+        def decorator(fn: Callable) -> Callable:
+            signature = inspect.signature(fn)
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                identity = key(*bound.args, **bound.kwargs) if key else bound.arguments
+                cache_key = hashlib.sha256(f"{fn.__name__}\n{json.dumps(identity, default=str)}".encode()).hexdigest()
+
+                def call() -> CachedCall:
+                    try:
+                        return CachedCall(fn(*args, **kwargs), None, time.time() + ttl)
+                    except negative as e:
+                        return CachedCall(None, str(e), time.time() + negative_ttl)
+
+                def load() -> CachedCall:
+                    self._count(fn.__name__, "miss")
+                    cached = call()
+                    self._store(cache_key, cached, stale_ttl)
+                    return cached
+
+                cached = self._get(cache_key, fn.__name__)
+                if cached is MISSING:
+                    cached = self.single_flight.do(cache_key, load)
+                elif cached.fresh_until <= time.time():
+                    self._count(fn.__name__, "stale")
+                    self._refresh(cache_key, call, stale_ttl)
+                else:
+                    self._count(fn.__name__, "negative_hit" if cached.error is not None else "hit")
+                if cached.error is not None:
+                    raise negative[0](cached.error)
+                return copy.deepcopy(cached.value)
+
+            return wrapper
+
+        return decorator
+
+    def _get(self, key: str, name: str) -> CachedCall | object:
+        if (cached := self.local.get(key, MISSING)) is not MISSING:
+            return cached
+        if (cached := self._redis_get(key)) is not MISSING:
+            self._count(name, "redis_hit")
+            # The remaining stale window is unknown here, a stale entry is refreshed right away.
+            self.local.set(key, cached, ttl=max(cached.fresh_until - time.time(), 1))
+        return cached
+
+    def _store(self, key: str, cached: CachedCall, stale_ttl: float) -> None:
+        ttl = cached.fresh_until - time.time() + (stale_ttl if cached.error is None else 0)
+        self.local.set(key, cached, ttl=ttl)
+        self._redis_set(key, cached, ttl)
+
+    def _refresh(self, key: str, call: Callable[[], CachedCall], stale_ttl: float) -> None:
+        with self._lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def refresh() -> None:
+            try:
+                self._store(key, call(), stale_ttl)
+            except Exception as e:
+                LOGGER.warning(f"Failed to refresh stale tool result, keeping it: {e}")
+            finally:
+                with self._lock:
+                    self.refreshing.discard(key)
+
+        self.refreshes.submit(refresh)
+
+    def _count(self, name: str, outcome: str) -> None:
+        TOOL_CACHE_LOOKUPS.inc(tool=name, outcome=outcome)
+        with self._lock:
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            counts = dict(self.counts)
+        return {**self.local.stats(), **counts, "deduplicated": self.single_flight.shared}
+
+    def clear(self) -> None:
+        self.local.clear()
+
+    def _redis_get(self, key: str) -> CachedCall | object:
+        if self.redis is None:
+            return MISSING
+        try:
+            if (value := self.redis.get(self.REDIS_PREFIX + key)) is not None:
+                return CachedCall(*json.loads(value))
+        except (redis.RedisError, ValueError, TypeError) as e:
+            LOGGER.warning(f"Failed to read tool cache entry from Redis: {e}")
+        return MISSING
+
+    def _redis_set(self, key: str, cached: CachedCall, ttl: float) -> None:
+        if self.redis is None or ttl <= 0:
+            return
+        try:
+            self.redis.set(self.REDIS_PREFIX + key, json.dumps(cached), ex=max(int(ttl), 1))
+        except (redis.RedisError, TypeError) as e:
+            LOGGER.warning(f"Failed to write tool cache entry to Redis: {e}")
+
+
+TOOL_CACHE = ToolCache()
@@ -1,10 +1,24 @@
-import Levenshtein
-import requests
-import sqlglot
+import datetime
+import time
+
 from smolagents import tool
 
+from ai_assistant.aggregates import AGGREGATES
+from ai_assistant.configs import SCHEMA_CATALOG
+from ai_assistant.entities import ENTITY_INDEX
+from ai_assistant.executor import run_concurrently
+from ai_assistant.query_cache import QUERY_CACHE
+from ai_assistant.recordings import recorded_tool
+from ai_assistant.results import QueryResult
+from ai_assistant.sql_planner import SQL_PLANNER
+from ai_assistant.telemetry import traced_tool
+from ai_assistant.tool_cache import TOOL_CACHE
+from ai_assistant.upstream import API_URL, UPSTREAM
+from ai_assistant.utils import format_schema
+
 
 @tool
+@TOOL_CACHE.memoize(ttl=24 * 60 * 60, stale_ttl=7 * 24 * 60 * 60, key=str.strip)
 def search_steam_profile(name_or_id: str) -> int:
     """
     Retrieve the account id of a player by name or account id.
@@ -16,13 +30,38 @@ def search_steam_profile(name_or_id: str) -> int:
         int: Account ID
     """
     try:
-        return requests.get(f"https://api.deadlock-api.com/v1/players/steam-search?search_query={name_or_id}").json()[
-            0
-        ]["account_id"]
+        return UPSTREAM.get_json(f"{API_URL}/v1/players/steam-search", params={"search_query": name_or_id})[0][
+            "account_id"
+        ]
     except (KeyError, IndexError):
         raise ValueError(f"Player with name or ID '{name_or_id}' not found.")
 
 
+@tool
+def search_steam_profiles(names_or_ids: list[str]) -> dict[str, int | str]:
+    """
+    Retrieve the account ids of several players at once, the searches run concurrently.
+
+    Args:
+        names_or_ids: The names or account ids of the players.
+
+    Returns:
+        dict[str, int | str]: Mapping of name or id -> Account ID or "Player not found"
+    """
+    futures = run_concurrently(search_steam_profile, names_or_ids)
+    failed = [
+        f"{name}: {future.exception()}"
+        for name, future in zip(names_or_ids, futures)
+        if future.exception() and not isinstance(future.exception(), ValueError)
+    ]
+    if failed:
+        raise Exception("Some searches failed, the successful ones are cached:\n" + "\n".join(failed))
+    return {
+        name: "Player not found" if future.exception() else future.result()
+        for name, future in zip(names_or_ids, futures)
+    }
+
+
 @tool
 def rank_to_badge(rank_name: str, rank_tier: int | None = 0) -> int | str:
     """
@@ -33,11 +72,11 @@ def rank_to_badge(rank_name: str, rank_tier: int | None = 0) -> int | str:
         rank_tier: Optional subrank, for example: 4
 
     Returns:
-        int | str: Hero ID or "Item not found"
+        int | str: Badge index or "Rank not found"
     """
-    ranks = requests.get("https://assets.deadlock-api.com/v2/ranks").json()
-    closest_rank = min(ranks, key=lambda rank: Levenshtein.distance(rank["name"].lower(), rank_name))
-    return closest_rank["tier"] * 10 + rank_tier
+    if closest_rank := ENTITY_INDEX.best("rank", rank_name):
+        return closest_rank.id * 10 + (rank_tier or 0)
+    return "Rank not found"
 
 
 @tool
@@ -51,17 +90,9 @@ def hero_name_to_id(hero_name: str) -> int | str:
     Returns:
         int | str: Hero ID or "Item not found"
     """
-    sql = f"""
-    SELECT id
-    FROM heroes
-    WHERE editDistanceUTF8(lower('{hero_name}'), lower(name)) < 2
-    ORDER BY editDistanceUTF8(lower('{hero_name}'), lower(name))
-    LIMIT 1
-    """
-    try:
-        return requests.get("https://api.deadlock-api.com/v1/sql", params={"query": sql}).json()[0]["id"]
-    except (KeyError, IndexError):
-        return "Hero not found"
+    if hero := ENTITY_INDEX.best("hero", hero_name, max_distance=1):
+        return hero.id
+    return "Hero not found"
 
 
 @tool
@@ -75,42 +106,173 @@ def item_name_to_id(item_name: str) -> int | str:
     Returns:
         int | str: Item ID or "Item not found"
     """
-    sql = f"""
-    SELECT id
-    FROM items
-    WHERE editDistanceUTF8(lower('{item_name}'), lower(name)) < 7
-    ORDER BY editDistanceUTF8(lower('{item_name}'), lower(name))
-    LIMIT 1
+    if item := ENTITY_INDEX.best("item", item_name, max_distance=6):
+        return item.id
+    return "Item not found"
+
+
+@tool
+def lookup_entities(kind: str, names: list[str]) -> dict[str, list[dict]]:
     """
-    try:
-        return requests.get("https://api.deadlock-api.com/v1/sql", params={"query": sql}).json()[0]["id"]
-    except (KeyError, IndexError):
-        return "Item not found"
+    Resolve several hero, item or rank names at once. Returns the closest candidates for every name, best first.
+    Rank candidates use the rank tier as id, multiply it by 10 and add the subrank to get the badge.
+
+    Args:
+        kind: The kind of the names, one of: hero, item, rank
+        names: The names to resolve, for example: ["Haze", "Wraith"]
+
+    Returns:
+        dict[str, list[dict]]: Mapping of name -> list of candidates with keys id, name and score (0 to 1)
+    """
+    return {
+        name: [{"id": m.id, "name": m.name, "score": m.score} for m in matches]
+        for name, matches in ENTITY_INDEX.lookup_many(kind, names, limit=3).items()
+    }
+
+
+@tool
+def get_table_schemas(tables: list[str]) -> str:
+    """
+    Retrieve the columns of Clickhouse tables that are only listed by name in the instructions.
+
+    Args:
+        tables: The table names, for example: ["match_info", "match_player"]
+
+    Returns:
+        str: The schema of every table
+    """
+    schemas = SCHEMA_CATALOG.schemas()
+    return "\n\n".join(
+        format_schema(table, schemas[table])
+        if table in schemas
+        else f"## Table: {table}\nUnknown table, available tables: {', '.join(schemas)}"
+        for table in tables
+    )
+
+
+@tool
+def win_rates(
+    kind: str,
+    names: list[str] | None = None,
+    min_badge: int | None = None,
+    max_badge: int | None = None,
+    days: int | None = None,
+    by: str | None = None,
+) -> QueryResult:
+    """
+    Win rates and match counts of heroes or items over the last 30 days from precomputed aggregates, answered
+    instantly without a database query. Prefer it over clickhouse_query for plain hero or item win rates, pick rates
+    and trends. Badges are the average badge of both teams, use rank_to_badge to get them.
+    Results are sorted by matches, `result[i]` is the i-th row as dict, `result["column"]` a whole column.
+
+    Args:
+        kind: One of: hero, item
+        names: Optional hero or item names to filter on, for example: ["Haze", "Wraith"], all of them if not given
+        min_badge: Optional lowest average badge to include, for example: 100
+        max_badge: Optional highest average badge to include, for example: 116
+        days: Optional number of most recent days to include, at most 30
+        by: Optional breakdown of every hero or item, one of: day, badge
+
+    Returns:
+        QueryResult: Rows with id, name, day or badge if requested, matches, wins and win_rate (0 to 1)
+    """
+    if kind not in AGGREGATES.definitions:
+        raise ValueError(f"Unknown kind '{kind}', expected one of {tuple(AGGREGATES.definitions)}")
+    if by not in (None, "day", "badge"):
+        raise ValueError(f"Unknown breakdown '{by}', expected day or badge")
+    if (table := AGGREGATES.table(kind)) is None:
+        raise Exception("Win rate aggregates are not available yet, use clickhouse_query instead.")
+    ids = None
+    if names:
+        # Same tolerance as hero_name_to_id and item_name_to_id.
+        max_distance = 1 if kind == "hero" else 6
+        matches = {name: ENTITY_INDEX.best(kind, name, max_distance=max_distance) for name in names}
+        if unknown := [name for name, match in matches.items() if match is None]:
+            raise ValueError(f"Unknown {kind} names: {unknown}, use lookup_entities to find the right ones.")
+        ids = [match.id for match in matches.values()]
+    today = int(time.time() // (24 * 60 * 60))
+    totals = table.totals(
+        keys=ids,
+        min_badge=min_badge or 0,
+        max_badge=255 if max_badge is None else max_badge,
+        since_day=today - days + 1 if days else 0,
+        by=by,
+    )
+    if not totals:
+        raise Exception("No matches found for these filters!")
+    rows = []
+    for (entity_id, group), (matches, wins) in sorted(totals.items(), key=lambda t: -t[1][0]):
+        row = {"id": entity_id, "name": ENTITY_INDEX.name_of(kind, entity_id)}
+        if by == "day":
+            row["day"] = (datetime.date(1970, 1, 1) + datetime.timedelta(days=group)).isoformat()
+        elif by == "badge":
+            row["badge"] = group
+        rows.append({**row, "matches": matches, "wins": wins, "win_rate": round(wins / matches, 4)})
+    return QueryResult.from_rows(rows)
 
 
 @tool
-def clickhouse_query(sql: str) -> list[dict]:
+def clickhouse_query(sql: str) -> QueryResult:
     """
-    Query the Clickhouse DB containing data about deadlock using a SQL query. Results in a list of dict with entries column_name -> value
-    You can at most query 100k rows at a time, so be careful with your queries and try to aggregate the data in SQL.
+    Query the Clickhouse DB containing data about deadlock using a SQL query. Results in a columnar QueryResult,
+    `result[i]` is the i-th row as dict column_name -> value, `result["column"]` a whole column, iterating yields rows.
+    Printing it only shows the first rows. At most 100k rows are kept, so try to aggregate the data in SQL.
+    Queries are checked before they run: unknown tables or columns and scans of large tables without a filter on their
+    key columns are rejected with an explanation, and a LIMIT is added when missing.
 
     Args:
         sql: The query to perform. This should be correct Clickhouse SQL.
 
     Returns:
-        list[dict[str, Any]]: Query Result
+        QueryResult: Query Result
     """
-    sql = sqlglot.transpile(sql, write="clickhouse")[0]
-    results = requests.get("https://api.deadlock-api.com/v1/sql", params={"query": sql}).json()
+    results = _run_query(sql)
     if len(results) == 0:
         raise Exception("No results found!")
     return results
 
 
+@tool
+def clickhouse_query_many(sqls: list[str]) -> list[QueryResult]:
+    """
+    Run several independent Clickhouse SQL queries concurrently, for example one per hero or player you compare.
+    This is much faster than calling clickhouse_query for each of them one after the other.
+    Results are in the same order as the queries, queries without results return an empty QueryResult.
+
+    Args:
+        sqls: The queries to perform. These should be correct Clickhouse SQL.
+
+    Returns:
+        list[QueryResult]: Query Results
+    """
+    futures = run_concurrently(_run_query, sqls)
+    if errors := [f"Query {i}: {future.exception()}" for i, future in enumerate(futures) if future.exception()]:
+        raise Exception("Some queries failed, the successful ones are cached:\n" + "\n".join(errors))
+    return [future.result() for future in futures]
+
+
+def _run_query(sql: str) -> QueryResult:
+    plan = SQL_PLANNER.plan(sql)
+    return QUERY_CACHE.get_or_execute(plan.sql, _execute_query)
+
+
+def _execute_query(sql: str) -> QueryResult:
+    with UPSTREAM.stream(f"{API_URL}/v1/sql", params={"query": sql}) as response:
+        return QueryResult.from_json_chunks(response.iter_bytes())
+
+
 ALL_TOOLS = [
-    hero_name_to_id,
-    item_name_to_id,
-    rank_to_badge,
-    search_steam_profile,
-    clickhouse_query,
+    traced_tool(recorded_tool(t))
+    for t in [
+        hero_name_to_id,
+        item_name_to_id,
+        lookup_entities,
+        rank_to_badge,
+        search_steam_profile,
+        search_steam_profiles,
+        get_table_schemas,
+        win_rates,
+        clickhouse_query,
+        clickhouse_query_many,
+    ]
 ]
@@ -0,0 +1,209 @@
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, ClassVar, Iterator
+from urllib.parse import urlsplit
+
+import httpx
+
+from ai_assistant.telemetry import METRICS, Counter, span
+
+LOGGER = logging.getLogger(__name__)
+
+API_URL = os.environ.get("DEADLOCK_API_URL", "https://api.deadlock-api.com")
+ASSETS_URL = os.environ.get("DEADLOCK_ASSETS_URL", "https://assets.deadlock-api.com")
+
+UPSTREAM_REQUESTS = METRICS.register(
+    Counter("ai_assistant_upstream_requests_total", "Requests to the Deadlock API by host and status.")
+)
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probe_started_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            # Half-open: a single probe goes through, the others are rejected until it succeeds or fails. A probe that
+            # never reports back, like one that timed out waiting for a connection, frees its slot after the timeout.
+            if self.probe_started_at is not None and now - self.probe_started_at < self.reset_timeout:
+                return False
+            self.probe_started_at = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.probe_started_at is not None or (
+                self.failures >= self.failure_threshold and self.opened_at is None
+            ):
+                self.opened_at = time.monotonic()
+                self.probe_started_at = None
+
+
+class UpstreamClient:
+    """
+    Shared HTTP client for the Deadlock API with connection pooling, HTTP/2 keep-alive, per-endpoint timeouts,
+    bounded concurrency, retries with jittered exponential backoff and a circuit breaker per host.
+    """
+
+    MAX_CONNECTIONS: ClassVar[int] = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", 32))
+    MAX_CONCURRENCY: ClassVar[int] = int(os.environ.get("UPSTREAM_MAX_CONCURRENCY", 16))
+    RETRIES: ClassVar[int] = int(os.environ.get("UPSTREAM_RETRIES", 2))
+    BACKOFF: ClassVar[float] = float(os.environ.get("UPSTREAM_BACKOFF", 0.2))
+    DEFAULT_TIMEOUT: ClassVar[float] = float(os.environ.get("UPSTREAM_TIMEOUT", 10.0))
+    TIMEOUTS: ClassVar[dict[str, float]] = {
+        "/v1/sql/tables": 10.0,
+        "/v1/sql": float(os.environ.get("UPSTREAM_SQL_TIMEOUT", 60.0)),
+    }
+    RETRY_STATUS_CODES: ClassVar[set[int]] = {429, 502, 503, 504}
+
+    def __init__(
+        self,
+        max_connections: int | None = None,
+        max_concurrency: int | None = None,
+        retries: int | None = None,
+        transport: httpx.BaseTransport | None = None,
+    ):
+        max_connections = max_connections or self.MAX_CONNECTIONS
+        self.retries = self.RETRIES if retries is None else retries
+        self.client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=self.DEFAULT_TIMEOUT,
+            transport=transport,
+        )
+        self.max_concurrency = max_concurrency or self.MAX_CONCURRENCY
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._breakers_lock = threading.Lock()
+
+    def timeout_for(self, url: str) -> float:
+        path = urlsplit(url).path
+        for prefix, timeout in self.TIMEOUTS.items():
+            if path.startswith(prefix):
+                return timeout
+        return self.DEFAULT_TIMEOUT
+
+    def breaker_for(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        with self._breakers_lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker()
+            return self._breakers[host]
+
+    def get(self, url: str, params: dict[str, Any] | None = None) -> httpx.Response:
+        with self._request(url, params, stream=False) as response:
+            return response
+
+    def get_json(self, url: str, params: dict[str, Any] | None = None) -> Any:
+        return self.get(url, params).json()
+
+    @contextmanager
+    def stream(self, url: str, params: dict[str, Any] | None = None) -> Iterator[httpx.Response]:
+        """
+        Like `get`, but the body is not read up front, so it can be consumed incrementally with `iter_bytes`.
+
+        Retries only happen before the body is read, the connection is held until the context exits.
+        """
+        with self._request(url, params, stream=True) as response:
+            yield response
+
+    @contextmanager
+    def _request(self, url: str, params: dict[str, Any] | None, stream: bool) -> Iterator[httpx.Response]:
+        host = urlsplit(url).netloc
+        breaker = self.breaker_for(url)
+        if not breaker.allow():
+            UPSTREAM_REQUESTS.inc(host=host, status="circuit_open")
+            raise CircuitOpenError(f"Upstream {host} is unavailable, try again later.")
+
+        timeout = self.timeout_for(url)
+        if not self._semaphore.acquire(timeout=timeout):
+            UPSTREAM_REQUESTS.inc(host=host, status="pool_timeout")
+            raise UpstreamError(f"Timed out waiting for a free upstream connection for {url}")
+        try:
+            with span("upstream", path=urlsplit(url).path) as attributes:
+                try:
+                    response = self._get_with_retries(url, params, timeout, stream)
+                except httpx.TransportError as e:
+                    breaker.record_failure()
+                    UPSTREAM_REQUESTS.inc(host=host, status="transport_error")
+                    raise UpstreamError(f"Request to {url} failed: {e!r}") from e
+                attributes["status"] = response.status_code
+                UPSTREAM_REQUESTS.inc(host=host, status=response.status_code)
+
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                try:
+                    if response.is_error:
+                        response.read()
+                        raise UpstreamError(
+                            f"Request to {url} failed with status {response.status_code}: {response.text}"
+                        )
+                    yield response
+                except httpx.TransportError as e:
+                    breaker.record_failure()
+                    raise UpstreamError(f"Reading the response from {url} failed: {e!r}") from e
+                finally:
+                    response.close()
+        finally:
+            self._semaphore.release()
+
+    def _get_with_retries(
+        self, url: str, params: dict[str, Any] | None, timeout: float, stream: bool = False
+    ) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                request = self.client.build_request("GET", url, params=params, timeout=timeout)
+                response = self.client.send(request, stream=stream)
+            except httpx.TransportError as e:
+                if attempt >= self.retries:
+                    raise
+                LOGGER.warning(f"Request to {url} failed ({e!r}), retrying")
+            else:
+                if attempt >= self.retries or response.status_code not in self.RETRY_STATUS_CODES:
+                    return response
+                response.close()
+                LOGGER.warning(f"Request to {url} returned {response.status_code}, retrying")
+            time.sleep(self.BACKOFF * 2**attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+
+    def close(self) -> None:
+        self.client.close()
+
+
+UPSTREAM = UpstreamClient()
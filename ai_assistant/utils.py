@@ -1,4 +1,4 @@
-import requests
+from ai_assistant.upstream import API_URL, UPSTREAM
 
 EXCLUDED_TABLES = {
     "active_matches",
@@ -27,23 +27,24 @@ EXCLUDED_COLUMN_PREFIXES = {
 
 
 def list_clickhouse_tables() -> list[str]:
-    return [t for t in requests.get("https://api.deadlock-api.com/v1/sql/tables").json() if t not in EXCLUDED_TABLES]
+    return [t for t in UPSTREAM.get_json(f"{API_URL}/v1/sql/tables") if t not in EXCLUDED_TABLES]
 
 
 def schema(table: str) -> dict[str, str]:
-    return {
-        column["name"]: column["type"]
-        for column in requests.get(f"https://api.deadlock-api.com/v1/sql/tables/{table}/schema").json()
-    }
+    return {column["name"]: column["type"] for column in UPSTREAM.get_json(f"{API_URL}/v1/sql/tables/{table}/schema")}
 
 
-def format_table_schema(table: str) -> str:
-    columns = [
+def format_schema(table: str, columns: dict[str, str]) -> str:
+    lines = [
         f"{name}: {type_}"
-        for name, type_ in schema(table).items()
+        for name, type_ in columns.items()
         if not any(name.startswith(prefix) for prefix in EXCLUDED_COLUMN_PREFIXES)
     ]
-    return f"## Table: {table}\n" + "\n".join(columns)
+    return f"## Table: {table}\n" + "\n".join(lines)
+
+
+def format_table_schema(table: str) -> str:
+    return format_schema(table, schema(table))
 
 
 if __name__ == "__main__":